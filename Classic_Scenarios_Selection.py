@@ -23,6 +23,7 @@ PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 
 # 导入地址配置文件
 from utils.load_config import load_config
+from TSRL_interaction.vehicle_communication import flush_message_history
 loc_config = load_config("loc_config.yaml")
 
 # 将日志文件保存到DEBUG_TSRL目录
@@ -199,6 +200,8 @@ def run_model(
         log.error(f"Error during model execution: {str(e)}")
         raise
     finally:
+        # 场景结束时写出全部尚未写入文件的消息历史
+        flush_message_history()
         traci.close()
         log.info(f"{scenario_name} simulation ended")
 
@@ -19,7 +19,7 @@ from enum import Enum
 from add.display import NonBlockingInferenceWindow, NonBlockingVehicleDisplayWindow
 
 # 从vehicle_communication导入核心通信类
-from TSRL_interaction.vehicle_communication import Communicator, CommunicationManager, Message, MessageList, Performative
+from TSRL_interaction.vehicle_communication import Communicator, CommunicationManager, Message, MessageEnvelope, MessageList, Performative
 class VehicleCommunicator(Communicator):
     """车辆通信器，负责车辆间通信"""
     def __init__(self, vehicle_id, vehicle: 'control_Vehicle', communication_manager: CommunicationManager, if_egoCar: bool = False):
@@ -65,6 +65,7 @@ class VehicleCommunicator(Communicator):
         self._save_display_text(full_content)
         # 存储消息到本地消息历史列表
         self.message_history.append_message(message)
+        self._notify_history(message)
         # 将消息真正发送出去
         self.communication_manager.send_message(message)
         # 保存消息历史
@@ -89,18 +90,13 @@ class VehicleCommunicator(Communicator):
         display_content = f"{display_prefix}{content}"
         
         # 存储接收到的原始消息到本地列表
-        # 创建一个新消息对象，记录接收到的消息
-        received_message = Message(
-            sender_id=message.sender_id,
-            sender_category=message.sender_category,
-            Receiver_id=self.id,
-            Receiver_category=self,
-            content=content,
-            performative=message.performative
-        )
+        # 广播的消息由各接收者共享，只为本接收者创建记录接收者的信封
+        received_message = MessageEnvelope(message, self.id, self)
         
         # 添加消息到本地历史
         self.message_history.append_message(received_message)
+        # 通知增量规则触发器和工作记忆，只有规则变为满足时才标记该车辆需要重新决策
+        self._notify_history(received_message)
         
         # 保存显示文本
         self._save_display_text(display_content)
@@ -0,0 +1,195 @@
+"""
+测试通信管理器的消息路由、消息总线、消息历史文件和内存消息历史
+运行：python -m pytest -q TSRL_interaction
+"""
+import os
+import sys
+import time
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from TSRL_interaction.vehicle_communication import (CommunicationManager, Communicator, Message, MessageEnvelope,
+                                                    MessageHistoryWriter, MessageList, Performative,
+                                                    flush_message_history)
+from simModel.common.geohash import geohashID
+
+
+class RecordingCommunicator(Communicator):
+    """记录到达的消息及其到达时的仿真步"""
+    def __init__(self, id: str, communication_manager: CommunicationManager):
+        super().__init__(id, communication_manager)
+        self.received = []
+
+    def receive_message(self, message: Message):
+        self.received.append((self.communication_manager._bus_step, message.content))
+        self.message_history.append_message(message)
+
+
+def message(sender: str, receiver: str, content: str) -> Message:
+    return Message(sender, None, receiver, None, content, Performative.Inform)
+
+
+def bus(latency: int):
+    manager = CommunicationManager("test", history_capacity=4)
+    manager.enable_bus(latency)
+    return manager, RecordingCommunicator("A", manager), RecordingCommunicator("B", manager)
+
+
+def test_message_ids_are_unique_and_stable_once_read():
+    first, second = message("A", "B", "P(1);"), message("A", "B", "P(1);")
+    assert first.message_id != second.message_id
+    assert first.message_id == first.message_id
+    assert first.conversation_id != second.conversation_id
+    second.conversation_id = first.conversation_id  # 回复消息加入已有的会话
+    assert second.conversation_id == first.conversation_id
+    named = Message("A", None, "B", None, "P(1);", Performative.Inform, message_id="m-7")
+    assert named.message_id == "m-7"
+
+
+def test_envelope_reads_the_shared_message():
+    shared = message("A", "ALL", "Congestion(7);")
+    envelope = MessageEnvelope(shared, "B", None)
+    assert (envelope.content, envelope.sender_id, envelope.Receiver_id) == ("Congestion(7);", "A", "B")
+    assert envelope.performative is Performative.Inform
+    assert envelope.message_id == shared.message_id and envelope.timestamp == shared.timestamp
+    with pytest.raises(AttributeError):
+        envelope.missing
+
+
+def test_undeclared_attributes_cannot_be_assigned():
+    shared = message("A", "B", "P(1);")
+    with pytest.raises(AttributeError):
+        shared.priority = 1
+    with pytest.raises(AttributeError):
+        MessageEnvelope(shared, "B", None).priority = 1
+
+
+def test_unicast_without_bus_is_immediate():
+    manager = CommunicationManager("test")
+    RecordingCommunicator("A", manager)
+    b = RecordingCommunicator("B", manager)
+    manager.send_message(message("A", "B", "Stop(A);"))
+    assert [content for _, content in b.received] == ["Stop(A);"]
+
+
+def test_zero_latency_delivers_in_the_same_step():
+    manager, _, b = bus(0)
+    manager.advance(0.0)
+    manager.send_message(message("A", "B", "Before(1);"))
+    assert not b.received
+    assert manager.deliver() == 1
+    manager.send_message(message("A", "B", "After(1);"))
+    manager.advance(0.1)
+    manager.deliver()
+    assert b.received == [(1, "Before(1);"), (2, "After(1);")]
+
+
+def test_latency_counts_steps_from_the_sending_step():
+    manager, _, b = bus(1)
+    manager.advance(0.0)
+    manager.send_message(message("A", "B", "Before(1);"))
+    assert manager.deliver() == 0
+    manager.send_message(message("A", "B", "After(1);"))  # 在deliver()之后发送，同样在下一步送达
+    manager.advance(0.1)
+    assert manager.deliver() == 2
+    assert b.received == [(2, "Before(1);"), (2, "After(1);")]
+    manager.advance(0.2)
+    assert manager.deliver() == 0
+
+
+def test_broadcast_reaches_everyone_but_the_sender():
+    manager = CommunicationManager("test")
+    agents = [RecordingCommunicator(name, manager) for name in ("C", "A", "B")]
+    manager.send_message(message("A", "ALL", "Congestion(7);"))
+    assert [len(agent.received) for agent in agents] == [1, 0, 1]
+
+
+def test_broadcast_respects_communication_radius():
+    manager = CommunicationManager("test", comm_radius=50.0)
+    a, b, c = (RecordingCommunicator(name, manager) for name in ("A", "B", "C"))
+    manager.update_positions({"A": (0.0, 0.0), "B": (30.0, 0.0), "C": (130.0, 0.0)})
+    manager.send_message(message("A", "ALL", "Congestion(7);"))
+    assert len(b.received) == 1 and not c.received
+
+
+def test_broadcast_grid_uses_the_road_network_cells():
+    manager = CommunicationManager("test", comm_radius=50.0)
+    a, b, c, d = (RecordingCommunicator(name, manager) for name in ("A", "B", "C", "D"))
+    positions = {"A": (-10.0, 95.0), "B": (30.0, 120.0), "C": (-55.0, 95.0), "D": (-70.0, 95.0)}
+    manager.update_positions(positions)
+    assert manager.grid == {geohashID(-10.0, 95.0): ["A", "C", "D"], geohashID(30.0, 120.0): ["B"]}
+    assert sorted(manager.agents_in_range(-10.0, 95.0, 50.0)) == ["A", "B", "C"]  # 跨越网格边界
+    manager.send_message(message("A", "ALL", "Congestion(7);"))
+    assert len(b.received) == len(c.received) == 1 and not d.received
+
+
+def test_ring_buffer_keeps_recent_messages_with_arrival_time():
+    manager = CommunicationManager("test", history_capacity=2)
+    RecordingCommunicator("A", manager)
+    b = RecordingCommunicator("B", manager)
+    for step, content in enumerate(["P(1);", "Q(2);", "P(3);"]):
+        manager.advance(float(step))
+        manager.send_message(message("A", "B", content))
+    history = manager.get_message_history("B")
+    assert [m.content for m in history.message_list] == ["P(1);", "Q(2);", "P(3);"]
+    assert history.last_contents(2) == ["Q(2);", "P(3);"]
+    assert history.last_contents(3) is None  # 第一条消息已移出环形缓冲区
+    assert [m.content for m in history.since(2.0)] == ["P(3);"]
+    assert [m.content for m in history.select("P")] == ["P(3);"]
+
+
+def test_message_list_without_capacity_returns_all_contents():
+    history = MessageList()
+    history.append_message(message("A", "B", "P(1);\nQ(2);"))
+    assert history.last_contents() == ["P(1);", "Q(2);"]
+
+
+def test_writer_appends_batches_and_resets_files(tmp_path):
+    writer = MessageHistoryWriter(interval=60.0)
+    path = str(tmp_path / "history" / "message_0_history.txt")
+    try:
+        writer.append(path, ["P(1);"], reset=True)
+        writer.append(path, ["Q(2);", "P(3);"])
+        writer.flush()
+        assert open(path).read() == "P(1);\nQ(2);\nP(3);\n"
+        writer.append(path, ["R(4);"])
+        writer.append(path, ["S(5);"], reset=True)  # 丢弃尚未写入的行并清空文件
+        writer.flush()
+        assert open(path).read() == "S(5);\n"
+    finally:
+        writer.close()
+
+
+def test_writer_background_thread_writes_full_batches(tmp_path):
+    writer = MessageHistoryWriter(max_pending=2, interval=60.0)
+    path = str(tmp_path / "message_0_history.txt")
+    try:
+        writer.append(path, ["P(1);", "P(2);"], reset=True)  # 达到max_pending，不等写入周期
+        content = None
+        for _ in range(200):
+            content = open(path).read() if os.path.exists(path) else None
+            if content == "P(1);\nP(2);\n":
+                break
+            time.sleep(0.01)
+        assert content == "P(1);\nP(2);\n"
+    finally:
+        writer.close()
+
+
+def test_message_list_saves_only_new_messages(tmp_path):
+    history = MessageList()
+    path = tmp_path / "message_B_history.txt"
+    history.append_message(message("A", "B", "P(1);"))
+    history.save_message_list("B", str(tmp_path))
+    history.append_message(message("A", "B", "Q(2);"))
+    history.save_message_list("B", str(tmp_path))
+    flush_message_history()
+    assert path.read_text() == "P(1);\nQ(2);\n"
+    path.write_text("")  # 文件被外部清空后重新写出完整的消息列表
+    history.reset_saved()
+    history.save_message_list("B", str(tmp_path))
+    flush_message_history()
+    assert path.read_text() == "P(1);\nQ(2);\n"
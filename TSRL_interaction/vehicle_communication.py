@@ -7,16 +7,23 @@
 
 # 目标：7.17，写入每辆车的存储库，存储车辆的交流消息
 from __future__ import annotations
+import atexit
 import glob
+import itertools
 import logging
+import math
 import os
+import threading
 import time
-import uuid
-from typing import Dict, List, Optional
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple, Union
 import logger
 from logger import Logger
 from enum import Enum
 from add.display import NonBlockingInferenceWindow, NonBlockingVehicleDisplayWindow
+from simModel.common.geohash import geohashID
+from TSRL_representation.Rule_base import RuleBase, RuleTrigger, message_predicate
+from TSRL_representation.Working_memory import WorkingMemory
 
 # 迁移回vehicle_communication.py的核心通信类
 class Performative(str, Enum):
@@ -31,6 +38,9 @@ class Performative(str, Enum):
     Other = 'None' # 其他
 
 
+_message_sequence = itertools.count(1)  # 消息序号，未指定标识符的消息由序号生成标识符
+
+
 # 9.16 定义语义信息类
 class Message:
     """消息类，封装语义交互信息体内容
@@ -51,7 +61,12 @@ class Message:
     m) Reply-With：响应标识符，表示响应主体将使用该表达式来识别此消息
     n) In-Reply-To：回复标识符，表示该消息为此前较早消息的回复消息
     o) Reply-By：答复最晚时间，表示发送者希望接收者答复的最晚时间
+
+    未指定的消息体标识符和会话标识符在首次读取时由消息序号生成（进程内唯一）
     """
+    __slots__ = ('_sequence', '_message_id', 'sender_id', 'sender_category', 'Receiver_id', 'Receiver_category',
+                 'content', 'performative', 'timestamp', 'reply_to', 'language', 'ontology', 'protocol',
+                 '_conversation_id', 'reply_with', 'in_reply_to', 'reply_by')
     
     def __init__(
         self,
@@ -73,7 +88,8 @@ class Message:
         timestamp: Optional[float] = None# 时间戳
     ):
         # 必需参数
-        self.message_id = message_id or str(uuid.uuid4())  # 消息体标识符
+        self._sequence = next(_message_sequence)  # 消息序号
+        self._message_id = message_id  # 消息体标识符
         self.sender_id = sender_id  # 发送者
         self.sender_category = sender_category  # 发送者类别
         self.Receiver_id = Receiver_id  # 接收者
@@ -87,11 +103,33 @@ class Message:
         self.language = language  # 消息语言
         self.ontology = ontology  # 本体
         self.protocol = protocol  # 通信协议
-        self.conversation_id = conversation_id or str(uuid.uuid4())  # 会话标识符
+        self._conversation_id = conversation_id  # 会话标识符
         self.reply_with = reply_with  # 响应标识符
         self.in_reply_to = in_reply_to  # 回复标识符
         self.reply_by = reply_by  # 答复最晚时间
 
+    @property
+    def message_id(self) -> str:
+        """消息体标识符"""
+        if not self._message_id:
+            self._message_id = f"msg-{self._sequence}"
+        return self._message_id
+
+    @message_id.setter
+    def message_id(self, message_id: str):
+        self._message_id = message_id
+
+    @property
+    def conversation_id(self) -> str:
+        """会话标识符，未指定时每条消息各自开始一个会话"""
+        if not self._conversation_id:
+            self._conversation_id = f"conv-{self._sequence}"
+        return self._conversation_id
+
+    @conversation_id.setter
+    def conversation_id(self, conversation_id: str):
+        self._conversation_id = conversation_id
+
     def __str__(self) -> str:
         """返回消息的字符串表示"""
         return f"Message(id={self.message_id}, sender={self.sender_id}, Receiver={self.Receiver_id}, performative={self.performative}, content={self.content})"
@@ -99,16 +137,172 @@ class Message:
     def __repr__(self) -> str:
         """返回消息的详细表示"""
         return self.__str__()
-        
+
+
+class MessageEnvelope:
+    """
+    接收者保存的消息信封：广播的同一条消息由各接收者共享引用，
+    信封只记录本接收者的ID和类别，其余属性（内容、发送者、述行词、标识符等）从共享的消息读取
+    """
+    __slots__ = ('message', 'Receiver_id', 'Receiver_category')
+
+    def __init__(self, message: Message, Receiver_id: str, Receiver_category: Communicator):
+        self.message = message  # 共享的消息
+        self.Receiver_id = Receiver_id  # 接收者
+        self.Receiver_category = Receiver_category  # 接收者类别
+
+    @property
+    def content(self) -> str:
+        return self.message.content
+
+    @property
+    def sender_id(self) -> str:
+        return self.message.sender_id
+
+    def __getattr__(self, name):
+        # 只有信封中没有的属性才会调用，从共享的消息读取
+        if name == 'message':
+            raise AttributeError(name)
+        return getattr(self.message, name)
+
+    def __str__(self) -> str:
+        """返回消息的字符串表示"""
+        return f"Message(id={self.message_id}, sender={self.sender_id}, Receiver={self.Receiver_id}, performative={self.performative}, content={self.content})"
+
+    def __repr__(self) -> str:
+        """返回消息的详细表示"""
+        return self.__str__()
+
+class MessageHistoryWriter:
+    """
+    消息历史文件的后台批量写入器
+    新消息先进入内存中的待写队列，待写消息数达到max_pending或每隔interval秒由后台线程批量追加到文件中
+    （每个文件每批只打开一次，不保持文件打开）；flush()同步写出全部待写消息，
+    供读取消息历史文件的一方（如决策器）和场景结束时调用
+    """
+    def __init__(self, max_pending: int = 256, interval: float = 0.5):
+        self.max_pending = max_pending  # 待写消息数达到该值时立即唤醒后台线程
+        self.interval = interval  # 后台线程的写入周期 [秒]
+        self._pending: Dict[str, List[str]] = {}  # 文件路径 -> 待追加的行
+        self._truncate = set()  # 写入前需要先清空的文件
+        self._count = 0  # 待写的行数
+        self._lock = threading.Lock()  # 保护待写队列
+        self._io_lock = threading.Lock()  # 保证各批按顺序写入文件
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self.logger = logger.get_logger(__name__)
+
+    def append(self, path: str, lines: List[str], reset: bool = False):
+        """将lines加入path的待写队列；reset为True时丢弃该文件尚未写入的行，写入前先清空文件"""
+        with self._lock:
+            if reset:
+                self._count -= len(self._pending.get(path, ()))
+                self._pending[path] = list(lines)
+                self._truncate.add(path)
+            else:
+                self._pending.setdefault(path, []).extend(lines)
+            self._count += len(lines)
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name="MessageHistoryWriter", daemon=True)
+                self._thread.start()
+            full = self._count >= self.max_pending
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """同步写出全部待写的消息"""
+        with self._io_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                truncate, self._truncate = self._truncate, set()
+                self._count = 0
+            for path, lines in pending.items():
+                try:
+                    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                    with open(path, "w" if path in truncate else "a") as file:
+                        file.write("".join(f"{line}\n" for line in lines))
+                except OSError as e:
+                    self.logger.error(f"Error writing message history {path}: {e}")
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def close(self):
+        """停止后台线程并写出全部待写的消息"""
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+
+_history_writer = MessageHistoryWriter()  # 进程内共享的消息历史写入器
+atexit.register(_history_writer.close)
+
+
+def flush_message_history():
+    """同步写出全部尚未写入文件的消息历史（读取消息历史文件前和场景结束时调用）"""
+    _history_writer.flush()
+
+
 # 定义消息列表
 class MessageList:
-    def __init__(self):
+    """
+    消息列表
+    message_list保存全部消息（写入消息历史文件）；recent为最近capacity条消息的环形缓冲区，
+    记录消息进入列表时的仿真时间，供决策器在内存中查询消息历史
+    """
+    def __init__(self, capacity: Optional[int] = None, clock: Optional[Callable[[], Optional[float]]] = None):
+        """
+        :param capacity: 环形缓冲区容量，None表示不限
+        :param clock: 返回当前仿真时间的函数，不指定时消息的仿真时间为None
+        """
         self.message_list: List[Message] = []
+        self._saved = 0  # 已交给写入器的消息数量，为0时下次保存先清空文件
+        self.clock = clock
+        self.recent: Deque[Tuple[Optional[float], Message]] = deque(maxlen=capacity)  # (仿真时间, 消息)
     
     # 定义方法：将消息添加到列表
     def append_message(self, message: Message):
         """将消息添加到列表"""
         self.message_list.append(message)
+        self.recent.append((self.clock() if self.clock is not None else None, message))
+
+    def last_contents(self, n: Optional[int] = None) -> Optional[List[str]]:
+        """
+        最新n条消息内容（与消息历史文件中最后n个非空行相同，n为None时为全部）；
+        所需的消息已被移出环形缓冲区时返回None，由调用方读取消息历史文件
+        """
+        contents = []
+        for _, message in reversed(self.recent):
+            lines = [line.strip() for line in message.content.split('\n') if line.strip()]
+            contents[:0] = lines
+            if n is not None and n > 0 and len(contents) >= n:
+                return contents[-n:]
+        if len(self.recent) < len(self.message_list):
+            return None
+        return contents
+
+    def since(self, sim_time: float) -> List[Message]:
+        """环形缓冲区中仿真时间不早于sim_time的消息（按到达顺序）"""
+        messages = []
+        for timestamp, message in reversed(self.recent):
+            if timestamp is None or timestamp < sim_time:
+                break
+            messages.append(message)
+        messages.reverse()
+        return messages
+
+    def select(self, predicate: Union[str, Callable[[Message], bool]]) -> List[Message]:
+        """环形缓冲区中满足条件的消息：predicate为TSRL谓词名（如"Congestion"）或以消息为参数的函数"""
+        if isinstance(predicate, str):
+            name = predicate
+            predicate = lambda message: message_predicate(message.content) == name
+        return [message for _, message in self.recent if predicate(message)]
     
     # 定义方法：打印消息列表
     def print_message_list(self):
@@ -118,23 +312,27 @@ class MessageList:
     
     # 定义方法：将当前车辆的消息列表保存到当前文件夹的文本文档中
     def save_message_list(self, vehicle_id: str, loc: str):
-        """将消息列表保存到当前文件夹的文本文档中"""
-        # 确保路径存在
-        os.makedirs(loc, exist_ok=True)
+        """
+        将上次保存之后的新消息追加到消息历史文件（由后台写入器批量写入）；
+        首次保存（或文件被清空后）先清空文件并写出完整的消息列表
+        """
         file_path = os.path.join(loc, f"message_{vehicle_id}_history.txt")
-        with open(file_path, "a") as file:
-            # 9.18 先将当前文件中的消息列表清空
-            file.truncate(0)
-            for msg in self.message_list:
-                # file.write(f"{msg.sender_id} -> {msg.Receiver_id}: {msg.content}\n")
-                file.write(f"{msg.content}\n")
+        contents = [msg.content for msg in self.message_list[self._saved:]]
+        _history_writer.append(file_path, contents, reset=self._saved == 0)
+        self._saved = len(self.message_list)
+
+    def reset_saved(self):
+        """消息历史文件被外部清空或删除后调用，下次保存时重新写出完整的消息列表"""
+        self._saved = 0
 
 class Communicator:
     """基础通信器，作为其他通信器的基类"""
     def __init__(self, id: str, communication_manager: CommunicationManager):
         self.id = id  # 交通主体ID
         self.communication_manager = communication_manager  # 通信管理器
-        self.message_history: MessageList = MessageList()  # 消息历史列表
+        # 消息历史列表，最近的消息同时保存在环形缓冲区中，记录到达时的仿真时间
+        self.message_history: MessageList = MessageList(communication_manager.history_capacity,
+                                                        lambda: communication_manager.sim_time)
         self.logger = logger.get_logger(__name__)  # 日志记录器
         self.Scenario_Name = self.communication_manager.Scenario_Name
         communication_manager.register(self)
@@ -151,19 +349,126 @@ class Communicator:
         """保存消息历史到文件"""
         # 将消息列表在message_history文件夹中的文本文件中打印出来
         self.message_history.save_message_list(self.id, loc=f"message_history/{self.Scenario_Name}")
+
+    def receive_messages(self, messages: List[Message]):
+        """批量处理收件箱中的消息（消息总线模式下每个仿真步投递一次），按到达顺序逐条处理"""
+        for message in messages:
+            self.receive_message(message)
+
+    def _notify_history(self, message: Message):
+        """消息进入消息历史后通知增量规则触发器和工作记忆（未启用时不做任何事）"""
+        trigger = self.communication_manager.get_rule_trigger(self.id)
+        if trigger is not None:
+            trigger.add(message.content)
+        memory = self.communication_manager.get_working_memory(self.id)
+        if memory is not None:
+            memory.add(message.content, self.communication_manager.sim_time)
     
 class CommunicationManager:
     """通信管理器，负责消息路由和分发"""
-    def __init__(self, Scenario_Name: str):
+    def __init__(self, Scenario_Name: str, history_capacity: Optional[int] = 256, comm_radius: Optional[float] = None):
         self.subscribers: Dict[str, Communicator] = {} # 订阅者列表
+        self.comm_radius = comm_radius # 广播的通信半径 [米]，None表示广播给所有通信器
+        self.positions: Dict[str, Tuple[float, float]] = {} # 交通主体ID -> 当前位置
+        self.grid: Dict[Tuple[int, int], List[str]] = {} # geohash网格 -> 网格内的交通主体ID
+        self._located = set() # 曾经更新过位置的交通主体ID
+        self._global_agents = set() # 没有位置的交通主体ID（如环境通信器），接收所有广播
+        self._order: Dict[str, int] = {} # 交通主体ID -> 注册次序，广播按注册次序投递
+        self.bus_enabled = False # 是否启用消息总线：发送的消息先排队，由deliver()在仿真步中统一投递
+        self.bus_latency = 0 # 消息总线的投递延迟 [仿真步]
+        self._bus_step = 0 # 消息总线的当前仿真步，由advance()推进，发送的消息以此为发送时的仿真步
+        self._bus_queue: Deque[Tuple[int, Message]] = deque() # (发送时的仿真步, 消息)，按发送顺序
+        self.history_capacity = history_capacity # 各交通主体内存消息历史（环形缓冲区）的容量
         self.logger = logger.get_logger(__name__)# 日志记录器
         self.message_history: List[Message] = [] # 全局消息历史记录列表
         self.Scenario_Name = Scenario_Name
+        self.rule_base: Optional[RuleBase] = None # 增量规则触发和工作记忆使用的规则库
+        self.rule_window: Optional[int] = None # 增量规则触发的消息窗口大小
+        self.rule_triggers_enabled = False # 是否启用增量规则触发
+        self.rule_triggers: Dict[str, RuleTrigger] = {} # 交通主体ID -> 增量规则触发器
+        self.sim_time: Optional[float] = None # 当前仿真时间，作为到达消息中事实的时间戳
+        self.fact_ttl: Optional[Dict[str, float]] = None # 工作记忆的事实有效期，None表示未启用工作记忆
+        self.working_memories: Dict[str, WorkingMemory] = {} # 交通主体ID -> 工作记忆
 
     def register(self, communicator: Communicator):
         """将通信器注册在通信管理器"""
+        if self.subscribers.get(communicator.id, communicator) is not communicator:
+            # 新的通信器从空的消息历史开始，丢弃旧通信器的增量规则触发器
+            self.rule_triggers.pop(str(communicator.id), None)
         self.subscribers[communicator.id] = communicator
+        self._order.setdefault(communicator.id, len(self._order))
+        if communicator.id not in self._located:
+            self._global_agents.add(communicator.id)
     
+    def enable_rule_triggers(self, rule_base: RuleBase, window: Optional[int] = None):
+        """启用增量规则触发：各交通主体的消息进入消息历史时，只重新检查含有该谓词的规则"""
+        self.rule_base = rule_base
+        self.rule_window = window
+        self.rule_triggers_enabled = True
+        self.rule_triggers = {}
+
+    def get_rule_trigger(self, agent_id) -> Optional[RuleTrigger]:
+        """返回交通主体的增量规则触发器（首次调用时创建）；未启用增量规则触发时返回None"""
+        if not self.rule_triggers_enabled:
+            return None
+        agent_id = str(agent_id)
+        trigger = self.rule_triggers.get(agent_id)
+        if trigger is None:
+            trigger = self.rule_triggers[agent_id] = RuleTrigger(self.rule_base, self.rule_window)
+        return trigger
+
+    def enable_working_memory(self, rule_base: RuleBase, ttl: Dict[str, float]):
+        """启用工作记忆：各交通主体到达的消息带仿真时间戳告知到其工作记忆中，按谓词有效期淘汰"""
+        self.rule_base = rule_base
+        self.fact_ttl = dict(ttl)
+        self.working_memories = {}
+
+    def get_working_memory(self, agent_id) -> Optional[WorkingMemory]:
+        """返回交通主体的工作记忆（首次调用时创建）；未启用工作记忆时返回None"""
+        if self.fact_ttl is None:
+            return None
+        agent_id = str(agent_id)
+        memory = self.working_memories.get(agent_id)
+        if memory is None:
+            memory = self.working_memories[agent_id] = WorkingMemory(self.rule_base, self.fact_ttl)
+        return memory
+
+    def advance(self, sim_time: float):
+        """
+        推进到仿真时间sim_time（每个仿真步开始时调用一次）：之后到达的消息以sim_time为时间戳，
+        消息总线进入下一个仿真步，并批量淘汰各工作记忆中的过期事实，有事实过期的交通主体需要重新决策
+        """
+        self.sim_time = sim_time
+        self._bus_step += 1
+        for agent_id, memory in self.working_memories.items():
+            if memory.expire(sim_time) and agent_id in self.rule_triggers:
+                self.rule_triggers[agent_id].dirty = True
+
+    def get_message_history(self, agent_id) -> Optional[MessageList]:
+        """返回交通主体的消息列表；未注册时返回None"""
+        communicator = self.subscribers.get(agent_id)
+        if communicator is None:
+            communicator = self.subscribers.get(str(agent_id))
+        return communicator.message_history if communicator is not None else None
+
+    def recent_contents(self, agent_id, n: Optional[int] = None) -> Optional[List[str]]:
+        """
+        交通主体最新n条消息的内容（不读取消息历史文件）；
+        未注册或所需的消息已被移出环形缓冲区时返回None
+        """
+        history = self.get_message_history(agent_id)
+        return history.last_contents(n) if history is not None else None
+
+    def messages_since(self, agent_id, sim_time: float) -> List[Message]:
+        """交通主体在仿真时间sim_time及之后收发的消息（环形缓冲区内）"""
+        history = self.get_message_history(agent_id)
+        return history.since(sim_time) if history is not None else []
+
+    def messages_by_predicate(self, agent_id, predicate: Union[str, Callable[[Message], bool]]) -> List[Message]:
+        """交通主体满足条件的消息（环形缓冲区内），predicate为TSRL谓词名或以消息为参数的函数"""
+        history = self.get_message_history(agent_id)
+        return history.select(predicate) if history is not None else []
+
     # def register_vehicle(self, vehicle: VehicleCommunicator):
     #     """将车辆注册在通信管理器"""
     #     self.subscribers[vehicle.vehicle_id] = vehicle
@@ -172,28 +477,112 @@ class CommunicationManager:
     #     """将RSU注册在通信管理器"""
     #     self.subscribers[rsu.rsu_id] = rsu
 
+    def update_positions(self, positions: Dict[str, Tuple[float, float]]):
+        """
+        更新各交通主体的位置并重建geohash网格（每个仿真步调用一次）；
+        不在positions中的交通主体（如已离开场景的车辆）不再接收限定半径的广播
+        """
+        self.positions = dict(positions)
+        self._located.update(self.positions)
+        self._global_agents.difference_update(self.positions)
+        grid = {}
+        for agent_id, (x, y) in self.positions.items():
+            grid.setdefault(geohashID(x, y), []).append(agent_id)
+        self.grid = grid
+
+    def agents_in_range(self, center_x: float, center_y: float, radius: float) -> List[str]:
+        """获取以(center_x, center_y)为圆心、radius为半径的范围内的交通主体ID"""
+        agent_ids = []
+        # 只遍历范围覆盖的geohash网格（与NetworkBuild的路网网格相同）
+        min_gx, min_gy = geohashID(center_x - radius, center_y - radius)
+        max_gx, max_gy = geohashID(center_x + radius, center_y + radius)
+        for gx in range(min_gx, max_gx + 1):
+            for gy in range(min_gy, max_gy + 1):
+                for agent_id in self.grid.get((gx, gy), ()):
+                    x, y = self.positions[agent_id]
+                    if math.hypot(x - center_x, y - center_y) <= radius:
+                        agent_ids.append(agent_id)
+        return agent_ids
+
+    def _broadcast_receivers(self, sender_id) -> List[Communicator]:
+        """
+        广播的接收者（不含发送者本身，按注册次序）：
+        设置了通信半径且发送者有位置时为半径内的交通主体和没有位置的交通主体，否则为所有通信器
+        """
+        position = self.positions.get(sender_id) if self.comm_radius is not None else None
+        if position is None:
+            return [communicator for communicator_id, communicator in self.subscribers.items()
+                    if communicator_id != sender_id]
+        receiver_ids = set(self.agents_in_range(position[0], position[1], self.comm_radius))
+        receiver_ids |= self._global_agents
+        receiver_ids.discard(sender_id)
+        receiver_ids = sorted((agent_id for agent_id in receiver_ids if agent_id in self.subscribers),
+                              key=self._order.__getitem__)
+        return [self.subscribers[agent_id] for agent_id in receiver_ids]
+
+    def _receivers(self, message: Message) -> List[Communicator]:
+        """消息的接收者：按接收者ID直接查找（不检查类别），没有找到特定接收者时广播给通信半径内的通信器（除了发送者本身）"""
+        receiver = self.subscribers.get(message.Receiver_id)
+        if receiver is not None:
+            return [receiver]
+        return self._broadcast_receivers(message.sender_id)
+
     def send_message(self, message: Message):
-        """发送消息并路由到接收者"""
+        """发送消息并路由到接收者（启用消息总线时只加入队列，由deliver()投递）"""
         # 记录消息到日志
         self.logger.info(f"Message sent: {message.sender_category}{message.sender_id} -> {message.Receiver_category}{message.Receiver_id}: {message.content}")
-        # 直接发送给目标接收者
-        target_found = False
-        for subscriber_id, subscriber in self.subscribers.items():
-            # 检查接收者ID是否匹配
-            if subscriber_id == message.Receiver_id:
-                # 发送消息给匹配的接收者，不检查类别
-                subscriber.receive_message(message)
-                target_found = True
+        if self.bus_enabled:
+            self._bus_queue.append((self._bus_step, message))
+            return
+        for communicator in self._receivers(message):
+            communicator.receive_message(message)
+
+    def enable_bus(self, latency: int = 0):
+        """
+        启用消息总线：发送的消息先排队，每个仿真步调用一次deliver()统一投递，
+        避免发送、接收、回复之间的递归调用；latency为投递延迟（仿真步），
+        在第k个仿真步（advance()之后）发送的消息在第k+latency个仿真步的deliver()中送达，与发送在deliver()之前还是之后无关
+        """
+        self.bus_enabled = True
+        self.bus_latency = latency
+
+    def deliver(self, max_rounds: int = 16) -> int:
+        """
+        投递已到期的消息（每个仿真步在advance()之后调用一次），返回投递的消息数量
+        每一轮按发送顺序路由到期的消息，各接收者按注册次序批量处理自己的收件箱；
+        处理时产生的回复在latency为0时于下一轮投递，否则在之后的仿真步投递；
+        最多投递max_rounds轮，剩余的消息留到下一个仿真步
+        """
+        delivered = 0
+        for _ in range(max_rounds):
+            inboxes: Dict[str, Tuple[Communicator, List[Message]]] = {} # 交通主体ID -> (接收者, 收件箱)
+            while self._bus_queue and self._bus_queue[0][0] + self.bus_latency <= self._bus_step:
+                _, message = self._bus_queue.popleft()
+                for communicator in self._receivers(message):
+                    inboxes.setdefault(communicator.id, (communicator, []))[1].append(message)
+            if not inboxes:
                 break
-        # 如果没有找到特定接收者，广播给所有通信器（除了发送者本身）
-        if not target_found:
-            for communicator_id, communicator in self.subscribers.items():
-                if communicator_id != message.sender_id:
-                    communicator.receive_message(message)
+            for agent_id in sorted(inboxes, key=self._order.__getitem__):
+                communicator, messages = inboxes[agent_id]
+                communicator.receive_messages(messages)
+                delivered += len(messages)
+        return delivered
     
+    def flush_message_history(self):
+        """同步写出全部尚未写入文件的消息历史"""
+        flush_message_history()
+
+    def _reset_message_history(self):
+        """消息历史文件被清空或删除后，各通信器下次保存时重新写出完整的消息历史"""
+        for communicator in self.subscribers.values():
+            communicator.message_history.reset_saved()
+
     # 8.19 新增方法：删除所有消息历史文件
     def cleanup_message_files(self):
         """删除所有消息历史文件"""
+        # 先写出待写的消息，避免删除后又被后台写入器追加
+        self.flush_message_history()
+        self._reset_message_history()
         try:
             # 获取当前目录下所有message_*.txt文件
             pattern = "message_*_history.txt"
@@ -213,6 +602,8 @@ class CommunicationManager:
     # 8.19 新增方法：清空所有消息历史文件内容，而不删除文件
     def clear_message_files_content(self):
         """清空所有消息历史文件的内容（保留文件）"""
+        self.flush_message_history()
+        self._reset_message_history()
         try:
             # 获取当前目录下message_history文件夹下所有message_*.txt文件
             loc = "message_history"
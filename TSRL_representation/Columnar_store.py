@@ -0,0 +1,256 @@
+"""
+列式事实存储与车队级向量化推理
+同一条规则（如KeepLane(x):-VehicleInLane(y,x,Front),GreaterSpeed(y,x)）对每辆车分别推理时，
+推理引擎要为每辆车做一次小规模的归结。列式事实存储把全部车辆的基础事实按谓词保存为
+NumPy整数列（符号驻留为ID，首列为车辆序号），规则体的合取被求值为整个车队上的向量化连接，
+一次调用得到所有车辆的规则头部。
+
+求解顺序与按书写顺序求解规则体的反向链接（FolKB(join_planning=False)）一致：同一谓词先按规则文件中的顺序求各规则的解，再取事实；
+规则体的解按各子目标所用事实的先后次序（即深度优先求解的次序）排列，每辆车取第一个解。
+默认的反向链接按各车辆知识库的统计信息重排规则体（join_planning=True），各车辆的连接顺序可能不同，无法统一向量化，
+因此启用列式推理时，返回给调用方推理的车辆也应按书写顺序求解（infer_rules(..., join_planning=False)），使全部车辆的决策一致。
+含变量的事实、规则体中的复合项或递归规则无法向量化，对应车辆（或全部车辆）返回给调用方按原方式推理。
+"""
+import os
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# 添加当前目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import Inference_engine
+from Inference_pool import instantiate_head
+from Rule_base import CompiledRule, RuleBase
+from TSRL import TSRL, TSRLSession
+
+
+class NotVectorizable(Exception):
+    """规则或事实无法用向量化连接求解"""
+
+
+class ColumnarFactStore:
+    """
+    按谓词保存全部车辆的基础事实
+    table(key)返回二维int64数组，每行为(车辆序号, 参数1的ID, 参数2的ID, ...)，行的次序即事实的告知次序
+    """
+    def __init__(self):
+        self.symbols: Dict[str, int] = {}  # 符号 -> ID
+        self.names: List[str] = []  # ID -> 符号
+        self.agents: List[str] = []  # 车辆序号 -> 车辆ID
+        self.non_ground = set()  # 存在含变量事实的车辆ID，不参与向量化推理
+        self._rows: Dict[Tuple[str, int], List[Tuple[int, ...]]] = {}  # (谓词名, 元数) -> 行列表
+        self._tables: Dict[Tuple[str, int], np.ndarray] = {}  # (谓词名, 元数) -> 列式数组（按需构建）
+
+    def intern(self, symbol: str) -> int:
+        """返回符号的ID，首次出现时分配"""
+        symbol_id = self.symbols.get(symbol)
+        if symbol_id is None:
+            symbol_id = self.symbols[symbol] = len(self.names)
+            self.names.append(symbol)
+        return symbol_id
+
+    def add(self, agent_id: str, clauses: Iterable[Inference_engine.Expr]):
+        """加入一辆车的事实（已求值的表达式，如工作记忆或会话知识库中的子句）"""
+        rows = []
+        for clause in clauses:
+            if clause.op in ('==>', ':-'):
+                continue
+            row = []
+            for arg in clause.args:
+                if Inference_engine.is_variable(arg) or arg.args:
+                    self.non_ground.add(agent_id)
+                    return
+                row.append(self.intern(arg.op))
+            rows.append((Inference_engine.predicate_key(clause), row))
+        agent = len(self.agents)
+        self.agents.append(agent_id)
+        for key, row in rows:
+            self._rows.setdefault(key, []).append((agent, *row))
+        self._tables.clear()
+
+    def add_source(self, agent_id: str, source: str):
+        """解析一辆车的事实源代码（如消息历史）并加入"""
+        session = TSRLSession()
+        session.tell([statement for statement in TSRL.parse(source) if hasattr(statement, 'expression')])
+        self.add(agent_id, session.kb.local_clauses)
+
+    def table(self, key: Tuple[str, int]) -> np.ndarray:
+        table = self._tables.get(key)
+        if table is None:
+            rows = self._rows.get(key)
+            if rows:
+                table = np.array(rows, dtype=np.int64)
+            else:
+                table = np.empty((0, key[1] + 1), dtype=np.int64)
+            self._tables[key] = table
+        return table
+
+
+def _dense_keys(left: np.ndarray, right: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """将左右两侧的多列连接键统一编码为单列整数"""
+    if left.shape[1] == 1:
+        return left[:, 0], right[:, 0]
+    _, inverse = np.unique(np.concatenate([left, right]), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    return inverse[:len(left)], inverse[len(left):]
+
+
+def _join_indices(left_keys: np.ndarray, right_keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    等值连接，返回匹配的(左行号, 右行号)：按左行号排序，左行号相同时按右行号排序
+    （即深度优先求解时先固定前一个子目标的事实、再依次尝试后一个子目标的事实的次序）
+    """
+    order = np.argsort(right_keys, kind='stable')
+    sorted_keys = right_keys[order]
+    lo = np.searchsorted(sorted_keys, left_keys, side='left')
+    hi = np.searchsorted(sorted_keys, left_keys, side='right')
+    counts = hi - lo
+    left_index = np.repeat(np.arange(len(left_keys)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    right_index = order[np.repeat(lo, counts) + offsets]
+    return left_index, right_index
+
+
+class FleetInference:
+    """
+    车队级向量化推理
+    用法：
+        fleet = FleetInference(rule_base)
+        store = ColumnarFactStore()
+        store.add_source("0", "HasNextJunction(0,7); Congestion(7);")
+        results = fleet.infer(store, {"0": ["LetStopBeforeJunction(x)"]})
+        results["0"]  # (头部序号, 置换, 决策) 或 None；无法向量化的车辆不在结果中
+    """
+    def __init__(self, rule_base: RuleBase):
+        self.rule_base = rule_base
+
+    def _rules_by_head(self) -> Dict[Tuple[str, int], List[CompiledRule]]:
+        rules = {}
+        for rule in self.rule_base.rules:
+            rules.setdefault(Inference_engine.predicate_key(rule.head), []).append(rule)
+        return rules
+
+    def _relation(self, key, store, rules_by_head, memo, visiting) -> np.ndarray:
+        """谓词的全部解（按反向链接的求解顺序，去掉重复的解）"""
+        relation = memo.get(key)
+        if relation is not None:
+            return relation
+        if key in visiting:
+            raise NotVectorizable(f"Recursive predicate: {key[0]}")
+        visiting.add(key)
+        parts = [self._solve_rule(rule, store, rules_by_head, memo, visiting) for rule in rules_by_head.get(key, ())]
+        visiting.discard(key)
+        # 规则在父知识库（规则库）中，先于车辆的事实被检索
+        parts.append(store.table(key))
+        relation = np.concatenate(parts) if len(parts) > 1 else parts[0]
+        if len(parts) > 1 and len(relation):
+            _, first = np.unique(relation, axis=0, return_index=True)
+            relation = relation[np.sort(first)]
+        memo[key] = relation
+        return relation
+
+    @staticmethod
+    def _match_mask(atom, relation: np.ndarray, store: ColumnarFactStore, first_position: Optional[Dict[str, int]] = None) -> np.ndarray:
+        """
+        关系中与atom的常量参数相同、重复变量取值相同的行
+        first_position返回各变量第一次出现的列号
+        """
+        if first_position is None:
+            first_position = {}
+        mask = np.ones(len(relation), dtype=bool)
+        for position, arg in enumerate(atom.args, start=1):
+            if arg.args:
+                raise NotVectorizable(f"Compound term: {atom}")
+            if Inference_engine.is_variable(arg):
+                if arg.op in first_position:
+                    mask &= relation[:, position] == relation[:, first_position[arg.op]]
+                else:
+                    first_position[arg.op] = position
+            else:
+                symbol_id = store.symbols.get(arg.op)
+                if symbol_id is None:
+                    mask[:] = False
+                else:
+                    mask &= relation[:, position] == symbol_id
+        return mask
+
+    def _solve_rule(self, rule: CompiledRule, store, rules_by_head, memo, visiting) -> np.ndarray:
+        """按规则体从左到右做向量化连接，返回规则头部的解(车辆序号, 参数ID...)"""
+        columns: Dict[str, np.ndarray] = {}  # 已绑定的变量 -> 各中间结果行的取值
+        agents = None  # 各中间结果行的车辆序号
+        for atom in rule.body:
+            relation = self._relation(Inference_engine.predicate_key(atom), store, rules_by_head, memo, visiting)
+            # 子目标中的常量和重复变量先在关系上过滤
+            first_position = {}
+            relation = relation[self._match_mask(atom, relation, store, first_position)]
+            if agents is None:
+                agents = relation[:, 0]
+                columns = {name: relation[:, position] for name, position in first_position.items()}
+                continue
+            # 与已有的中间结果按(车辆, 共享变量)做等值连接
+            shared = [name for name in first_position if name in columns]
+            left = np.column_stack([agents] + [columns[name] for name in shared])
+            right = np.column_stack([relation[:, 0]] + [relation[:, first_position[name]] for name in shared])
+            left_index, right_index = _join_indices(*_dense_keys(left, right))
+            agents = agents[left_index]
+            columns = {name: values[left_index] for name, values in columns.items()}
+            for name, position in first_position.items():
+                if name not in columns:
+                    columns[name] = relation[right_index, position]
+        if agents is None:
+            raise NotVectorizable(f"Rule without body: {rule.source}")
+        head = [agents]
+        for arg in rule.head.args:
+            if Inference_engine.is_variable(arg):
+                if arg.op not in columns:
+                    raise NotVectorizable(f"Head variable not bound by body: {rule.source}")
+                head.append(columns[arg.op])
+            else:
+                head.append(np.full(len(agents), store.intern(arg.op), dtype=np.int64))
+        return np.column_stack(head)
+
+    def infer(self, store: ColumnarFactStore, heads: Dict[str, List[str]]) -> Dict[str, Optional[Tuple[int, Dict[str, str], str]]]:
+        """
+        对全部车辆一次性求解
+        :param heads: 车辆ID -> 按优先级排列的规则头部（同infer_rules）
+        :return: 车辆ID -> (头部序号, 置换, 决策)或None；含变量事实的车辆不在结果中；规则无法向量化时返回空字典
+        """
+        rules_by_head = self._rules_by_head()
+        memo = {}
+        index_of = {agent_id: agent for agent, agent_id in enumerate(store.agents)}
+        first_rows = {}  # 头部 -> {车辆序号: 第一个解}
+        parsed = {}  # 头部 -> 解析后的表达式
+        results = {}
+        try:
+            for agent_id, agent_heads in heads.items():
+                agent = index_of.get(agent_id)
+                if agent is None:
+                    continue
+                result = None
+                for index, head_text in enumerate(agent_heads):
+                    rows = first_rows.get(head_text)
+                    if rows is None:
+                        head = parsed[head_text] = TSRL.parse_expression(head_text)
+                        relation = self._relation(Inference_engine.predicate_key(head), store, rules_by_head, memo, set())
+                        relation = relation[self._match_mask(head, relation, store)]
+                        # 每辆车只取第一个解（与ask_one一致）
+                        _, first = np.unique(relation[:, 0], return_index=True)
+                        rows = first_rows[head_text] = {int(relation[i, 0]): relation[i, 1:] for i in first}
+                    row = rows.get(agent)
+                    if row is None:
+                        continue
+                    head = parsed[head_text]
+                    bindings = {}
+                    for arg, value in zip(head.args, row):
+                        if Inference_engine.is_variable(arg):
+                            bindings[arg.op] = store.names[value]
+                    decision = instantiate_head(head_text, bindings)
+                    if decision:
+                        result = index, bindings, decision
+                        break
+                results[agent_id] = result
+        except NotVectorizable:
+            return {}
+        return results
@@ -12,6 +12,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from typing import Any, List
 from Tokentype import Token, TokenType
 from abc import ABC, abstractmethod
+import weakref
 
 
 class ExprVisitor(ABC):
@@ -51,18 +52,71 @@ class ExprVisitor(ABC):
 
 class Expr:
     # base class for all AST nodes.
+    """
+    项为不可变对象：使用__slots__存储属性，构造时缓存哈希值。
+    Expr/Predicate/Variable/Constant为驻留(hash-consing)类，相同的项只保存一份实例，
+    因此相等判断通常退化为身份判断；其余语法树节点每次构造新实例。
+    驻留键按子项的身份区分（子项已驻留，结构相同的子项是同一个实例），
+    因此类不同的子项（如Expr('x')与Variable('x')）不会得到同一个父项。
+    带有源代码位置（词法单元）的谓词和变量不驻留，各自保留报告错误所用的行号。
+    """
+    __slots__ = ('op', 'args', 'token', '_hash', '__weakref__')
+    _intern = True  # 是否驻留该类的实例
+    _intern_table = weakref.WeakValueDictionary()  # 驻留表：驻留键 -> 实例
+
+    def __new__(cls, op=None, token=None, *args):
+        if not cls._intern:
+            return super().__new__(cls)
+        op = str(op)
+        if cls._positional(token):
+            obj = super().__new__(cls)
+            obj._setup(op, token, args)
+            return obj
+        key = (cls, op, tuple(map(id, args)), cls._token_key(token))
+        obj = Expr._intern_table.get(key)
+        if obj is None:
+            obj = super().__new__(cls)
+            obj._setup(op, token, args)
+            Expr._intern_table[key] = obj
+        return obj
 
     def __init__(self, op:str,token=None, *args):
-        self.op = str(op)
+        if self._intern:
+            return  # 驻留实例已在__new__中完成初始化
+        self._setup(str(op), token, args)
+
+    def _setup(self, op, token, args):
+        self.op = op
         self.args = args
         self.token = token
+        self._hash = hash((op, args))
+
+    @staticmethod
+    def _token_key(token):
+        """驻留键中与词法单元相关的部分，默认不区分词法单元"""
+        return None
+
+    @staticmethod
+    def _positional(token):
+        """词法单元是否只标记源代码位置（此时不驻留实例），默认否"""
+        return False
+
+    def __getnewargs__(self):
+        return (self.op, self.token) + self.args
+
+    def __reduce__(self):
+        """反序列化时重新调用构造函数：重新计算哈希值（哈希随机化下不同进程的哈希值不同）并重新驻留"""
+        return type(self), self.__getnewargs__()
 
     def __eq__(self, other):
         """x == y' evaluates to True or False; does not build an Expr."""
-        return isinstance(other, Expr) and self.op == other.op and self.args == other.args
+        if self is other:
+            return True
+        return (isinstance(other, Expr) and self._hash == other._hash
+                and self.op == other.op and self.args == other.args)
 
     def __hash__(self):
-        return hash(self.op) ^ hash(self.args)
+        return self._hash
 
     def __repr__(self):
         op = self.op
@@ -82,18 +136,29 @@ class Expr:
         pass
 
 class Implication(Expr):
+    __slots__ = ()
+    _intern = False
+
     def __init__(self,token=None, *args): #在args中条件在前，结论在后
-        super().__init__(':-', *args)
-        self.args = args
-        self.token = token
+        super().__init__(':-', token, *args)
+
+    def __getnewargs__(self):
+        return (self.token,) + self.args
 
     def accept(self, visitor: ExprVisitor):
         return visitor.visitImplicationExpr(self)
 
 class Predicate(Expr):
+    __slots__ = ()
+
     def __init__(self,op:str,token=None, *args):
         super().__init__(op, token,*args)
 
+    @staticmethod
+    def _positional(token):
+        """谓词的词法单元用于报告运行时错误的行号，按(op, args)驻留的只有不带词法单元的谓词"""
+        return token is not None
+
     def accept(self, visitor: ExprVisitor):
         return visitor.visitPredicateExpr(self)
 
@@ -103,56 +168,102 @@ class Binary(Expr):
     """
     所有的+-*/表达式均为二元表达式，二元表达式的前项和后项必须是可计算的表达式。
     """
+    __slots__ = ('left', 'right', 'operator')
+    _intern = False
+
     def __init__(self, left: Expr, op:str, operator: Token, right: Expr, ):
         super().__init__(op, operator,left, right)
         self.left = left
         self.right = right
         self.operator = operator
 
+    def __getnewargs__(self):
+        return (self.left, self.op, self.operator, self.right)
+
     def accept(self, visitor: ExprVisitor):
         return visitor.visitBinary(self)
 
 class Literal(Expr):
     #Represents a literal expression.
+    __slots__ = ('value',)
+    _intern = False
+
     def __init__(self, value: object, op: Token, *args):
       super().__init__(op.lexeme,op, *args)
       self.value = value
 
+    def __getnewargs__(self):
+        return (self.value, self.token) + self.args
+
     def accept(self, visitor: ExprVisitor):
         return visitor.visitLiteral(self)
 
 class Logical(Expr):
+    __slots__ = ('left', 'operator', 'right')
+    _intern = False
+
     def __init__(self, left:Expr, operator: Token, right:Expr):
         super().__init__(operator.lexeme, operator,left, right)
         self.left = left
         self.operator = operator
         self.right = right
 
+    def __getnewargs__(self):
+        return (self.left, self.operator, self.right)
+
     def accept(self, visitor: ExprVisitor):
         return visitor.visitLogicalExpr(self)
 
 class Unary(Expr):
     #Represents a unary expression.
+    __slots__ = ('operator', 'right')
+    _intern = False
+
     def __init__(self, operator: Token, right: Expr ):
         super().__init__(operator.lexeme,operator, right)
         self.operator = operator
         self.right = right
 
+    def __getnewargs__(self):
+        return (self.operator, self.right)
+
     def accept(self, visitor: ExprVisitor):
         return visitor.visitUnary(self)
 
 class Variable(Expr):
+    __slots__ = ()
+
     def __init__(self, op:str,name=None, *args):
         super().__init__(op,name, *args)
-        self.name = name
+
+    @staticmethod
+    def _positional(token):
+        """同名变量出现在不同位置，带词法单元的变量不驻留，避免共用第一次出现时的行号"""
+        return token is not None
+
+    @property
+    def name(self):
+        return self.token
 
     def accept(self, visitor: ExprVisitor):
         return visitor.visitVariableExpr(self)
 
 class Constant(Expr):
+    __slots__ = ()
+
     def __init__(self, op:str,name=None, *args):
         super().__init__(op,name, *args)
-        self.name = name
+
+    @property
+    def name(self):
+        return self.token
+
+    @staticmethod
+    def _token_key(token):
+        """常量的字面值参与算术运算，按词法单元类型和字面值区分驻留实例"""
+        if token is None:
+            return None
+        return token.type, token.literal
 
     def accept(self, visitor: ExprVisitor):
         return visitor.visitConstantExpr(self)
@@ -0,0 +1,162 @@
+"""
+TSRL前端（词法分析+语法分析）吞吐量基准测试
+默认使用合成的消息历史（事实与规则交替），也可以指定TSRL源文件，输出每秒处理的语句数和峰值内存
+对照组为基线提交（BASELINE_REVISION）中的逐字符词法分析器（从git取出）加词法单元列表上的语法分析，
+不在git仓库中运行时只测量当前的实现
+用法：
+    python Frontend_benchmark.py                      # 合成的20000条语句
+    python Frontend_benchmark.py -n 100000 -r 5
+    python Frontend_benchmark.py Infer_input/input_1.txt
+    python Frontend_benchmark.py --baseline <commit>   # 与其他提交中的词法分析器比较
+
+流式语法分析比先得到全部词法单元再分析慢约5%~10%（词法分析与语法分析交替执行），
+但只保留一批词法单元，峰值内存不随源代码长度增长，适合很长的消息历史；
+TSRL.parse()仍然使用词法单元列表，TSRL.iter_parse()按需使用流式语法分析
+"""
+import argparse
+import gc
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# 添加当前目录到Python路径
+sys.path.append(HERE)
+
+from Parser import Parser
+from Scanner import Scanner
+from TSRL import TSRL
+
+# 合成消息历史所用的语句模板（与消息历史文件和规则文件中的语句形式相同）
+TEMPLATES = (
+    "SelfVehicle({i});",
+    "HasNextJunction({i},{j});",
+    "Congestion({j});",
+    "VehicleInLane({j},{i},Front);",
+    "GreaterSpeed({j},{i});",
+    "EmergencyStation({i},{j});",
+    "LetStopBeforeJunction(x):-HasNextJunction(x,y),Congestion(y);",
+    "KeepLane(x):-VehicleInLane(y,x,Front),GreaterSpeed(y,x);  // 前车更快时保持车道",
+)
+
+BASELINE_REVISION = 'cbdeb07'  # 正则主模式之前的基线提交，对照组使用该提交中的词法分析器
+
+
+def load_baseline_scanner(revision: str = BASELINE_REVISION):
+    """
+    从git取出revision中的Scanner.py，作为独立模块加载，返回其中的Scanner类；
+    不在git仓库中或取不到该提交时返回None
+    """
+    try:
+        source = subprocess.run(['git', 'show', f'{revision}:./Scanner.py'], cwd=HERE, check=True,
+                                capture_output=True).stdout.decode('utf-8')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    module = types.ModuleType('baseline_Scanner')
+    module.__file__ = os.path.join(HERE, 'Scanner.py')
+    exec(compile(source, f'{revision}:Scanner.py', 'exec'), module.__dict__)
+    return module.Scanner
+
+
+def synthetic_source(statements: int) -> str:
+    """生成statements条语句的TSRL源代码，每行一条"""
+    lines = []
+    for n in range(statements):
+        lines.append(TEMPLATES[n % len(TEMPLATES)].format(i=n % 97, j=n % 89))
+    return "\n".join(lines) + "\n"
+
+
+def token_signature(tokens):
+    return [(token.type, token.lexeme, token.line) for token in tokens]
+
+
+def measure(cases, repeat: int):
+    """
+    各测试项轮流执行repeat轮（减小机器负载波动对比较的影响），每项取最快的一次（计时期间关闭垃圾回收，同timeit）；
+    另外单独执行一次测量峰值内存
+    """
+    best = {name: float('inf') for name, _ in cases}
+    for _ in range(repeat):
+        for name, fn in cases:
+            gc.collect()
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                fn()
+                best[name] = min(best[name], time.perf_counter() - start)
+            finally:
+                gc.enable()
+    peaks = {}
+    for name, fn in cases:
+        gc.collect()
+        tracemalloc.start()
+        fn()
+        peaks[name] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return best, peaks
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TSRL front-end throughput benchmark')
+    parser.add_argument('files', nargs='*', help='TSRL source files (default: synthetic message history)')
+    parser.add_argument('-n', '--statements', type=int, default=20000, help='number of synthetic statements')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='repetitions, the fastest is reported')
+    parser.add_argument('--baseline', default=BASELINE_REVISION, help='git revision of the baseline scanner')
+    args = parser.parse_args()
+
+    if args.files:
+        sources = []
+        for path in args.files:
+            with open(path, 'r', encoding='utf-8') as f:
+                sources.append(f.read())
+        source = "\n".join(sources)
+    else:
+        source = synthetic_source(args.statements)
+    statements = len(TSRL.parse(source))
+    print(f"{statements} statements, {len(source)} characters")
+    BaselineScanner = load_baseline_scanner(args.baseline)
+    if BaselineScanner is None:
+        print(f"baseline scanner not available (git revision {args.baseline}), measuring the current front end only")
+    elif token_signature(BaselineScanner(source).scan_tokens()) != token_signature(Scanner(source).scan_tokens()):
+        print("warning: the regex scanner and the baseline scanner produce different tokens")
+
+    def tokenize_baseline():
+        BaselineScanner(source).scan_tokens()
+
+    def tokenize():
+        for _ in Scanner(source).iter_tokens():
+            pass
+
+    def parse_baseline():
+        Parser(BaselineScanner(source).scan_tokens()).parse()
+
+    def parse_list():
+        Parser(Scanner(source).scan_tokens()).parse()
+
+    def parse_stream():
+        for _ in TSRL.iter_parse(source):
+            pass
+
+    cases = [
+        ("tokenize (baseline)", tokenize_baseline),
+        ("tokenize (regex)", tokenize),
+        ("parse (baseline + list)", parse_baseline),
+        ("parse (regex + list)", parse_list),
+        ("parse (regex + streaming)", parse_stream),
+    ]
+    if BaselineScanner is None:
+        cases = [case for case in cases if "baseline" not in case[0]]
+    best, peaks = measure(cases, args.repeat)
+    baseline = best.get("parse (baseline + list)")
+    print(f"{'':<28}{'time':>13}{'statements/s':>14}{'vs base':>9}{'peak memory':>14}")
+    for name, _ in cases:
+        seconds = best[name]
+        speedup = f"{baseline / seconds:8.2f}x" if baseline and name.startswith("parse") else ""
+        print(f"{name:<28}{seconds * 1000:10.2f} ms{statements / seconds:14.0f}{speedup:>9}{peaks[name] / 2**20:11.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,8 +3,11 @@ import os
 # 添加当前目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+import heapq
 import itertools
-import random
+import math
+import time
+from collections import Counter
 
 import RuntimeError
 from Expr import Expr,Predicate,Variable,Constant
@@ -16,31 +19,76 @@ def first(iterable, default=None):
     """Return the first element of an iterable; or default."""
     return next(iter(iterable), default)
 
-#扩展字典集合
-def extend(s, var, val):
-    """Copy dict s and extend it by setting var to val; return copy."""
-    return {**s, var: val}
+#资源受限的询问
+class AskLimits:
+    """
+    单次反向链接询问的资源上限，各项为None表示不限制
+    steps: 最多展开的子目标次数；depth: 证明的最大深度（同时展开中的子目标数）；deadline: 墙钟时间上限（秒）
+    """
+    __slots__ = ('steps', 'depth', 'deadline')
 
-#生成 长整数
-class UniqueEightDigitGenerator:
-    def __init__(self):
-        self.generated = set()
-        # 计算总共可能的组合数：9 * 10^7
-        self.total_possible = 90000000
+    def __init__(self, steps=None, depth=None, deadline=None):
+        self.steps = steps
+        self.depth = depth
+        self.deadline = deadline
 
-    def generate(self):
-        """生成一个不重复的8位随机整数"""
-        if len(self.generated) >= self.total_possible:
-            raise RuntimeError("已生成所有可能的8位整数")
+    def start(self):
+        """开始一次询问，返回其预算"""
+        return Budget(self)
 
-        while True:
-            # 生成10000000到99999999之间的随机整数
-            num = random.randint(10000000, 99999999)
+    def __repr__(self):
+        return 'AskLimits(steps={}, depth={}, deadline={})'.format(self.steps, self.depth, self.deadline)
+
+class Budget:
+    """一次询问中剩余的资源，由反向链接的每次子目标展开消耗"""
+    __slots__ = ('steps', 'max_depth', 'depth', 'deadline')
+
+    def __init__(self, limits):
+        self.steps = limits.steps
+        self.max_depth = limits.depth
+        self.depth = 0
+        self.deadline = time.monotonic() + limits.deadline if limits.deadline is not None else None
+
+    def enter(self):
+        """展开一个子目标；资源耗尽时抛出BudgetExceeded"""
+        if self.steps is not None:
+            self.steps -= 1
+            if self.steps < 0:
+                raise BudgetExceeded('steps')
+        self.depth += 1
+        if self.max_depth is not None and self.depth > self.max_depth:
+            raise BudgetExceeded('depth')
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise BudgetExceeded('deadline')
+
+class BudgetExceeded(Exception):
+    """询问在资源上限内未能完成，reason为'steps'、'depth'或'deadline'"""
+    def __init__(self, reason):
+        self.reason = reason
+        Exception.__init__(self, 'Inference budget exceeded: {}'.format(reason))
+
+class Unknown:
+    """
+    资源耗尽时的询问结果：既不是置换也不是False，调用者应按未知处理（如采用默认行为）
+    reason为耗尽的资源：'steps'、'depth'或'deadline'
+    """
+    __slots__ = ('reason',)
+
+    def __init__(self, reason):
+        self.reason = reason
+
+    def __repr__(self):
+        return 'Unknown({})'.format(self.reason)
 
-            if num not in self.generated:
-                self.generated.add(num)
-                return num
+budget_hits = Counter()  # 本进程中各类资源上限被触发的次数：'steps'/'depth'/'deadline' -> 次数
 
+def is_unknown(x):
+    return isinstance(x, Unknown)
+
+#扩展字典集合
+def extend(s, var, val):
+    """Copy dict s and extend it by setting var to val; return copy."""
+    return {**s, var: val}
 
 class KB:
 
@@ -201,9 +249,7 @@ def standardize_variables(sentence:Expr, dic=None):
         if sentence in dic:
             return dic[sentence]
         else:
-            # v = Variable('v_{}'.format(next(standardize_variables.counter)),
-            #              Token(sentence.token.type,'v_{}'.format(next(standardize_variables.counter)),sentence.token.literal,sentence.token.line))
-            v_iden = generator.generate()
+            v_iden = next(standardize_variables.counter)
             v = Variable('v_{}'.format(v_iden),
                          Token(sentence.token.type,'v_{}'.format(v_iden),sentence.token.literal,sentence.token.line))
             dic[sentence] = v
@@ -213,8 +259,8 @@ def standardize_variables(sentence:Expr, dic=None):
     else:
         return Predicate(sentence.op, sentence.token, *[standardize_variables(a, dic) for a in sentence.args])
 
-# standardize_variables.counter = itertools.count()
-generator = UniqueEightDigitGenerator()
+# 反向链接不再调用本函数（改用帧号区分子句变量），保留供外部使用
+standardize_variables.counter = itertools.count()
 
 def term_reduction(x, y, s):
     """Apply term reduction to x and y if both are functions and the two root function
@@ -330,31 +376,367 @@ class FolKB(KB):
     Flopsie
     >>> kb0.ask(Expr('Wife',Expr('Pete'),Expr('x')))
     False
+
+    分层知识库：overlay()在当前知识库之上创建子知识库，当前知识库随之冻结（只读）；
+    子知识库只保存新增的子句，创建和丢弃都是O(1)，询问时按"父知识库子句在前"的顺序合并检索。
+
+    连接顺序：join_planning为True时，反向链接按各谓词的子句数量和已绑定的参数估计代价，
+    先求解选择性高的子目标（见plan_body），顺序按(规则体, 绑定模式, 统计信息的量级)缓存在根知识库中，各层共享；
+    每层另外记住本层已使用的顺序，本层子句变化前不再重新计算统计信息。
+
+    事实有效期：ttl为谓词名 -> 有效期（仿真秒，'*'为其余谓词的默认有效期），
+    带时间戳告知的事实在时间戳+有效期之后过期，expire(now)按仿真时间批量淘汰本层的过期事实。
+
+    表格化：tabling默认为'auto'，只对规则依赖图中的递归谓词使用表格化求解（保证递归规则终止），
+    其余谓词按深度优先逐个返回答案，得到第一个答案前不需要求出全部答案。
+
+    资源上限：limits为AskLimits时，每次反向链接询问的展开次数、深度和墙钟时间受其限制，
+    超出时询问抛出BudgetExceeded（ask_batch中该询问的结果为Unknown），已完成的答案表保留。
     """
 
-    def __init__(self, clauses=None):
+    def __init__(self, clauses=None, strategy='backward', tabling='auto', parent=None, join_planning=True):
         super().__init__()
-        self.clauses = []  # inefficient: no indexing
+        self.parent = parent  # 只读的父知识库（如共享规则库），本知识库只保存在其上新增的子句
+        self.frozen = False  # 冻结后不能再告知或撤回子句
+        self.strategy = strategy  # 询问策略：'backward'反向链接，'forward'前向链接，'seminaive'半朴素自底向上求值
+        # 反向链接的表格化（记忆化）求解：'auto'只表格化递归谓词，True表格化全部谓词，False不使用，也可以是谓词名集合
+        self.tabling = tabling
+        self._recursive = None  # 递归谓词集合的缓存，告知或撤回规则时清空
+        self.join_planning = join_planning  # 反向链接是否按代价重排规则体中子目标的求解顺序
+        self._join_plans = {}  # 连接顺序缓存：(规则体, 已绑定变量, 统计签名) -> 求解顺序，只在根知识库中使用
+        self._plan_memo = {}  # 本层使用的连接顺序：(规则体, 已绑定变量) -> 求解顺序，本层子句变化时清空
+        self._rule_counts = {}  # 本层规则（非事实）的数量：(谓词名, 元数) -> 数量
+        self.tables = {}  # 答案表：子目标变体键 -> AnswerTable，知识库变化时清空
+        self._table_stack = []  # 正在求解中的答案表栈，用于识别递归子目标
+        self._clauses = []  # 按插入顺序保存的本层子句
+        self._seq = itertools.count()  # 子句插入序号，用于在索引中保持插入顺序
+        self._pred_index = {}  # 谓词索引：(谓词名, 元数) -> [(序号, 子句, 子句模板)]
+        self._first_arg_index = {}  # 首参数子索引：(谓词名, 元数) -> {首参数常量: [(序号, 子句, 子句模板)]}
+        self._unbound_first_arg = {}  # 首参数非常量的子句：(谓词名, 元数) -> [(序号, 子句, 子句模板)]
+        self.ttl = {}  # 事实有效期：谓词名 -> 仿真秒，未设置（且无'*'默认值）的谓词不过期
+        self._expiry = []  # 过期时间最小堆：(过期时间, 序号, 子句)
+        self.limits = None  # 反向链接询问的资源上限（AskLimits），None表示不限制
         if clauses:
             for clause in clauses:
                 self.tell(clause)
 
+    @property
+    def clauses(self):
+        """按插入顺序返回全部子句（父知识库的子句在前）"""
+        if self.parent is None:
+            return self._clauses
+        return self.parent.clauses + self._clauses
+
+    @property
+    def local_clauses(self):
+        """本层的子句（不含父知识库的子句）"""
+        return self._clauses
+
+    def rebase(self, parent):
+        """将本层子句改为叠加在新的父知识库之上（如规则库重新编译后），O(1)"""
+        self.parent = parent.freeze() if parent is not None else None
+        self.tables.clear()
+        self._plan_memo.clear()
+        self._recursive = None
+
+    def freeze(self):
+        """冻结知识库，之后只能询问或在其上创建子知识库"""
+        self.frozen = True
+        return self
+
+    def overlay(self):
+        """冻结当前知识库，并返回以其为父知识库的空子知识库"""
+        self.freeze()
+        kb = FolKB(strategy=self.strategy, tabling=self.tabling, parent=self, join_planning=self.join_planning)
+        kb.limits = self.limits
+        return kb
+
+    def recursive_predicates(self):
+        """规则依赖图（包含父知识库的规则）中能回到自身的谓词名集合"""
+        if self._recursive is None:
+            if self.parent is not None and not any(self._rule_counts.values()):
+                self._recursive = self.parent.recursive_predicates()
+            else:
+                dependencies = {}
+                kb = self
+                while kb is not None:
+                    for clause in kb._clauses:
+                        body, head = parse_definite_clause(clause)
+                        if body:
+                            dependencies.setdefault(head.op, set()).update(atom.op for atom in body)
+                    kb = kb.parent
+                self._recursive = recursive_predicates(dependencies)
+        return self._recursive
+
+    def is_tabled(self, predicate):
+        """反向链接求解谓词predicate的子目标时是否使用表格化"""
+        tabling = self.tabling
+        if not tabling:
+            return False
+        if tabling is True:
+            return True
+        if tabling == 'auto':
+            return predicate in self.recursive_predicates()
+        return predicate in tabling
+
     #只接受一阶确定子句
-    def tell(self, sentence):
+    def tell(self, sentence, timestamp=None):
+        """
+        告知子句
+        :param timestamp: 事实的仿真时间戳；谓词设置了有效期时，事实在timestamp+有效期之后由expire()淘汰
+        """
+        if self.frozen:
+            raise RuntimeError.CustomRuntimeError(sentence.token, 'Knowledge base is frozen: {}'.format(sentence))
         if is_definite_clause(sentence):
-            self.clauses.append(sentence)
+            self._clauses.append(sentence)
+            seq = self._index_clause(sentence)
+            self.tables.clear()
+            self._plan_memo.clear()
+            if sentence.op in ('==>', ':-'):
+                self._recursive = None
+            if timestamp is not None and sentence.op not in ('==>', ':-'):
+                ttl = self.ttl.get(sentence.op, self.ttl.get('*'))
+                if ttl is not None:
+                    heapq.heappush(self._expiry, (timestamp + ttl, seq, sentence))
         else:
             # raise Exception('Not a definite clause: {}'.format(sentence))
             raise RuntimeError.CustomRuntimeError(sentence.token, 'Not a definite clause: {}'.format(sentence))
 
-    def ask_generator(self, query):
-        return fol_bc_ask(self, query)
+    def ask_generator(self, query, strategy=None, limits=None):
+        """
+        :param limits: 本次询问的资源上限（只用于反向链接），None时使用self.limits
+        """
+        strategy = strategy or self.strategy
+        if strategy == 'backward':
+            return fol_bc_ask(self, query, limits if limits is not None else self.limits)
+        elif strategy == 'seminaive':
+            return fol_seminaive_ask(self, query)
+        elif strategy == 'forward':
+            return fol_fc_ask(self, query)
+        raise ValueError('Unknown ask strategy: {}'.format(strategy))
+
+    def ask_batch(self, queries, strategy=None, limit=None, limits=None):
+        """
+        在同一知识库上一次求解多个询问，逐个返回(询问序号, 置换)
+        反向链接时各询问依次求解，共用知识库的索引和已完成的表（子目标的答案只求一次）；
+        半朴素求值时全部询问共用同一次自底向上求值
+        :param limit: 每个询问最多返回的置换数量，None表示不限
+        :param limits: 每个询问的资源上限，某个询问资源耗尽时返回(询问序号, Unknown)并继续下一个询问
+        """
+        strategy = strategy or self.strategy
+        if strategy == 'seminaive':
+            yield from fol_seminaive_ask_batch(self, queries, limit)
+            return
+        for index, query in enumerate(queries):
+            try:
+                for theta in itertools.islice(self.ask_generator(query, strategy, limits), limit):
+                    yield index, theta
+            except BudgetExceeded as e:
+                yield index, Unknown(e.reason)
 
     def retract(self, sentence):
-        self.clauses.remove(sentence)
+        if self.frozen:
+            raise RuntimeError.CustomRuntimeError(sentence.token, 'Knowledge base is frozen: {}'.format(sentence))
+        self._clauses.remove(sentence)
+        self._unindex_clause(sentence)
+        self.tables.clear()
+        self._plan_memo.clear()
+        if sentence.op in ('==>', ':-'):
+            self._recursive = None
+
+    def expire(self, now):
+        """
+        批量淘汰本层在仿真时间now之前过期的事实，返回淘汰的事实数量
+        过期事实从最小堆中取出，只重建涉及的谓词的索引，答案表只清空一次
+        """
+        if not self._expiry or self._expiry[0][0] > now:
+            return 0
+        if self.frozen:
+            sentence = self._expiry[0][2]
+            raise RuntimeError.CustomRuntimeError(sentence.token, 'Knowledge base is frozen: {}'.format(sentence))
+        expired = set()
+        keys = set()
+        while self._expiry and self._expiry[0][0] <= now:
+            _, seq, sentence = heapq.heappop(self._expiry)
+            expired.add(seq)
+            keys.add(predicate_key(sentence))
+        removed = {}
+        for key in keys:
+            entries = self._pred_index.get(key, [])
+            for entry in entries:
+                if entry[0] in expired:
+                    removed[entry[1]] = removed.get(entry[1], 0) + 1
+            entries = [entry for entry in entries if entry[0] not in expired]
+            if entries:
+                self._pred_index[key] = entries
+            else:
+                self._pred_index.pop(key, None)
+            if key in self._unbound_first_arg:
+                unbound = [entry for entry in self._unbound_first_arg[key] if entry[0] not in expired]
+                if unbound:
+                    self._unbound_first_arg[key] = unbound
+                else:
+                    del self._unbound_first_arg[key]
+            buckets = self._first_arg_index.get(key, {})
+            for first_arg in list(buckets):
+                bucket = [entry for entry in buckets[first_arg] if entry[0] not in expired]
+                if bucket:
+                    buckets[first_arg] = bucket
+                else:
+                    del buckets[first_arg]
+            if not buckets:
+                self._first_arg_index.pop(key, None)
+        count = sum(removed.values())
+        if count:
+            clauses = []
+            for clause in self._clauses:
+                if removed.get(clause):
+                    removed[clause] -= 1
+                    continue
+                clauses.append(clause)
+            self._clauses = clauses
+            self.tables.clear()
+            self._plan_memo.clear()
+        return count
+
+    def predicate_stats(self, key):
+        """
+        谓词的统计信息(子句数, 规则数, 首参数不同常量数)，包含父知识库，用于估计子目标的代价
+        """
+        clauses = rules = first_args = 0
+        kb = self
+        while kb is not None:
+            clauses += len(kb._pred_index.get(key, ()))
+            rules += kb._rule_counts.get(key, 0)
+            first_args += len(kb._first_arg_index.get(key, ()))
+            kb = kb.parent
+        return clauses, rules, first_args
+
+    def root(self):
+        """最底层的父知识库（如共享规则库）"""
+        kb = self
+        while kb.parent is not None:
+            kb = kb.parent
+        return kb
 
     def fetch_rules_for_goal(self, goal):
-        return self.clauses
+        """
+        返回头部可能与goal合一的子句（按插入顺序），
+        先按(谓词名, 元数)过滤，若goal首参数为常量，再按首参数常量过滤
+        """
+        return [entry[1] for entry in self._candidates(goal)]
+
+    def fetch_templates_for_goal(self, goal):
+        """同fetch_rules_for_goal，但返回告知时预编译的子句模板(头部, 体)"""
+        return [entry[2] for entry in self._candidates(goal)]
+
+    def _candidates(self, goal):
+        entries = self._local_candidates(goal)
+        if self.parent is None:
+            return entries
+        inherited = self.parent._candidates(goal)
+        if not entries:
+            return inherited
+        if not inherited:
+            return entries
+        return inherited + entries
+
+    def _local_candidates(self, goal):
+        key = predicate_key(goal)
+        if key is None:
+            return [entry for entries in self._pred_index.values() for entry in entries]
+        entries = self._pred_index.get(key)
+        if not entries:
+            return []
+        first_arg = first_arg_key(goal)
+        if first_arg is None:
+            return entries
+        bound = self._first_arg_index.get(key, {}).get(first_arg, [])
+        unbound = self._unbound_first_arg.get(key, [])
+        if not unbound:
+            return bound
+        if not bound:
+            return unbound
+        return list(heapq.merge(bound, unbound, key=lambda entry: entry[0]))
+
+    def _index_clause(self, sentence):
+        """将子句按其头部加入谓词索引与首参数子索引"""
+        body, head = parse_definite_clause(sentence)
+        key = predicate_key(head)
+        entry = (next(self._seq), sentence, (head, tuple(body)))
+        self._pred_index.setdefault(key, []).append(entry)
+        if body:
+            self._rule_counts[key] = self._rule_counts.get(key, 0) + 1
+        first_arg = first_arg_key(head)
+        if first_arg is None:
+            self._unbound_first_arg.setdefault(key, []).append(entry)
+        else:
+            self._first_arg_index.setdefault(key, {}).setdefault(first_arg, []).append(entry)
+        return entry[0]
+
+    def _unindex_clause(self, sentence):
+        """从索引中移除子句的第一个出现（与list.remove语义一致）"""
+        head = clause_head(sentence)
+        key = predicate_key(head)
+        first_arg = first_arg_key(head)
+        if first_arg is None:
+            bucket = self._unbound_first_arg[key]
+        else:
+            bucket = self._first_arg_index[key][first_arg]
+        for i, (seq, clause, template) in enumerate(bucket):
+            if clause == sentence:
+                del bucket[i]
+                if template[1]:
+                    self._rule_counts[key] -= 1
+                break
+        entries = self._pred_index[key]
+        for i, entry in enumerate(entries):
+            if entry[0] == seq:
+                del entries[i]
+                break
+        if first_arg is not None and not bucket:
+            del self._first_arg_index[key][first_arg]
+
+
+def recursive_predicates(dependencies):
+    """依赖图（头部谓词 -> 规则体谓词集合）中能经由规则体回到自身的头部谓词（直接或间接递归）"""
+    recursive = set()
+    for head in dependencies:
+        stack = list(dependencies[head])
+        seen = set()
+        while stack:
+            predicate = stack.pop()
+            if predicate == head:
+                recursive.add(head)
+                break
+            if predicate not in seen:
+                seen.add(predicate)
+                stack.extend(dependencies.get(predicate, ()))
+    return recursive
+
+
+#子句索引辅助函数
+def clause_head(sentence):
+    """返回限定子句的头部（事实返回其自身，规则返回结论）"""
+    if sentence.op == '==>' or sentence.op == ':-':
+        return sentence.args[1]
+    return sentence
+
+def predicate_key(x):
+    """返回谓词的索引键(谓词名, 元数)；变量等无法索引的表达式返回None"""
+    if not isinstance(x, Expr) or is_variable(x):
+        return None
+    return x.op, len(x.args)
+
+def first_arg_key(x):
+    """若谓词的首参数为常量则返回该常量符号，否则返回None"""
+    if not x.args:
+        return None
+    arg = x.args[0]
+    if not isinstance(arg, Expr) or is_variable(arg) or arg.args:
+        return None
+    return arg.op
+
 
 #前向链接
 def fol_fc_ask(kb, alpha):
@@ -395,29 +777,405 @@ def fol_fc_ask(kb, alpha):
     return None
 
 
+#半朴素前向链接（自底向上Datalog求值）
+def fol_seminaive_ask(kb, alpha):
+    """
+    半朴素(semi-naive)自底向上求值：每一轮只用上一轮新增的事实(delta)与规则体做哈希连接，
+    直至不再产生新事实，求值代价为事实数量的多项式。
+    事实中的参数一律视为常量符号；推导出的事实只保存在本次求值中，不写回知识库。
+    """
+    for _, theta in fol_seminaive_ask_batch(kb, [alpha]):
+        yield theta
+
+def fol_seminaive_ask_batch(kb, alphas, limit=None):
+    """
+    多个询问共用同一次半朴素求值，逐个返回(询问序号, 置换)；每个询问的置换次序与单独询问时相同
+    :param limit: 每个询问最多返回的置换数量，全部询问都达到后提前结束求值；None表示不限
+    """
+    old = {}  # 上一轮之前已知的事实：(谓词名, 元数) -> {参数元组: None}（有序集合）
+    delta = {}  # 上一轮新增的事实
+    rules = []
+    for clause in kb.clauses:
+        body, head = parse_definite_clause(clause)
+        if body:
+            rules.append((head, body))
+        else:
+            delta.setdefault(predicate_key(head), {})[head.args] = None
+
+    answers = [set() for _ in alphas]
+    pending = set(range(len(alphas)))  # 尚未达到limit的询问
+
+    def new_answers(relations):
+        for index, alpha in enumerate(alphas):
+            if index not in pending:
+                continue
+            for row in relations.get(predicate_key(alpha), ()):
+                theta = match_atom(alpha, row, {})
+                if theta is not None:
+                    frozen = frozenset(theta.items())
+                    if frozen not in answers[index]:
+                        answers[index].add(frozen)
+                        yield index, theta
+                        if limit is not None and len(answers[index]) >= limit:
+                            pending.discard(index)
+                            break
+
+    yield from new_answers(delta)
+    while delta and pending:
+        full = {key: {**old.get(key, {}), **rows} for key, rows in delta.items()}
+        for key, rows in old.items():
+            full.setdefault(key, rows)
+        sources = {'old': old, 'delta': delta, 'full': full}
+        indexes = {}
+        new = {}
+        for head, body in rules:
+            head_key = predicate_key(head)
+            for i, atom in enumerate(body):
+                if predicate_key(atom) not in delta:
+                    continue
+                # 第i个子目标取delta，之前的取old，之后的取full，保证每个新组合只被推导一次
+                plan = ['old'] * i + ['delta'] + ['full'] * (len(body) - i - 1)
+                for theta in hash_join(body, plan, sources, indexes, {}):
+                    row = tuple(theta.get(arg, arg) if is_variable(arg) else arg for arg in head.args)
+                    if row not in full.get(head_key, ()) and row not in new.get(head_key, ()):
+                        new.setdefault(head_key, {})[row] = None
+        old, delta = full, new
+        yield from new_answers(delta)
+
+def match_atom(atom, row, theta):
+    """将谓词atom与事实参数元组row匹配，返回扩展后的置换；不匹配返回None"""
+    if len(atom.args) != len(row):
+        return None
+    theta = dict(theta)
+    for arg, value in zip(atom.args, row):
+        if is_variable(arg):
+            if arg in theta:
+                if theta[arg] != value:
+                    return None
+            else:
+                theta[arg] = value
+        elif arg != value:
+            return None
+    return theta
+
+def hash_join(goals, plan, sources, indexes, theta):
+    """
+    按plan指定的关系来源依次连接goals中的各子目标。
+    每个子目标按其已绑定的参数位置建立哈希索引（同一轮内缓存复用），只检索键值相同的事实。
+    """
+    if not goals:
+        yield theta
+        return
+    atom, source = goals[0], plan[0]
+    key = predicate_key(atom)
+    positions = tuple(i for i, arg in enumerate(atom.args) if not is_variable(arg) or arg in theta)
+    index_key = (source, key, positions)
+    index = indexes.get(index_key)
+    if index is None:
+        index = {}
+        for row in sources[source].get(key, ()):
+            index.setdefault(tuple(row[i] for i in positions), []).append(row)
+        indexes[index_key] = index
+    probe = tuple(theta.get(atom.args[i], atom.args[i]) if is_variable(atom.args[i]) else atom.args[i]
+                  for i in positions)
+    for row in index.get(probe, ()):
+        theta1 = match_atom(atom, row, theta)
+        if theta1 is not None:
+            yield from hash_join(goals[1:], plan[1:], sources, indexes, theta1)
+
+
 #反向链接
-def fol_bc_ask(kb, query):
-    return fol_bc_or(kb, query, {})
+def fol_bc_ask(kb, query, limits=None):
+    """
+    反向链接询问：搜索过程中只在一个可变绑定环境上绑定与回溯，
+    每得到一个解时才将询问中的变量实例化为置换字典返回
+    :param limits: 资源上限（AskLimits），超出时抛出BudgetExceeded，并丢弃未完成的答案表
+    """
+    env = Bindings()
+    if limits is not None:
+        env.budget = limits.start()
+    query_vars = variables(query)
+    try:
+        for _ in fol_bc_or(kb, query, 0, env):
+            theta = {}
+            for var in query_vars:
+                value = env.resolve(var, 0)
+                if value is not var:
+                    theta[var] = value
+            yield theta
+    except BudgetExceeded as e:
+        budget_hits[e.reason] += 1
+        for key in [key for key, table in kb.tables.items() if not table.complete]:
+            del kb.tables[key]
+        raise
 
 #或搜索
-def fol_bc_or(kb, goal, theta):
-    for rule in kb.fetch_rules_for_goal(goal):
-        lhs, rhs = parse_definite_clause(standardize_variables(rule))
-        for theta1 in fol_bc_and(kb, lhs, unify_mm(rhs, goal, theta)):
-            yield theta1
+def fol_bc_or(kb, goal, frame, env):
+    """
+    goal中的变量属于帧frame。每使用一次子句就分配一个新帧号，
+    子句变量以(变量, 帧号)区分，无需为每次使用重建改名后的子句
+    """
+    budget = env.budget
+    if budget is not None:
+        budget.enter()
+        try:
+            yield from _fol_bc_or(kb, goal, frame, env)
+        finally:
+            budget.depth -= 1
+        return
+    yield from _fol_bc_or(kb, goal, frame, env)
+
+def _fol_bc_or(kb, goal, frame, env):
+    # 只有表格化的谓词才实例化子目标并求全部答案，其余谓词按深度优先逐个返回答案
+    if kb.is_tabled(goal.op):
+        yield from tabled_bc_or(kb, goal, frame, env)
+        return
+    for head, body in kb.fetch_templates_for_goal(env.walk_first_arg(goal, frame)):
+        clause_frame = env.new_frame()
+        mark = env.mark()
+        if env.unify(head, clause_frame, goal, frame):
+            yield from fol_bc_and(kb, body, clause_frame, env)
+        env.undo(mark)
 
 #与搜索
-def fol_bc_and(kb, goals, theta):
-    if theta is None:
-        pass
-    elif not goals:
-        yield theta
-    else:
-        first, rest = goals[0], goals[1:]
-        for theta1 in fol_bc_or(kb, subst(theta, first), theta):
-            for theta2 in fol_bc_and(kb, rest, theta1):
-                yield theta2
+def fol_bc_and(kb, goals, frame, env, i=0):
+    if i == 0 and len(goals) > 1 and getattr(kb, 'join_planning', False):
+        goals = plan_body(kb, goals, frame, env)
+    if i == len(goals):
+        yield
+        return
+    for _ in fol_bc_or(kb, goals[i], frame, env):
+        yield from fol_bc_and(kb, goals, frame, env, i + 1)
 
 
+#基于代价的连接顺序
+RULE_COST = 8  # 由规则推导的子目标相对于一个事实的估计代价
+
+def goal_cost(kb, goal, bound):
+    """
+    估计求解子目标goal需要尝试的子句数：谓词的子句数量（规则按RULE_COST计），
+    首参数已绑定时按首参数索引平均到每个常量，其余每个已绑定的参数再减半
+    """
+    clauses, rules, first_args = kb.predicate_stats(predicate_key(goal))
+    if clauses == 0:
+        return 0.0  # 没有子句，立即失败
+    cost = float(clauses - rules + rules * RULE_COST)
+    for position, arg in enumerate(goal.args):
+        if is_variable(arg) and arg not in bound:
+            continue
+        if position == 0 and first_args:
+            cost /= first_args
+        else:
+            cost /= 2
+    return cost
 
+def stats_signature(kb, goals):
+    """规则体中各谓词统计信息的量级（按2的幂取整），量级不变时缓存的连接顺序继续有效"""
+    signature = []
+    for goal in goals:
+        clauses, rules, first_args = kb.predicate_stats(predicate_key(goal))
+        signature.append((int(math.log2(clauses + 1)), rules, int(math.log2(first_args + 1))))
+    return tuple(signature)
 
+def plan_body(kb, goals, frame, env):
+    """
+    按代价贪心地排列规则体中的子目标：每一步选择在当前已绑定变量下估计代价最小的子目标，
+    代价相同时保持书写顺序。本层已使用过的顺序直接返回（不计算统计信息）；
+    否则按(规则体, 调用时已绑定的变量, 各谓词统计信息的量级)在根知识库的缓存中查找，
+    统计信息量级不同的各层（如各车辆的子知识库）各自有缓存项，不互相覆盖
+    """
+    bound = frozenset(var for goal in goals for var in variables(goal)
+                      if not is_variable(env.walk(var, frame)[0]))
+    key = (goals, bound)
+    order = kb._plan_memo.get(key)
+    if order is not None:
+        return order
+    cache = kb.root()._join_plans
+    shared_key = key + (stats_signature(kb, goals),)
+    order = cache.get(shared_key)
+    if order is not None:
+        kb._plan_memo[key] = order
+        return order
+    remaining = list(goals)
+    order = []
+    bound_now = set(bound)
+    while remaining:
+        best = min(range(len(remaining)), key=lambda i: (goal_cost(kb, remaining[i], bound_now), i))
+        goal = remaining.pop(best)
+        order.append(goal)
+        bound_now.update(variables(goal))
+    order = tuple(order)
+    cache[shared_key] = kb._plan_memo[key] = order
+    return order
+
+
+#基于轨迹的合一
+class Bindings:
+    """
+    可变绑定环境：所有变量绑定保存在同一个字典中，绑定值直接引用原有的项（结构共享），
+    每次绑定记入轨迹trail，回溯时按标记弹出绑定，无需复制置换字典。
+    变量以(变量, 帧号)标识，帧号0属于询问本身，帧号计数器随环境一起丢弃
+    """
+    def __init__(self):
+        self.values = {}  # (变量, 帧号) -> (绑定的项, 该项所在帧号)
+        self.trail = []  # 按绑定顺序记录的(变量, 帧号)
+        self._frames = itertools.count(1)
+        self.budget = None  # 本次询问的剩余资源（Budget），None表示不限制
+
+    def new_frame(self):
+        return next(self._frames)
+
+    def mark(self):
+        """返回当前轨迹位置，供undo回溯使用"""
+        return len(self.trail)
+
+    def undo(self, mark):
+        """撤销mark之后的所有绑定"""
+        trail, values = self.trail, self.values
+        while len(trail) > mark:
+            del values[trail.pop()]
+
+    def bind(self, var, frame, value, value_frame):
+        self.values[(var, frame)] = (value, value_frame)
+        self.trail.append((var, frame))
+
+    def walk(self, x, frame):
+        """沿变量绑定链找到x当前的值及其帧号（不展开复合项）"""
+        values = self.values
+        while is_variable(x):
+            bound = values.get((x, frame))
+            if bound is None:
+                break
+            x, frame = bound
+        return x, frame
+
+    def walk_first_arg(self, goal, frame):
+        """若goal首参数为已绑定变量，返回首参数替换为其值的浅拷贝，便于按首参数检索子句"""
+        if goal.args and is_variable(goal.args[0]):
+            value, _ = self.walk(goal.args[0], frame)
+            if value is not goal.args[0]:
+                return Expr(goal.op, None, value, *goal.args[1:])
+        return goal
+
+    def resolve(self, x, frame):
+        """
+        将x完全实例化，只在需要返回结果时调用；
+        未绑定变量若不属于帧0，则改名为"变量名#帧号"以区分不同帧中的同名变量
+        """
+        x, frame = self.walk(x, frame)
+        if is_variable(x):
+            if frame == 0:
+                return x
+            name = '{}#{}'.format(x.op, frame)
+            return Variable(name, Token(x.token.type, name, x.token.literal, x.token.line) if x.token else None)
+        if not isinstance(x, Expr) or not x.args:
+            return x
+        return Expr(x.op, None, *[self.resolve(arg, frame) for arg in x.args])
+
+    def occurs(self, var, var_frame, x, frame):
+        x, frame = self.walk(x, frame)
+        if is_variable(x):
+            return x == var and frame == var_frame
+        return isinstance(x, Expr) and any(self.occurs(var, var_frame, arg, frame) for arg in x.args)
+
+    def unify(self, x, x_frame, y, y_frame):
+        """
+        合一x与y，成功时绑定保留在环境中并返回True；失败时返回False，
+        失败前产生的部分绑定由调用者通过undo撤销。两者均为变量时将x绑定到y
+        """
+        x, x_frame = self.walk(x, x_frame)
+        y, y_frame = self.walk(y, y_frame)
+        if is_variable(x):
+            if x == y and x_frame == y_frame:
+                return True
+            if self.occurs(x, x_frame, y, y_frame):
+                return False
+            self.bind(x, x_frame, y, y_frame)
+            return True
+        if is_variable(y):
+            if self.occurs(y, y_frame, x, x_frame):
+                return False
+            self.bind(y, y_frame, x, x_frame)
+            return True
+        if x is y and not x.args:
+            return True
+        if isinstance(x, Expr) and isinstance(y, Expr):
+            if x.op != y.op or len(x.args) != len(y.args):
+                return False
+            for a, b in zip(x.args, y.args):
+                if not self.unify(a, x_frame, b, y_frame):
+                    return False
+            return True
+        return x == y
+
+
+#表格化反向链接
+class AnswerTable:
+    """某一子目标变体的答案表"""
+    def __init__(self):
+        self.answers = {}  # 答案变体键 -> 答案实例，按发现顺序保存
+        self.complete = False  # 是否已求得全部答案
+        self.recursive = False  # 求解过程中是否被递归调用
+        self.dependent = False  # 是否使用了外层未完成答案表的部分答案
+
+def variant_key(x, names=None):
+    """返回表达式的变体键：变量按首次出现顺序编号，互为变体的子目标得到相同的键"""
+    if names is None:
+        names = {}
+    if is_variable(x):
+        return ('?', names.setdefault(x, len(names)))
+    if not isinstance(x, Expr):
+        return x
+    return (x.op,) + tuple(variant_key(arg, names) for arg in x.args)
+
+def tabled_bc_or(kb, goal, frame, env):
+    """
+    表格化或搜索：同一变体子目标只求解一次，答案保存在kb.tables中供后续询问复用；
+    递归子目标只消费已有答案，由最外层的求解者迭代至不动点，避免无限递归。
+    """
+    resolved = env.resolve(goal, frame)
+    key = variant_key(resolved)
+    table = kb.tables.get(key)
+    if table is None:
+        table = AnswerTable()
+        kb.tables[key] = table
+        complete_table(kb, key, resolved, table, env.budget)
+    elif not table.complete:
+        table.recursive = True
+        # 从该表之后入栈的答案表都依赖了不完整的答案，不能标记为完成
+        depth = next(i for i, (k, _) in enumerate(kb._table_stack) if k == key)
+        for _, inner in kb._table_stack[depth + 1:]:
+            inner.dependent = True
+    for answer in list(table.answers.values()):
+        mark = env.mark()
+        # 答案放在新帧中，其中的自由变量绑定到子目标变量，而不是反过来
+        if env.unify(answer, env.new_frame(), goal, frame):
+            yield
+        env.undo(mark)
+
+def complete_table(kb, key, goal, table, budget=None):
+    """求解goal的全部答案填入table；若求解中发生递归调用则重复求解直至答案不再增加"""
+    kb._table_stack.append((key, table))
+    env = Bindings()
+    env.budget = budget
+    try:
+        while True:
+            table.recursive = False
+            found = len(table.answers)
+            for head, body in kb.fetch_templates_for_goal(goal):
+                clause_frame = env.new_frame()
+                mark = env.mark()
+                if env.unify(head, clause_frame, goal, 0):
+                    for _ in fol_bc_and(kb, body, clause_frame, env):
+                        answer = env.resolve(goal, 0)
+                        table.answers.setdefault(variant_key(answer), answer)
+                env.undo(mark)
+            if not table.recursive or len(table.answers) == found:
+                break
+    finally:
+        kb._table_stack.pop()
+    if table.dependent:
+        # 依赖外层未完成的答案表，丢弃本表，待外层下一轮迭代时重新求解
+        del kb.tables[key]
+    else:
+        table.complete = True
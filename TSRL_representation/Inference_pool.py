@@ -0,0 +1,165 @@
+"""
+推理工作进程池
+常驻的TSRL推理工作进程，进程启动时加载一次推理引擎并构建一次规则知识库，之后通过管道接收(事实, 询问)任务并返回置换，
+避免每条规则每次推理都启动Python解释器、重新导入模块和shell的开销；规则源代码只在启动工作进程时传递一次。
+多辆车的推理任务可以同时提交，由各工作进程并行完成。
+"""
+import atexit
+import os
+import sys
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+
+# 添加当前目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from TSRL import TSRLSession
+import Inference_engine
+from Inference_engine import AskLimits, is_unknown
+
+_rule_bases = {}  # 规则源代码 -> 冻结的规则知识库（每个进程各自缓存）
+_worker_rules = None  # 工作进程启动时构建的规则知识库
+
+
+def instantiate_head(head: str, bindings: Dict[str, str]) -> Optional[str]:
+    """将置换应用到规则头部，得到决策，例如 {'x': '0'} + "LetStop(x)" -> "LetStop(0)" """
+    if '(' in head and ')' in head:
+        head_prefix = head.split('(')[0]
+        head_var = head[head.find('(')+1:head.find(')')]
+        # 检查head_var是否在置换中
+        if head_var in bindings:
+            return f"{head_prefix}({bindings[head_var]})"
+    return None
+
+
+def rule_base(rules: str) -> Inference_engine.FolKB:
+    """返回由规则源代码构建的冻结知识库，同一规则源代码在每个进程中只解析一次"""
+    kb = _rule_bases.get(rules)
+    if kb is None:
+        # 规则文件重新编译后旧的规则知识库不再使用
+        _rule_bases.clear()
+        kb = _rule_bases[rules] = TSRLSession.build_base(rules)
+    return kb
+
+
+def infer_rules(facts, rules, heads: List[str], limits: Optional[AskLimits] = None, join_planning: Optional[bool] = None):
+    """
+    单次推理（可在工作进程中执行）：事实只解析、告知一次，加载到规则知识库之上的同一个会话中，
+    再按优先级（顺序）依次询问各个规则头部，返回第一个能得到决策的头部；会话用完即丢弃
+    :param facts: 事实的TSRL源代码（消息历史）或已解析的语句列表
+    :param rules: 规则源代码，或已编译的冻结规则知识库（如RuleBase.kb）
+    :param heads: 按优先级排列的规则头部，例如["LetStopBeforeJunction(x)", "KeepLane(x)"]
+    :param limits: 每个头部询问的资源上限（AskLimits）
+    :param join_planning: 是否按代价重排规则体的求解顺序，None表示沿用规则知识库的设置
+    :return: (头部序号, 置换, 决策)；都不成立时返回None；资源耗尽时返回Inference_engine.Unknown
+    """
+    base = rules if isinstance(rules, Inference_engine.FolKB) else rule_base(rules)
+    session = TSRLSession(base=base)
+    if join_planning is not None:
+        session.kb.join_planning = join_planning
+    session.tell(facts)
+    return ask_heads(session, heads, limits)
+
+
+def ask_heads(session: TSRLSession, heads: List[str], limits: Optional[AskLimits] = None):
+    """
+    按优先级依次在会话中询问各个规则头部，返回第一个能得到决策的(头部序号, 置换, 决策)，都不成立时返回None；
+    某个头部的询问资源耗尽时无法确定优先级更低的头部能否作为决策，返回Unknown
+    """
+    for index, head in enumerate(heads):
+        bindings = session.ask_one(head, limits)
+        if bindings is None:
+            continue
+        if is_unknown(bindings):
+            return bindings
+        decision = instantiate_head(head, bindings)
+        if decision:
+            return index, bindings, decision
+    return None
+
+
+def completed_future(fn, *args) -> Future:
+    """在当前进程中立即执行fn(*args)，返回已完成的Future（与进程池提交的任务同样处理结果和异常）"""
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def _init_worker(rules: str = ""):
+    """工作进程初始化：构建一次规则知识库，并预先执行一次推理，使模块导入等开销在进程启动时完成"""
+    global _worker_rules
+    _worker_rules = rule_base(rules)
+    infer_rules("Ready(0);", TSRLSession.build_base("Warm(x):-Ready(x);"), ["Warm(x)"])
+
+
+def _infer_in_worker(facts, heads: List[str], limits: Optional[AskLimits] = None, join_planning: Optional[bool] = None):
+    """在工作进程中以启动时构建的规则知识库推理（参数同infer_rules）"""
+    return infer_rules(facts, _worker_rules, heads, limits, join_planning)
+
+
+class InferencePool:
+    """
+    常驻推理进程池
+    用法：
+        pool = InferencePool(max_workers=4)
+        future = pool.submit(facts, rule_base.source, [head, ...])
+        result = future.result()  # (头部序号, 置换, 决策)、None 或 Unknown（资源耗尽）
+    max_workers=0时不启动工作进程，直接在当前进程中推理
+    规则源代码在启动工作进程时通过初始化函数传递一次，之后的任务只传递事实和询问；
+    提交的规则源代码变化时（规则文件重新编译后）以新的规则重新启动工作进程
+    """
+    def __init__(self, max_workers: Optional[int] = None):
+        if max_workers is None:
+            max_workers = max(1, min(4, (os.cpu_count() or 1) - 1))
+        self.max_workers = max_workers
+        self._executor = None
+        self._rules = None  # 工作进程加载的规则源代码
+
+    def _get_executor(self, rules: str) -> Optional[ProcessPoolExecutor]:
+        if self.max_workers <= 0:
+            return None
+        if self._executor is not None and rules != self._rules:
+            # 已提交的任务仍按旧规则完成，之后的任务由加载新规则的工作进程执行
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker, initargs=(rules,))
+            self._rules = rules
+        return self._executor
+
+    def submit(self, facts: str, rules: str, heads: List[str], limits: Optional[AskLimits] = None,
+               join_planning: Optional[bool] = None) -> Future:
+        """提交一个推理任务（参数同infer_rules，规则以源代码传递，工作进程只在启动时接收一次），立即返回Future"""
+        executor = self._get_executor(rules)
+        if executor is not None:
+            try:
+                return executor.submit(_infer_in_worker, facts, heads, limits, join_planning)
+            except (BrokenProcessPool, RuntimeError):
+                # 工作进程异常退出或进程池已关闭，重建进程池后重试一次
+                self.shutdown()
+                executor = self._get_executor(rules)
+                return executor.submit(_infer_in_worker, facts, heads, limits, join_planning)
+        # 不使用工作进程，在当前进程中推理
+        return completed_future(infer_rules, facts, rules, heads, limits, join_planning)
+
+    def shutdown(self, wait: bool = False):
+        """关闭工作进程"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+
+_shared_pool = None
+
+
+def get_shared_pool(max_workers: Optional[int] = None) -> InferencePool:
+    """获取进程内共享的推理进程池（首次调用时创建，程序退出时自动关闭）"""
+    global _shared_pool
+    if _shared_pool is None:
+        _shared_pool = InferencePool(max_workers)
+        atexit.register(_shared_pool.shutdown)
+    return _shared_pool
@@ -13,8 +13,6 @@ import os
 # 添加当前目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from networkx import selfloop_edges
-
 import Expr
 import Stmt
 import Inference_engine
@@ -31,10 +29,11 @@ from typing import Any
 
 class Interpreter(Expr.ExprVisitor, Stmt.StmtVisitor):
 
-    def __init__(self):
-        self.kb = Inference_engine.FolKB()  # 存储知识库
+    def __init__(self, kb: Inference_engine.FolKB = None):
+        self.kb = kb if kb is not None else Inference_engine.FolKB()  # 存储知识库
         self.subset = {} # 储存置换表
         self.output_file = sys.stdout  # 添加这行初始化输出文件
+        self.timestamp = None  # 告知事实的仿真时间戳，用于按谓词有效期淘汰过期事实
 
     def set_output_file(self, file_path):  # 添加此方法
         """设置输出文件路径"""
@@ -64,7 +63,7 @@ class Interpreter(Expr.ExprVisitor, Stmt.StmtVisitor):
         """
         执行表达式语句，目的是将可行的逻辑语句载入知识库kb中
         """
-        self.kb.tell(self.__evaluate__(stmt.expression))
+        self.kb.tell(self.__evaluate__(stmt.expression), timestamp=self.timestamp)
         return None
 
     def visitPrintStmt(self,stmt:Stmt.Print):
@@ -79,33 +78,81 @@ class Interpreter(Expr.ExprVisitor, Stmt.StmtVisitor):
     def visitAskStmt(self, stmt):
         """
         执行询问语句，目的是推断ASK后的语句是否为真，并返回可能的置换,并写入指定的输出文件中
+        知识库设置了资源上限（limits）且询问未能在上限内完成时，输出Unknown
         """
-        Dict = self.kb.ask(self.__evaluate__(stmt.expression))
-        d={}
-        if Dict is not False:
-            for key, value in Dict.items():
-                if str(key)[:2] == "v_" and len(str(key))>9: #这里对于无关变量须在斟酌
-                    pass
-                else:
-                    d[str(key)]=str(value)
-            # 使用self.output_file而不是硬编码的'output.txt'
-            # 检查output_file是否可寻址，避免对sys.stdout调用seek方法
-            if hasattr(self.output_file, 'seekable') and self.output_file.seekable():
-                self.output_file.seek(0)
-                self.output_file.truncate()
+        try:
+            d = Inference_engine.first(self.answers(self.__evaluate__(stmt.expression)))
+        except Inference_engine.BudgetExceeded as e:
+            d = Inference_engine.Unknown(e.reason)
+        # 使用self.output_file而不是硬编码的'output.txt'
+        # 检查output_file是否可寻址，避免对sys.stdout调用seek方法
+        if hasattr(self.output_file, 'seekable') and self.output_file.seekable():
+            self.output_file.seek(0)
+            self.output_file.truncate()
+        if Inference_engine.is_unknown(d):
+            self.output_file.write('Unknown')
+            self.output_file.flush()
+            print(d)
+        elif d is not None:
             self.output_file.write(json.dumps(d, ensure_ascii=False))
             self.output_file.flush()
             print(d)
         else:
-            # 使用self.output_file而不是硬编码的'output.txt'
-            # 检查output_file是否可寻址，避免对sys.stdout调用seek方法
-            if hasattr(self.output_file, 'seekable') and self.output_file.seekable():
-                self.output_file.seek(0)
-                self.output_file.truncate()
             self.output_file.write('False')
             self.output_file.flush()
-            print(Dict)
+            print(False)
+
+    def visitAskBatchStmt(self, stmt):
+        """
+        执行批量询问语句，各目标在同一知识库上一起求解（共享表和索引），
+        每个目标的第一个置换（或False，资源耗尽时为Unknown）按目标顺序各占一行，一次写入输出文件
+        """
+        goals = [self.__evaluate__(expression) for expression in stmt.expressions]
+        results = self.ask_batch(goals)
+        if hasattr(self.output_file, 'seekable') and self.output_file.seekable():
+            self.output_file.seek(0)
+            self.output_file.truncate()
+        lines = ['Unknown' if Inference_engine.is_unknown(d) else json.dumps(d, ensure_ascii=False) if d is not None else 'False'
+                 for d in results]
+        self.output_file.write('\n'.join(lines))
+        self.output_file.flush()
+        for d in results:
+            print(d if d is not None else False)
+
+    def answers(self, goal, limits=None):
+        """
+        询问goal，逐个返回使其成立的置换，置换以{变量名: 值}的字符串字典表示
+        :param limits: 资源上限（AskLimits），超出时抛出BudgetExceeded；None时使用知识库的limits
+        """
+        query_vars = Inference_engine.variables(goal)
+        for theta in self.kb.ask_generator(goal, limits=limits):
+            yield self.__bindings__(theta, query_vars)
+
+    def ask_batch(self, goals, limit=1, limits=None):
+        """
+        一起询问多个goal，返回每个goal的置换列表（limit=1时为第一个置换，不成立时为None）
+        资源耗尽的goal对应Unknown
+        :param limit: 每个goal最多求的置换数量，None表示全部
+        :param limits: 每个goal的资源上限（AskLimits），None时使用知识库的limits
+        """
+        results = [[] for _ in goals]
+        query_vars = [Inference_engine.variables(goal) for goal in goals]
+        for index, theta in self.kb.ask_batch(goals, limit=limit, limits=limits):
+            if Inference_engine.is_unknown(theta):
+                results[index] = theta
+            else:
+                results[index].append(self.__bindings__(theta, query_vars[index]))
+        if limit == 1:
+            return [answers if Inference_engine.is_unknown(answers) else answers[0] if answers else None
+                    for answers in results]
+        return results
 
+    def __bindings__(self, theta, query_vars):
+        """
+        置换中询问本身的变量 -> 值的字符串字典；其他策略的置换中可能含有的事实中的变量、
+        以及未绑定（绑定到自身）的变量不输出，与反向链接一致
+        """
+        return {str(key): str(value) for key, value in theta.items() if key in query_vars and value != key}
 
     def visitImplicationExpr(self, expr):
         """
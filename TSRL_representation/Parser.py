@@ -3,12 +3,19 @@ import os
 # 添加当前目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+import itertools
+from typing import Iterable, Iterator, List
+
 import errorHanding
 from Tokentype import *
 import Expr 
 import Stmt
 
 
+_EOF = TokenType.EOF
+READ_BATCH = 1024  # 流式语法分析时每批从词法单元迭代器读入的词法单元数
+
+
 class ParseError(Exception):
     pass
     # def __init__(self, token, message):
@@ -16,18 +23,32 @@ class ParseError(Exception):
     #     self.token = token
 
 class Parser:
-    def __init__(self, tokens: List[Token]):
-        self.tokens = tokens
+    """
+    语法分析器：tokens可以是词法单元列表，也可以是按需产生词法单元的迭代器（如Scanner.iter_tokens()），
+    后者由statements()逐条产生语句，已解析完的词法单元随即丢弃，不必先得到全部词法单元
+    """
+    def __init__(self, tokens: Iterable[Token]):
+        if isinstance(tokens, list):
+            self.tokens = tokens
+            self._pending = None
+        else:
+            self.tokens = []
+            self._pending = iter(tokens)  # 尚未读入的词法单元
         self.current = 0
 
     def parse(self)->List[Stmt.Stmt]:
-        statements: List[Stmt.Stmt] = []
+        return list(self.statements())
+
+    def statements(self) -> Iterator[Stmt.Stmt]:
+        """逐条解析并产生语句，语法错误的语句在报告后跳过"""
         while not self.is_at_end():
             decl = self.__declaration__()
             if decl is not None:
-                statements.append(decl)
-
-        return statements
+                yield decl
+            if self._pending is not None and self.current > READ_BATCH:
+                # 已解析的词法单元超过一批时才丢弃（只保留前一个词法单元供previous()使用），避免每条语句都移动列表
+                del self.tokens[:self.current - 1]
+                self.current = 1
         # try:
         #     return self.__expression__()
         # except ParseError as e:
@@ -57,7 +78,13 @@ class Parser:
 
     def __ASKStatement__(self) ->Stmt.Stmt:
         value = self.__expression__()
+        # 以逗号分隔的多个询问目标为批量询问
+        values = [value]
+        while self.match(TokenType.COMMA):
+            values.append(self.__expression__())
         self.consume(TokenType.SEMICOLON, "Expect ';' after value.")
+        if len(values) > 1:
+            return Stmt.AskBatch(values)
         return Stmt.Ask(value)
 
     def __printStatement__(self) ->Stmt.Stmt:
@@ -223,32 +250,48 @@ class Parser:
     # 其他解析方法...
 
     def peek(self) -> Token:
-        return self.tokens[self.current]
+        try:
+            return self.tokens[self.current]
+        except IndexError:
+            self.__read__(self.current)
+            return self.tokens[self.current]
 
     def peek_next(self):
         if self.current + 1 >= len(self.tokens):
-            return '\0'
+            self.__read__(self.current + 1)
+            if self.current + 1 >= len(self.tokens):
+                return '\0'
         return self.tokens[self.current + 1]
 
+    def __read__(self, index):
+        """从词法单元迭代器中成批读入，直到读入第index个词法单元或迭代器结束"""
+        if self._pending is None:
+            return
+        while len(self.tokens) <= index:
+            count = len(self.tokens)
+            self.tokens.extend(itertools.islice(self._pending, READ_BATCH))
+            if len(self.tokens) == count:
+                self._pending = None
+                return
+
     def advance(self) -> Token:
         if not self.is_at_end():
             self.current += 1
         return self.previous()
 
     def is_at_end(self) -> bool:
-        return self.peek().type == TokenType.EOF
+        return self.peek().type is _EOF
         #return self.current >= len(self.tokens)
 
     def check(self, type: TokenType) -> bool :
-        if self.is_at_end():
-            return False
-        return self.peek().type == type
+        token_type = self.peek().type
+        return token_type is type and token_type is not _EOF
 
     def match(self, *types: TokenType) -> bool:
-        for type in types:
-            if self.check(type):
-                self.advance()
-                return True
+        token_type = self.peek().type
+        if token_type in types and token_type is not _EOF:
+            self.current += 1
+            return True
         return False
 
     def previous(self) -> Token:
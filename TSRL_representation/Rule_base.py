@@ -0,0 +1,294 @@
+"""
+编译后的规则库
+规则文件（如TSRL_inference/Rules/Roadsys_rule.txt）只做一次词法分析和语法分析，编译为抽象语法树并校验，
+同时预先计算规则头部谓词 -> 规则体谓词的依赖图；之后只有规则文件的修改时间变化时才重新编译。
+全部合法规则告知到一个冻结的知识库中，各车辆的推理会话在其上只告知自己的事实。
+同一规则文件的规则库可通过RuleBase.shared(path)在各决策器之间共享。
+RuleTrigger在消息到达时增量地维护各规则的条件满足情况，只在规则变为满足时标记车辆需要重新决策。
+"""
+import os
+import sys
+from collections import Counter, deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# 添加当前目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import errorHanding
+import Expr
+import Inference_engine
+import Stmt
+from Tokentype import TokenType
+from TSRL import TSRL, TSRLSession
+
+
+def message_predicate(content: str) -> str:
+    """消息内容的谓词，例如"HasNextJunction(0,7);" -> "HasNextJunction" """
+    return content.strip().rstrip(';').split('(')[0].strip()
+
+
+def term_source(term: Expr.Expr) -> str:
+    """项的TSRL源代码，字符串常量加引号，例如Predicate("P", x, "a b") -> 'P(x,"a b")' """
+    if isinstance(term, Expr.Constant) and term.token is not None and term.token.type == TokenType.STRING:
+        return '"{}"'.format(term.op)
+    if term.args:
+        return '{}({})'.format(term.op, ','.join(term_source(arg) for arg in term.args))
+    return term.op
+
+
+def clause_source(clause: Expr.Expr) -> str:
+    """限定子句的TSRL源代码（一条语句，不含注释），重新解析得到相同的子句"""
+    body, head = Inference_engine.parse_definite_clause(clause)
+    if not body:
+        return '{};'.format(term_source(head))
+    return '{}:-{};'.format(term_source(head), ','.join(term_source(atom) for atom in body))
+
+
+class CompiledRule:
+    """
+    一条编译后的规则
+    source: 规则的TSRL源代码（由子句生成，每条规则一条语句，不含注释）
+    clause: 规则的限定子句（已求值的抽象语法树）
+    head: 规则头部谓词；body: 规则体谓词元组
+    """
+    __slots__ = ('source', 'line', 'clause', 'head', 'body')
+
+    def __init__(self, source: str, line: int, clause: Expr.Expr):
+        self.source = source
+        self.line = line
+        self.clause = clause
+        body, head = Inference_engine.parse_definite_clause(self.clause)
+        self.head = head
+        self.body = tuple(body)
+
+    @property
+    def head_text(self) -> str:
+        """规则头部文本，例如"LetStopBeforeJunction(x)" """
+        return str(self.head)
+
+    @property
+    def head_predicate(self) -> str:
+        return self.head.op
+
+    @property
+    def body_predicates(self) -> Tuple[str, ...]:
+        return tuple(atom.op for atom in self.body)
+
+    @property
+    def conditions(self) -> List[str]:
+        """规则体中的各个条件文本，例如["HasNextJunction(x, y)", "Congestion(y)"]"""
+        return [str(atom) for atom in self.body]
+
+    def __repr__(self):
+        return self.source
+
+
+class RuleBase:
+    """
+    从规则文件编译的规则库，规则的优先级即其在规则文件中的顺序
+    用法：
+        rule_base = RuleBase.shared(rules_file)
+        rule_base.refresh()  # 规则文件修改后才重新编译
+        for rule in rule_base.rules:
+            print(rule.head_text, rule.conditions)
+    """
+    _shared: Dict[str, 'RuleBase'] = {}
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rules: List[CompiledRule] = []
+        self.kb: Inference_engine.FolKB = Inference_engine.FolKB().freeze()  # 包含全部规则的冻结知识库
+        self.source = ""  # 全部合法规则的源代码，可在其他进程中重建同样的知识库
+        self.errors: List[str] = []  # 最近一次编译时的错误信息
+        self.warnings: List[str] = []  # 最近一次编译时的警告信息（规则仍然有效）
+        self.dependencies: Dict[str, Set[str]] = {}  # 依赖图：头部谓词 -> 规则体谓词集合
+        self.dependents: Dict[str, Set[str]] = {}  # 反向依赖图：规则体谓词 -> 头部谓词集合
+        self.predicate_index: Dict[str, List[int]] = {}  # 判别索引：规则体谓词 -> 规则体中含该谓词的规则序号
+        self.recursive: Set[str] = set()  # 递归谓词：在依赖图中能回到自身的头部谓词
+        self._required: List[int] = []  # 每条规则的规则体中不同谓词的数量
+        self.version = 0  # 每次重新编译后加一
+        self.mtime: Optional[float] = None
+
+    @classmethod
+    def shared(cls, path: str) -> 'RuleBase':
+        """返回该规则文件共享的规则库（同一进程内只创建一次）"""
+        key = os.path.normcase(os.path.abspath(path))
+        rule_base = cls._shared.get(key)
+        if rule_base is None:
+            rule_base = cls._shared[key] = cls(path)
+        return rule_base
+
+    def refresh(self) -> bool:
+        """规则文件的修改时间变化时重新编译，返回是否重新编译"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if self.version and mtime == self.mtime:
+            return False
+        self.mtime = mtime
+        if mtime is None:
+            self._compile("")
+            self.errors = [f"Rules file not found: {self.path}"]
+        else:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._compile(f.read())
+        return True
+
+    def _compile(self, source: str):
+        """编译规则源代码：语法分析、校验，并建立依赖图"""
+        rules = []
+        errors = []
+        warnings = []
+        had_error = errorHanding.hadError
+        errorHanding.hadError = False
+        statements = TSRL.parse(source)
+        if errorHanding.hadError:
+            errors.append(f"Syntax error in rules file: {self.path}")
+        errorHanding.hadError = had_error
+
+        lines = source.splitlines()
+        session = TSRLSession()
+        for statement in statements:
+            expression = getattr(statement, 'expression', None)
+            if not isinstance(statement, Stmt.Expression) or not isinstance(expression, Expr.Implication):
+                errors.append(f"Not a rule: {expression}")
+                continue
+            line = expression.token.line
+            count = len(session.kb.clauses)
+            session.tell([statement])
+            if len(session.kb.clauses) == count:
+                text = lines[line - 1].strip() if 0 < line <= len(lines) else str(expression)
+                errors.append(f"Not a definite clause at line {line}: {text}")
+                continue
+            clause = session.kb.clauses[-1]
+            rule = CompiledRule(clause_source(clause), line, clause)
+            # 规则文件约定相同的谓词不同时出现在推理前提和结论中；递归规则仍然有效（由表格化求解保证终止）
+            if rule.head_predicate in rule.body_predicates:
+                warnings.append(f"Head predicate also appears in body at line {line}: {rule.source}")
+            rules.append(rule)
+
+        dependencies = {}
+        dependents = {}
+        predicate_index = {}
+        required = []
+        for index, rule in enumerate(rules):
+            predicates = set(rule.body_predicates)
+            dependencies.setdefault(rule.head_predicate, set()).update(predicates)
+            for predicate in predicates:
+                dependents.setdefault(predicate, set()).add(rule.head_predicate)
+                predicate_index.setdefault(predicate, []).append(index)
+            required.append(len(predicates))
+
+        self.rules = rules
+        self.kb = session.kb.freeze()
+        self.source = "\n".join(rule.source for rule in rules)
+        self.errors = errors
+        self.warnings = warnings
+        self.dependencies = dependencies
+        self.recursive = Inference_engine.recursive_predicates(dependencies)
+        self.dependents = dependents
+        self.predicate_index = predicate_index
+        self._required = required
+        self.version += 1
+
+    def candidate_rules(self, predicates: Iterable[str]) -> List[CompiledRule]:
+        """
+        返回规则体中的谓词全部出现在predicates中的规则（按规则文件中的顺序）
+        只遍历predicates中各谓词在判别索引中对应的规则，与规则总数和条件数量无关
+        """
+        counts = {}
+        for predicate in set(predicates):
+            for index in self.predicate_index.get(predicate, ()):
+                counts[index] = counts.get(index, 0) + 1
+        return [self.rules[index] for index in sorted(counts) if counts[index] == self._required[index]]
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def __len__(self):
+        return len(self.rules)
+
+
+class RuleTrigger:
+    """
+    基于计数的增量规则触发器（每个交通主体一个）
+    维护最近window条消息中各谓词的出现次数，以及每条规则的规则体中已出现的不同谓词数量；
+    规则头部谓词（可由其他规则推出）在计数时视为总是出现，使依赖其他规则结论的规则同样能被触发；
+    一条消息到达或移出窗口时只重新检查规则体或头部含有该谓词的规则，
+    规则变为满足或不再满足、已满足的规则的相关事实增加或减少、消息与某条规则的头部相同时标记需要重新决策
+    用法：
+        trigger = RuleTrigger(rule_base, window=40)
+        trigger.add("HasNextJunction(0,7);")  # 每条进入消息历史的消息调用一次
+        if trigger.take():  # 返回并清除标记
+            ...  # 重新推理
+    """
+    def __init__(self, rule_base: RuleBase, window: Optional[int] = None):
+        self.rule_base = rule_base
+        self.window = window if window is not None and window > 0 else None
+        self._predicates = deque()  # 窗口内各消息的谓词（按到达顺序）
+        self._counts = Counter()  # 窗口内谓词 -> 出现次数
+        self._version = None  # 计数对应的规则库版本
+        self._satisfied: List[int] = []  # 每条规则的规则体中已出现的不同谓词数量
+        self._head_index: Dict[str, List[int]] = {}  # 头部谓词 -> 规则序号
+        self._derived: Set[str] = set()  # 可由规则推出的谓词（规则头部谓词）
+        self.dirty = True  # 是否需要重新决策，首次决策前总是需要
+
+    def _rebuild(self):
+        """规则库重新编译后按当前窗口重新计数"""
+        rule_base = self.rule_base
+        self._version = rule_base.version
+        self._head_index = {}
+        for index, rule in enumerate(rule_base.rules):
+            self._head_index.setdefault(rule.head_predicate, []).append(index)
+        self._derived = set(self._head_index)
+        self._satisfied = [len(self._derived.intersection(rule.body_predicates)) for rule in rule_base.rules]
+        for predicate in self._counts:
+            if predicate in self._derived:
+                continue
+            for index in rule_base.predicate_index.get(predicate, ()):
+                self._satisfied[index] += 1
+
+    def _is_satisfied(self, index: int) -> bool:
+        return self._satisfied[index] == self.rule_base._required[index]
+
+    def _touch(self, predicate: str, delta: int):
+        """谓词predicate的出现次数变化delta，按规则的满足情况决定是否标记"""
+        count = self._counts[predicate]
+        self._counts[predicate] = count + delta
+        if self._counts[predicate] <= 0:
+            del self._counts[predicate]
+        if self._version != self.rule_base.version:
+            return  # 计数将在take()时按新规则库重建
+        # 谓词首次出现或不再出现时才改变规则体的满足计数（可推出的谓词总是计为出现）
+        step = 0
+        if (count == 0 or count + delta == 0) and predicate not in self._derived:
+            step = 1 if delta > 0 else -1
+        for index in self.rule_base.predicate_index.get(predicate, ()):
+            was_satisfied = self._is_satisfied(index)
+            self._satisfied[index] += step
+            # 规则的满足情况改变，或已满足的规则的事实增加、减少（窗口内仍有同一谓词的其他消息时置换也可能改变）
+            if was_satisfied or self._is_satisfied(index):
+                self.dirty = True
+        # 与规则头部相同的事实可以直接回答对该头部的询问
+        if predicate in self._head_index:
+            self.dirty = True
+
+    def add(self, content: str):
+        """一条消息进入消息历史"""
+        if not content or not content.strip():
+            return
+        predicate = message_predicate(content)
+        self._predicates.append(predicate)
+        self._touch(predicate, 1)
+        if self.window is not None and len(self._predicates) > self.window:
+            self._touch(self._predicates.popleft(), -1)
+
+    def take(self) -> bool:
+        """返回是否需要重新决策并清除标记；规则库重新编译后总是需要"""
+        if self._version != self.rule_base.version:
+            self._rebuild()
+            self.dirty = True
+        dirty = self.dirty
+        self.dirty = False
+        return dirty
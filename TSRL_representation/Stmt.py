@@ -24,6 +24,9 @@ class StmtVisitor(ABC):
     def visitAskStmt(self, stmt): #stmt:Print
         pass
 
+    def visitAskBatchStmt(self, stmt): #stmt:AskBatch
+        pass
+
     def visitPrintStmt(self, stmt): #stmt:Print
         pass
     def visitTellStmt(self, stmt): #stmt:Print
@@ -51,6 +54,14 @@ class Ask(Stmt):
     def accept(self, visitor: StmtVisitor):
         return visitor.visitAskStmt(self)
 
+class AskBatch(Stmt):
+    """批量询问语句 ASK goal1, goal2, ...;"""
+    def __init__(self, expressions:List[Expr.Expr]):
+        self.expressions = expressions
+
+    def accept(self, visitor: StmtVisitor):
+        return visitor.visitAskBatchStmt(self)
+
 
 class Print(Stmt):
     def __init__(self, expression:Expr):
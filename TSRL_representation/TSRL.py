@@ -11,29 +11,34 @@ from errorHanding import *
 from Interpreter import Interpreter
 import Inference_engine
 import Expr
+import Stmt
 
 class TSRL:
-    # 在类级别定义TSRL_interpreter，确保在任何地方都可以访问
-    TSRL_interpreter = Interpreter()
 
     @staticmethod
     def main(input_file, output_file=None):
         """
         主函数，接收输入文件路径和可选的输出文件路径
+        每次调用使用独立的解释器（独立的知识库），不会累积之前调用告知的子句
         :param input_file: 输入文件路径
         :param output_file: 输出文件路径（可选）
         """
+        interpreter = Interpreter()
         if output_file:
             # 设置输出文件路径
-            TSRL.TSRL_interpreter.set_output_file(output_file)
-        TSRL.__run_file(input_file)
+            interpreter.set_output_file(output_file)
+        try:
+            TSRL.__run_file(input_file, interpreter)
+        finally:
+            if isinstance(output_file, str):
+                interpreter.output_file.close()
 
     @staticmethod
-    def __run_file(file_path):
+    def __run_file(file_path, interpreter):
         try:
             with open(file_path, 'rb') as file:
                 bytes_data = file.read()
-            TSRL.__run(bytes_data.decode('utf-8'))  
+            TSRL.__run(bytes_data.decode('utf-8'), interpreter)
             if hadError: sys.exit(65)
         except IOError as e:
             print(f"An error occurred while reading the file: {e}")
@@ -41,29 +46,143 @@ class TSRL:
     @staticmethod
     def __run_prompt():
         global hadError
+        # 交互模式下各行输入共享同一个解释器
+        interpreter = Interpreter()
         try:
             while True:
                 user_input = input("> ")
                 if user_input.strip() == "":
                     break
-                TSRL.__run(user_input)
+                TSRL.__run(user_input, interpreter)
                 hadError = False
         except EOFError:
             pass  # 捕获EOFError以处理用户中断输入的情况（例如Ctrl+D）
 
     @staticmethod
-    def __run(source):
-        scanner = Scanner(source)
-        tokens = scanner.scan_tokens()
-        parser = Parser(tokens)
-        statements = parser.parse() 
-        
-        # 使用类级别的TSRL_interpreter
+    def parse(source):
+        """对TSRL源代码进行词法分析和语法分析，返回语句列表"""
+        return list(TSRL.iter_parse(source))
+
+    @staticmethod
+    def iter_parse(source):
+        """流式词法分析和语法分析：词法单元按需产生，逐条返回语句"""
+        return Parser(Scanner(source).iter_tokens()).statements()
+
+    @staticmethod
+    def parse_expression(source):
+        """将单个TSRL表达式（如"LetStop(x)"，可省略结尾分号）解析为表达式"""
+        statements = TSRL.parse(source.strip().rstrip(';') + ';')
+        if len(statements) != 1 or not hasattr(statements[0], 'expression'):
+            raise ValueError(f"Not a single TSRL expression: {source}")
+        return statements[0].expression
+
+    @staticmethod
+    def __run(source, interpreter):
+        # 语句逐条解析、逐条执行
+        statements = TSRL.iter_parse(source)
+
         # 如果没有设置输出文件，则使用默认路径
-        if not TSRL.TSRL_interpreter.output_file:
+        if not interpreter.output_file:
             output_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Infer_output", "output.txt")
-            TSRL.TSRL_interpreter.set_output_file(output_file_path)
-        TSRL.TSRL_interpreter.interpret(statements)
+            interpreter.set_output_file(output_file_path)
+        interpreter.interpret(statements)
+
+
+class TSRLSession:
+    """
+    进程内TSRL会话：直接在内存中告知事实/规则并询问，以Python字典返回置换，不读写任何文件
+    用法：
+        session = TSRLSession()
+        session.tell("HasNextJunction(0,7); Congestion(7);")
+        session.tell("LetStopBeforeJunction(x):-HasNextJunction(x,y),Congestion(y);")
+        for bindings in session.ask("LetStopBeforeJunction(x)"):
+            print(bindings)  # {'x': '0'}
+    共享规则库：
+        rules = TSRLSession.build_base("LetStopBeforeJunction(x):-HasNextJunction(x,y),Congestion(y);")
+        session = TSRLSession(base=rules)  # O(1)，事实只告知到本会话的子知识库中
+    """
+    def __init__(self, interpreter: Interpreter = None, base: Inference_engine.FolKB = None):
+        """
+        :param interpreter: 使用已有的解释器；不指定时使用独立的新解释器（独立的知识库）
+        :param base: 只读的共享知识库（如规则库），会话在其上创建子知识库，告知的子句不会写入base
+        """
+        if interpreter is None:
+            interpreter = Interpreter(base.overlay() if base is not None else None)
+        self.interpreter = interpreter
+
+    @staticmethod
+    def build_base(source) -> Inference_engine.FolKB:
+        """告知source中的子句并返回冻结的知识库，可作为多个会话共享的base"""
+        session = TSRLSession()
+        session.tell(source)
+        return session.kb.freeze()
+
+    @property
+    def kb(self):
+        return self.interpreter.kb
+
+    def snapshot(self):
+        """
+        冻结当前会话的知识库，返回在其上新建的子会话（O(1)）；
+        在子会话中告知的子句不影响当前会话，丢弃子会话即可回到快照时的状态
+        """
+        return TSRLSession(base=self.kb)
+
+    def tell(self, source, timestamp=None):
+        """
+        告知事实或规则
+        :param source: TSRL源代码字符串、已解析的语句列表，或表达式/表达式列表
+        :param timestamp: 事实的仿真时间戳，设置了有效期（set_ttl）的谓词的事实在过期后由expire()淘汰
+        """
+        if isinstance(source, str):
+            statements = TSRL.iter_parse(source)
+        elif isinstance(source, (Expr.Expr, Stmt.Stmt)):
+            statements = [source]
+        else:
+            statements = source
+        statements = (Stmt.Expression(s) if isinstance(s, Expr.Expr) else s for s in statements)
+        self.interpreter.timestamp = timestamp
+        try:
+            self.interpreter.interpret(statements)
+        finally:
+            self.interpreter.timestamp = None
+
+    def set_ttl(self, predicate, ttl):
+        """设置谓词的事实有效期（仿真秒），predicate为'*'时设置其余谓词的默认有效期，ttl为None时取消"""
+        if ttl is None:
+            self.kb.ttl.pop(predicate, None)
+        else:
+            self.kb.ttl[predicate] = ttl
+
+    def expire(self, now):
+        """批量淘汰仿真时间now之前过期的事实，返回淘汰数量"""
+        return self.kb.expire(now)
+
+    def ask(self, goal, limits=None):
+        """
+        询问goal，返回置换字典{变量名: 值}的迭代器
+        :param goal: TSRL表达式字符串（如"LetStop(x)"）或已解析的表达式
+        :param limits: 资源上限（Inference_engine.AskLimits），超出时迭代器抛出BudgetExceeded；None时使用知识库的limits
+        """
+        if isinstance(goal, str):
+            goal = TSRL.parse_expression(goal)
+        return self.interpreter.answers(goal, limits)
+
+    def ask_one(self, goal, limits=None):
+        """返回第一个置换字典；goal不成立时返回None，资源耗尽时返回Inference_engine.Unknown"""
+        try:
+            return Inference_engine.first(self.ask(goal, limits))
+        except Inference_engine.BudgetExceeded as e:
+            return Inference_engine.Unknown(e.reason)
+
+    def ask_batch(self, goals, limit=1, limits=None):
+        """
+        一起询问多个goal（共享已求得的子目标答案和知识库索引）
+        :return: 与goals顺序对应的列表：limit=1时为第一个置换字典或None，否则为置换字典的列表；资源耗尽的goal为Unknown
+        """
+        goals = [TSRL.parse_expression(goal) if isinstance(goal, str) else goal for goal in goals]
+        return self.interpreter.ask_batch(goals, limit, limits)
+
 
 """
 修改TSRL.main()，使其接收输入和输出文件路径作为参数
@@ -61,6 +61,8 @@ class TokenType(Enum):  #实际上相当于字典
 
 #词法单元
 class Token:
+    __slots__ = ('type', 'lexeme', 'literal', 'line')
+
     def __init__(self, type: TokenType, lexeme: str, literal: Optional[str], line: int):
         self.type = type
         self.lexeme = lexeme
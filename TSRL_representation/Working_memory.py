@@ -0,0 +1,76 @@
+"""
+交通主体的工作记忆
+每个交通主体在共享规则库之上保持一个常驻的推理会话：消息到达时只解析、告知一次，事实带有仿真时间戳，
+按谓词的有效期(TTL)随仿真时间推进批量淘汰，工作集大小只取决于有效期内的消息，推理开销不随场景时长增长。
+"""
+import os
+import sys
+from typing import Dict, List, Optional, Set
+
+# 添加当前目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import Inference_engine
+import Stmt
+from Inference_pool import ask_heads
+from Rule_base import RuleBase
+from TSRL import TSRL, TSRLSession
+
+
+class WorkingMemory:
+    """
+    一个交通主体的工作记忆
+    用法：
+        memory = WorkingMemory(rule_base, ttl={"EmergencyStation": 5.0, "*": 30.0})
+        memory.add("EmergencyStation(7);", timestamp=12.0)  # 消息到达时
+        memory.expire(T)  # 仿真时间推进时批量淘汰过期事实
+        memory.infer(["LetStopBeforeJunction(x)"])  # (头部序号, 置换, 决策) 或 None
+    ttl: 谓词名 -> 有效期（仿真秒），"*"为其余谓词的默认有效期；没有有效期的事实一直保留
+    """
+    def __init__(self, rule_base: RuleBase, ttl: Optional[Dict[str, float]] = None):
+        self.rule_base = rule_base
+        self.session = TSRLSession(base=rule_base.kb)
+        self._version = rule_base.version
+        for predicate, seconds in (ttl or {}).items():
+            self.session.set_ttl(predicate, seconds)
+
+    def _sync(self):
+        """规则库重新编译后，把已有事实改为叠加在新的规则知识库之上"""
+        if self._version != self.rule_base.version:
+            self.session.kb.rebase(self.rule_base.kb)
+            self._version = self.rule_base.version
+
+    def add(self, content: str, timestamp: Optional[float] = None):
+        """告知一条消息中的事实（只解析一次），timestamp为消息的仿真时间"""
+        if not content or not content.strip():
+            return
+        statements = [statement for statement in TSRL.parse(content) if isinstance(statement, Stmt.Expression)]
+        if statements:
+            self.session.tell(statements, timestamp=timestamp)
+
+    def expire(self, now: float) -> int:
+        """批量淘汰仿真时间now之前过期的事实，返回淘汰数量"""
+        return self.session.expire(now)
+
+    @property
+    def clauses(self) -> List[Inference_engine.Expr]:
+        """当前有效的事实（已求值的表达式，按告知顺序）"""
+        return self.session.kb.local_clauses
+
+    def facts(self) -> List[str]:
+        """当前有效的事实（TSRL源代码，按告知顺序）"""
+        return [f"{clause};" for clause in self.session.kb.local_clauses]
+
+    def predicates(self) -> Set[str]:
+        """当前有效的事实中出现的谓词"""
+        return {Inference_engine.clause_head(clause).op for clause in self.session.kb.local_clauses}
+
+    def infer(self, heads: List[str], limits: Optional[Inference_engine.AskLimits] = None, join_planning: Optional[bool] = None):
+        """按优先级依次询问各个规则头部（同infer_rules，资源耗尽时返回Unknown），事实无需重新解析和告知"""
+        self._sync()
+        if join_planning is not None:
+            self.session.kb.join_planning = join_planning
+        return ask_heads(self.session, heads, limits)
+
+    def __len__(self):
+        return len(self.session.kb.local_clauses)
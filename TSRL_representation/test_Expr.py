@@ -0,0 +1,87 @@
+"""
+测试项的驻留(hash-consing)
+运行：python -m pytest -q TSRL_representation
+"""
+import os
+import pickle
+import subprocess
+import sys
+
+# 添加当前目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Expr import Constant, Expr, Implication, Predicate, Variable
+from Inference_engine import is_variable
+from Tokentype import Token, TokenType
+
+
+def test_structurally_equal_terms_are_shared():
+    x = Variable('x')
+    assert Variable('x') is x
+    assert Predicate('P', None, x, Constant('7')) is Predicate('P', None, Variable('x'), Constant('7'))
+
+
+def test_children_of_different_classes_are_not_shared():
+    plain = Predicate('P', None, Expr('x'))
+    variable = Predicate('P', None, Variable('x'))
+    assert plain is not variable
+    assert not is_variable(plain.args[0])
+    assert is_variable(variable.args[0])
+
+
+def test_predicates_keep_their_own_token():
+    first = Predicate('P', Token(TokenType.IDENTIFIER, 'P', None, 1), Constant('0'))
+    second = Predicate('P', Token(TokenType.IDENTIFIER, 'P', None, 99), Constant('0'))
+    assert first is not second
+    assert first == second and hash(first) == hash(second)
+    assert first.token.line == 1
+    assert second.token.line == 99
+    assert first is not Predicate('P', None, Constant('0'))
+    assert Predicate('P', None, Constant('0')) is Predicate('P', None, Constant('0'))
+
+
+def test_variables_keep_their_own_line():
+    first = Variable('x', Token(TokenType.IDENTIFIER, 'x', None, 3))
+    second = Variable('x', Token(TokenType.IDENTIFIER, 'x', None, 8))
+    assert (first.token.line, second.token.line) == (3, 8)
+    assert first == second == Variable('x')
+    assert {first: 1}[Variable('x')] == 1
+
+
+def test_constants_are_distinguished_by_literal():
+    number = Constant('1', Token(TokenType.NUMBER, '1', 1.0, 1))
+    string = Constant('1', Token(TokenType.STRING, '"1"', '1', 1))
+    assert number is not string
+    assert number.token.literal == 1.0
+
+
+def test_non_interned_nodes_are_fresh():
+    head = Predicate('Q', None, Variable('x'))
+    body = Predicate('P', None, Variable('x'))
+    assert Implication(None, body, head) is not Implication(None, body, head)
+    assert Implication(None, body, head) == Implication(None, body, head)
+
+
+def test_pickle_round_trip_returns_interned_instance():
+    term = Predicate('P', None, Variable('x'), Constant('7'))
+    assert pickle.loads(pickle.dumps(term)) is term
+
+
+def test_pickle_rebuilds_positional_nodes():
+    term = Predicate('P', Token(TokenType.IDENTIFIER, 'P', None, 5), Variable('x', Token(TokenType.IDENTIFIER, 'x', None, 5)))
+    copy = pickle.loads(pickle.dumps(term))
+    assert copy == term and copy.token.line == 5 and copy.args[0].token.line == 5
+
+
+def test_unpickled_terms_rehash_under_another_hash_seed():
+    """在哈希种子不同的子进程中序列化，反序列化后的项与本进程构造的项相等且是同一个驻留实例"""
+    script = ("import pickle, sys; sys.path.append({!r}); from Expr import Constant, Predicate, Variable; "
+              "sys.stdout.buffer.write(pickle.dumps(Predicate('P', None, Variable('x'), Constant('Front'))))")
+    here = os.path.dirname(os.path.abspath(__file__))
+    data = subprocess.run([sys.executable, '-c', script.format(here)], check=True, capture_output=True,
+                          env=dict(os.environ, PYTHONHASHSEED='12345')).stdout
+    term = Predicate('P', None, Variable('x'), Constant('Front'))
+    copy = pickle.loads(data)
+    assert copy is term
+    assert hash(copy) == hash(('P', copy.args))
+    assert Predicate('P', Token(TokenType.IDENTIFIER, 'P', None, 1), Variable('x'), Constant('Front')) in {copy}
@@ -0,0 +1,321 @@
+"""
+测试一阶推理引擎（反向链接、表格化、半朴素求值等）
+运行：python -m pytest -q TSRL_representation
+"""
+import json
+import os
+import random
+import sys
+
+import pytest
+
+# 添加当前目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import Inference_engine
+from Expr import Constant, Expr, Variable
+from Inference_engine import Bindings, FolKB
+from Interpreter import Interpreter
+from TSRL import TSRL, TSRLSession
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+PATH_RULES = """\
+Edge(1,2); Edge(2,3); Edge(3,1); Edge(3,4);
+Path(x,z):-Path(x,y),Edge(y,z);
+Path(x,y):-Edge(x,y);
+"""
+
+
+def session(source, **options) -> TSRLSession:
+    """在指定选项的知识库上告知source"""
+    result = TSRLSession(Interpreter(FolKB(**options)))
+    result.tell(source)
+    return result
+
+
+def answers(source, goal, **options):
+    return list(session(source, **options).ask(goal))
+
+
+def answer_set(result):
+    return {tuple(sorted(bindings.items())) for bindings in result}
+
+
+def random_program(rng: random.Random) -> str:
+    """随机生成的非递归程序：两层事实谓词和两层规则，规则体中有共享变量和常量"""
+    constants = ['A', 'B', 'C', 'D', 'E']
+    lines = []
+    for predicate in ('P', 'Q', 'R'):
+        for _ in range(rng.randint(3, 12)):
+            lines.append(f"{predicate}({rng.choice(constants)},{rng.choice(constants)});")
+    rng.shuffle(lines)
+    lines += [
+        "S(x,z):-P(x,y),Q(y,z);",
+        "S(x,z):-R(x,z),P(z,x);",
+        f"T(x):-S(x,y),R(y,{rng.choice(constants)});",
+        "T(x):-Q(x,x);",
+    ]
+    return "\n".join(lines)
+
+
+# 基线引擎（标准化变量后的深度优先反向链接）对仓库中各输入文件的ASK结果
+BASELINE_ANSWERS = {
+    "input.txt": {"x": "3"},
+    "input0.txt": {"x": "Di"},
+    "input1.txt": {"x": "LetDecelerate"},
+    "input_FCW.txt": {"y": "HV"},
+    "input_FCW_trial_1.txt": {"y": "1"},
+    "input_VRSU.txt": {"x": "AV_0"},
+    "Infer_input/input.txt": {"x": "AV"},
+    "Infer_input/input_1.txt": {"x": "0"},
+    "Infer_input/input_FCW.txt": {"y": "2"},
+}
+
+
+@pytest.mark.parametrize("name", sorted(BASELINE_ANSWERS))
+def test_input_files_match_baseline(name, tmp_path):
+    output = tmp_path / "output.txt"
+    TSRL.main(os.path.join(HERE, name), str(output))
+    assert json.loads(output.read_text(encoding='utf-8')) == BASELINE_ANSWERS[name]
+
+
+def run_main(tmp_path, name, source):
+    program = tmp_path / name
+    program.write_text(source, encoding='utf-8')
+    output = tmp_path / (name + ".out")
+    TSRL.main(str(program), str(output))
+    return output.read_text(encoding='utf-8')
+
+
+def test_each_main_call_uses_a_fresh_knowledge_base(tmp_path):
+    assert json.loads(run_main(tmp_path, "first.txt", "Stop(7);\nASK Stop(x);\n")) == {"x": "7"}
+    assert run_main(tmp_path, "second.txt", "Go(1);\nASK Stop(x);\n") == "False"
+
+
+def test_ask_reports_only_the_query_variables(tmp_path):
+    source = "Blocked(x):-InLane(y,x,Front),Stopped(y);\nInLane(2,1,Front);\nStopped(2);\nASK Blocked(v);\n"
+    assert json.loads(run_main(tmp_path, "ask.txt", source)) == {"v": "1"}  # 规则体中的y不出现在结果中
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_strategies_agree_with_depth_first_backward_chaining(seed):
+    source = random_program(random.Random(seed))
+    for goal in ("T(x)", "S(A,x)", "S(x,y)"):
+        reference = answers(source, goal, tabling=False, join_planning=False)
+        # 非递归谓词不表格化，答案顺序与深度优先的反向链接相同
+        assert answers(source, goal, join_planning=False) == reference
+        expected = answer_set(reference)
+        for options in ({}, {'tabling': True}, {'strategy': 'seminaive'}):
+            assert answer_set(answers(source, goal, **options)) == expected
+
+
+def test_auto_tabling_only_tables_recursive_predicates():
+    kb = session(PATH_RULES).kb
+    assert kb.recursive_predicates() == {'Path'}
+    assert kb.is_tabled('Path') and not kb.is_tabled('Edge')
+    assert not session("A(x):-B(x); B(1);").kb.recursive_predicates()
+
+
+def test_first_answer_does_not_build_tables_for_non_recursive_goals():
+    tell = session("Slow(x):-Edge(x,y),Edge(y,z); Edge(1,2); Edge(2,3); Edge(3,4);")
+    assert tell.ask_one("Slow(x)") == {'x': '1'}
+    assert not tell.kb.tables
+
+
+def test_left_recursive_rule_terminates_with_all_answers():
+    result = answers(PATH_RULES, "Path(1,x)")
+    assert sorted(d['x'] for d in result) == ['1', '2', '3', '4']
+    assert sorted(d['x'] for d in answers(PATH_RULES, "Path(1,x)", tabling=True)) == ['1', '2', '3', '4']
+
+
+def test_recursive_rule_in_session_over_frozen_rule_base():
+    base = TSRLSession.build_base("Path(x,z):-Path(x,y),Edge(y,z); Path(x,y):-Edge(x,y);")
+    vehicle = TSRLSession(base=base)
+    vehicle.tell("Edge(7,8); Edge(8,9);")
+    assert vehicle.kb.is_tabled('Path')
+    assert sorted(d['x'] for d in vehicle.ask("Path(7,x)")) == ['8', '9']
+
+
+def test_tables_are_invalidated_by_tell():
+    tell = session(PATH_RULES)
+    assert len(list(tell.ask("Path(4,x)"))) == 0
+    assert tell.kb.tables
+    tell.tell("Edge(4,5);")
+    assert [d['x'] for d in tell.ask("Path(4,x)")] == ['5']
+
+
+@pytest.mark.parametrize("strategy", ['backward', 'seminaive'])
+def test_answers_contain_exactly_the_bound_query_variables(strategy):
+    source = "Q(v_longname1,3); Q(Front,4); R(x):-Q(x,y);"
+    assert answers(source, "Q(v_longname1,y)", strategy=strategy)[0] == {'y': '3'}
+    assert {'v_longname1': 'Front'} in answers(source, "R(v_longname1)", strategy=strategy)
+
+
+def test_index_returns_candidates_in_insertion_order():
+    kb = session("P(1,A); P(x,B); P(2,C); P(1,D); Q(1);").kb
+    fetch = lambda goal: [str(clause) for clause in kb.fetch_rules_for_goal(TSRL.parse_expression(goal))]
+    assert fetch("P(1,y)") == ["P(1, A)", "P(x, B)", "P(1, D)"]
+    assert fetch("P(3,y)") == ["P(x, B)"]
+    assert fetch("P(y,z)") == ["P(1, A)", "P(x, B)", "P(2, C)", "P(1, D)"]
+    assert fetch("Q(y)") == ["Q(1)"]
+    assert fetch("R(y)") == []
+
+
+def test_retract_removes_clause_from_indexes():
+    kb = session("P(1,A); P(x,B); P(1,D);").kb
+    kb.retract(kb.clauses[1])
+    kb.retract(kb.clauses[0])
+    assert [str(clause) for clause in kb.fetch_rules_for_goal(TSRL.parse_expression("P(1,y)"))] == ["P(1, D)"]
+    assert kb.predicate_stats(('P', 2)) == (1, 0, 1)
+
+
+def test_overlay_candidates_follow_parent_candidates():
+    base = TSRLSession.build_base("P(1,A); P(2,B);")
+    vehicle = TSRLSession(base=base)
+    vehicle.tell("P(1,C);")
+    assert [str(clause) for clause in vehicle.kb.fetch_rules_for_goal(TSRL.parse_expression("P(1,y)"))] == ["P(1, A)", "P(1, C)"]
+    assert [d['y'] for d in vehicle.ask("P(1,y)")] == ['A', 'C']
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_seminaive_matches_forward_chaining(seed):
+    source = random_program(random.Random(seed))
+    for goal in ("T(x)", "S(A,x)"):
+        assert answer_set(answers(source, goal, strategy='seminaive')) == answer_set(answers(source, goal, strategy='forward'))
+
+
+def test_seminaive_reaches_fixpoint_of_recursive_rules():
+    chain = " ".join(f"Edge({i},{i + 1});" for i in range(30))
+    source = chain + " Path(x,z):-Path(x,y),Edge(y,z); Path(x,y):-Edge(x,y);"
+    assert sorted(int(d['x']) for d in answers(source, "Path(0,x)", strategy='seminaive')) == list(range(1, 31))
+    assert answer_set(answers(PATH_RULES, "Path(x,y)", strategy='seminaive')) == answer_set(answers(PATH_RULES, "Path(x,y)"))
+
+
+@pytest.mark.parametrize("options", [{}, {'tabling': True}, {'strategy': 'seminaive'}])
+def test_batch_answers_each_goal(options):
+    goals = [TSRL.parse_expression(goal) for goal in ("Path(4,x)", "Path(3,x)", "Edge(1,x)")]
+    results = session(PATH_RULES, **options).interpreter.ask_batch(goals, limit=None)
+    assert results[0] == []
+    assert sorted(d['x'] for d in results[1]) == ['1', '2', '3', '4']
+    assert results[2] == [{'x': '2'}]
+
+
+def test_batch_reuses_tables_and_limits_answers_per_goal():
+    tell = session(PATH_RULES)
+    goals = [TSRL.parse_expression(goal) for goal in ("Path(1,x)", "Path(1,x)", "Edge(3,x)")]
+    results = tell.interpreter.ask_batch(goals, limit=1)
+    assert [len(result) for result in results] == [1, 1, 1]
+    assert results[0] == results[1]
+    assert tell.kb.tables and all(table.complete for table in tell.kb.tables.values())  # 第二个询问使用已完成的答案表
+
+
+JOIN_RULES = "Near(x,y):-Lane(x,y),Stopped(y);"
+
+
+def join_facts(lanes, stopped):
+    return " ".join([f"Lane({i},{i % 7});" for i in range(lanes)] + [f"Stopped({i});" for i in range(stopped)])
+
+
+def test_join_planning_reorders_body_without_changing_answers():
+    source = join_facts(60, 2) + " " + JOIN_RULES
+    planned = session(source)
+    assert answer_set(planned.ask("Near(x,y)")) == answer_set(answers(source, "Near(x,y)", join_planning=False))
+    (key, order), = planned.kb._join_plans.items()
+    assert [goal.op for goal in order] == ['Stopped', 'Lane']  # 事实少的子目标先求解
+    assert [goal.op for goal in key[0]] == ['Lane', 'Stopped']
+
+
+def test_join_plans_are_reused_per_layer_and_keyed_by_statistics(monkeypatch):
+    base = TSRLSession.build_base(JOIN_RULES)
+    calls = []
+    signature = Inference_engine.stats_signature
+    monkeypatch.setattr(Inference_engine, 'stats_signature', lambda kb, goals: calls.append(kb) or signature(kb, goals))
+    few, many = TSRLSession(base=base), TSRLSession(base=base)
+    few.tell(join_facts(4, 1))
+    many.tell(join_facts(200, 50))
+    for _ in range(3):
+        list(few.ask("Near(x,y)"))
+    assert len(calls) == 1  # 同一层再次询问不再计算统计信息
+    list(many.ask("Near(x,y)"))
+    assert len(base._join_plans) == 2  # 统计信息量级不同的两辆车各有缓存项
+    again = TSRLSession(base=base)
+    again.tell(join_facts(4, 1))
+    list(again.ask("Near(x,y)"))
+    assert len(base._join_plans) == 2  # 量级相同的车辆复用根知识库中的顺序
+    few.tell("Stopped(5);")
+    list(few.ask("Near(x,y)"))
+    assert len(calls) == 4  # 告知新的事实后重新检查统计信息
+
+
+def test_bindings_undo_restores_the_trail_mark():
+    env = Bindings()
+    x, y = Variable('x'), Variable('y')
+    assert env.unify(x, 0, y, 1)
+    mark = env.mark()
+    assert env.unify(y, 1, Constant('7'), 0)
+    assert env.resolve(x, 0) is Constant('7')
+    env.undo(mark)
+    assert env.resolve(x, 0) == Variable('y#1')
+    env.undo(0)
+    assert not env.values and not env.trail
+
+
+def test_failed_unification_leaves_partial_bindings_for_the_caller_to_undo():
+    env = Bindings()
+    x, y = Variable('x'), Variable('y')
+    goal = Expr('P', None, x, Constant('1'))
+    mark = env.mark()
+    assert not env.unify(goal, 0, Expr('P', None, Constant('2'), Constant('3')), 1)
+    env.undo(mark)
+    assert env.resolve(x, 0) is x
+    assert not env.unify(x, 0, Expr('f', None, x), 0)  # 出现检查
+
+
+def test_backtracking_enumerates_every_combination():
+    source = "A(1); A(2); B(1); B(2); B(3); C(x,y):-A(x),B(y);"
+    assert len(answers(source, "C(x,y)", tabling=False)) == 6
+    assert answers(source, "C(2,3)") == [{}]
+
+
+def test_rule_variables_are_renamed_per_frame():
+    source = "P(x,y):-Q(y,x); Q(1,2);"
+    assert answers(source, "P(y,x)") == [{'y': '2', 'x': '1'}]
+    assert answers(source, "P(x,x)") == []
+
+
+def test_repeated_rule_applications_do_not_share_variables():
+    chain = " ".join(f"Par({i},{i + 1});" for i in range(40))
+    source = chain + " Anc(x,z):-Par(x,y),Anc(y,z); Anc(x,y):-Par(x,y);"
+    result = answers(source, "Anc(0,x)", tabling=False)
+    assert sorted(int(d['x']) for d in result) == list(range(1, 41))
+
+
+def test_query_variables_left_unbound_by_rules_are_omitted():
+    assert answers("P(x,y):-Q(x); Q(1);", "P(a,b)") == [{'a': '1'}]
+
+
+def test_facts_expire_after_their_ttl():
+    tell = TSRLSession()
+    tell.set_ttl("EmergencyStation", 5.0)
+    tell.tell("EmergencyStation(7); Junction(7);", timestamp=0.0)
+    tell.tell("EmergencyStation(9);", timestamp=3.0)
+    tell.tell("LetStop(x):-EmergencyStation(x);")
+    assert [d['x'] for d in tell.ask("LetStop(x)")] == ['7', '9']
+    assert tell.expire(4.9) == 0
+    assert tell.expire(5.0) == 1
+    assert [d['x'] for d in tell.ask("LetStop(x)")] == ['9']
+    assert tell.expire(100.0) == 1
+    assert tell.ask_one("LetStop(x)") is None
+    assert tell.ask_one("Junction(x)") == {'x': '7'}  # 没有有效期的事实一直保留
+
+
+def test_default_ttl_and_expired_facts_leave_indexes_consistent():
+    tell = TSRLSession()
+    tell.set_ttl("*", 1.0)
+    tell.tell("P(1,A); P(2,B);", timestamp=0.0)
+    tell.tell("P(1,C);", timestamp=5.0)
+    assert tell.expire(2.0) == 2
+    assert [str(clause) for clause in tell.kb.clauses] == ["P(1, C)"]
+    assert [d['y'] for d in tell.ask("P(1,y)")] == ['C']
+    assert tell.kb.predicate_stats(('P', 2)) == (1, 0, 1)
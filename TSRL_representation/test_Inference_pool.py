@@ -0,0 +1,70 @@
+"""
+测试推理工作进程池和单次推理
+运行：python -m pytest -q TSRL_representation
+"""
+import os
+import sys
+
+import pytest
+
+# 添加当前目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Inference_engine import AskLimits, is_unknown
+from Inference_pool import InferencePool, infer_rules, instantiate_head
+
+RULES = """\
+LetStopBeforeJunction(x):-HasNextJunction(x,y),Congestion(y);
+KeepLane(x):-VehicleInLane(y,x,Front),GreaterSpeed(y,x);
+"""
+HEADS = ["LetStopBeforeJunction(x)", "KeepLane(x)"]
+FACTS = "VehicleInLane(1,0,Front); GreaterSpeed(1,0); HasNextJunction(0,7);"
+
+
+def test_instantiate_head():
+    assert instantiate_head("LetStop(x)", {'x': '0'}) == "LetStop(0)"
+    assert instantiate_head("LetStop(x)", {'y': '0'}) is None
+
+
+def test_heads_are_asked_in_priority_order():
+    assert infer_rules(FACTS, RULES, HEADS) == (1, {'x': '0'}, "KeepLane(0)")
+    assert infer_rules(FACTS + " Congestion(7);", RULES, HEADS) == (0, {'x': '0'}, "LetStopBeforeJunction(0)")
+    assert infer_rules("Other(1);", RULES, HEADS) is None
+
+
+def test_exhausted_budget_is_unknown():
+    assert is_unknown(infer_rules(FACTS, RULES, HEADS, AskLimits(steps=1)))
+
+
+@pytest.mark.parametrize("limits, reason", [
+    (AskLimits(steps=1), 'steps'),
+    (AskLimits(depth=2), 'depth'),  # 规则头部与规则体的两个子目标同时在展开中，深度为3
+    (AskLimits(deadline=0.0), 'deadline'),
+])
+def test_unknown_reports_the_exhausted_limit(limits, reason):
+    result = infer_rules(FACTS, RULES, HEADS, limits)
+    assert is_unknown(result) and result.reason == reason
+
+
+def test_limits_large_enough_do_not_change_the_decision():
+    limits = AskLimits(steps=100, depth=3, deadline=60.0)
+    assert infer_rules(FACTS, RULES, HEADS, limits) == infer_rules(FACTS, RULES, HEADS)
+
+
+def test_pool_without_workers_infers_in_process():
+    pool = InferencePool(max_workers=0)
+    assert pool.submit(FACTS, RULES, HEADS).result() == infer_rules(FACTS, RULES, HEADS)
+
+
+def test_workers_load_rules_once_and_restart_when_rules_change():
+    pool = InferencePool(max_workers=1)
+    try:
+        assert pool.submit(FACTS, RULES, HEADS).result(timeout=60) == (1, {'x': '0'}, "KeepLane(0)")
+        executor = pool._executor
+        pool.submit(FACTS, RULES, HEADS).result(timeout=60)
+        assert pool._executor is executor
+        rules = "KeepLane(x):-GreaterSpeed(y,x);\n"
+        assert pool.submit(FACTS, rules, ["KeepLane(x)"]).result(timeout=60) == (0, {'x': '0'}, "KeepLane(0)")
+        assert pool._executor is not executor
+    finally:
+        pool.shutdown(wait=True)
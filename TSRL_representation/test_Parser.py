@@ -0,0 +1,33 @@
+"""
+测试词法分析器和流式语法分析
+运行：python -m pytest -q TSRL_representation
+"""
+import os
+import sys
+
+import pytest
+
+# 添加当前目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Frontend_benchmark import load_baseline_scanner, synthetic_source, token_signature
+from Parser import READ_BATCH
+from Scanner import Scanner
+from TSRL import TSRL
+
+
+def test_regex_scanner_matches_baseline_scanner():
+    BaselineScanner = load_baseline_scanner()
+    if BaselineScanner is None:
+        pytest.skip("baseline scanner is only available in the git repository")
+    source = synthetic_source(200) + 'Speed(1) >= 2.5; Name("a b"); x != y; ?- Q(x);\n'
+    assert token_signature(Scanner(source).scan_tokens()) == token_signature(BaselineScanner(source).scan_tokens())
+
+
+def test_streaming_parse_matches_list_parse_across_batches():
+    source = synthetic_source(READ_BATCH)  # 远多于一批词法单元
+    streamed = list(TSRL.iter_parse(source))
+    parsed = TSRL.parse(source)
+    assert len(streamed) == len(parsed) == READ_BATCH
+    assert [str(s.expression) for s in streamed] == [str(s.expression) for s in parsed]
+    assert streamed[-1].expression.token.line == READ_BATCH
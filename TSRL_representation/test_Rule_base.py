@@ -0,0 +1,184 @@
+"""
+测试编译后的规则库和增量规则触发器
+运行：python -m pytest -q TSRL_representation
+"""
+import os
+import sys
+
+# 添加当前目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Inference_pool import infer_rules
+from Rule_base import RuleBase, RuleTrigger, message_predicate
+from TSRL import TSRLSession
+
+RULES = """\
+LetStopBeforeJunction(x):-HasNextJunction(x,y),Congestion(y);
+Congestion(y):-StopAt(x,y),IsJunction(y);
+KeepLane(x):-VehicleInLane(y,x,Front),GreaterSpeed(y,x);
+"""
+
+
+def compile_rules(tmp_path, source=RULES) -> RuleBase:
+    path = tmp_path / "rules.txt"
+    path.write_text(source, encoding='utf-8')
+    rule_base = RuleBase(str(path))
+    rule_base.refresh()
+    return rule_base
+
+
+def decide(rule_base: RuleBase, messages):
+    result = infer_rules("\n".join(messages), rule_base.kb, ["LetStopBeforeJunction(x)"])
+    return result[2] if result else None
+
+
+def test_message_predicate():
+    assert message_predicate(" HasNextJunction(0,7); ") == "HasNextJunction"
+
+
+def test_compile_builds_dependency_graph(tmp_path):
+    rule_base = compile_rules(tmp_path)
+    assert not rule_base.errors
+    assert [rule.head_text for rule in rule_base] == ["LetStopBeforeJunction(x)", "Congestion(y)", "KeepLane(x)"]
+    assert rule_base.dependencies["LetStopBeforeJunction"] == {"HasNextJunction", "Congestion"}
+    assert rule_base.dependents["Congestion"] == {"LetStopBeforeJunction"}
+
+
+def test_recursive_rules_are_kept_with_a_warning(tmp_path):
+    rule_base = compile_rules(tmp_path, RULES + "Reachable(x,z):-Road(x,y),Reachable(y,z);\nReachable(x,y):-Road(x,y);\n")
+    assert not rule_base.errors
+    assert len(rule_base.warnings) == 1
+    assert [rule.head_text for rule in rule_base][-2:] == ["Reachable(x, z)", "Reachable(x, y)"]
+    assert rule_base.recursive == {"Reachable"}
+    session = TSRLSession(base=rule_base.kb)
+    session.tell("Road(1,2); Road(2,3); Road(3,1);")
+    assert sorted(bindings['x'] for bindings in session.ask("Reachable(1,x)")) == ['1', '2', '3']
+
+
+def test_rule_source_is_one_statement_per_rule(tmp_path):
+    source = ("Brake(x):-\n    HasNextJunction(x,y),\n    Congestion(y);  // 跨行的规则\n"
+              "Slow(x):-Named(x,\"a b\"); Fast(x):-Speed(x,2.5); // 同一行的两条规则\n")
+    rule_base = compile_rules(tmp_path, source)
+    assert not rule_base.errors
+    assert [rule.source for rule in rule_base] == [
+        "Brake(x):-HasNextJunction(x,y),Congestion(y);",
+        'Slow(x):-Named(x,"a b");',
+        "Fast(x):-Speed(x,2.5);",
+    ]
+    assert [rule.line for rule in rule_base] == [1, 4, 4]
+    # 规则库的源代码在其他进程中重建同样的知识库
+    rebuilt = TSRLSession.build_base(rule_base.source)
+    assert [str(clause) for clause in rebuilt.clauses] == [str(clause) for clause in rule_base.kb.clauses]
+    session = TSRLSession(base=rebuilt)
+    session.tell('Named(1,"a b"); Speed(2,2.5);')
+    assert session.ask_one("Slow(x)") == {'x': '1'} and session.ask_one("Fast(x)") == {'x': '2'}
+
+
+def test_refresh_recompiles_only_after_modification(tmp_path):
+    rule_base = compile_rules(tmp_path)
+    version = rule_base.version
+    assert not rule_base.refresh()
+    assert rule_base.version == version
+    os.utime(rule_base.path, (rule_base.mtime + 10, rule_base.mtime + 10))
+    assert rule_base.refresh()
+    assert rule_base.version == version + 1
+
+
+def test_hot_reload_rewritten_rules_file(tmp_path):
+    rule_base = compile_rules(tmp_path)
+    version, old_kb = rule_base.version, rule_base.kb
+    vehicle = TSRLSession(base=old_kb)
+    vehicle.tell("HasNextJunction(0,7); Congestion(7);")
+    path = tmp_path / "rules.txt"
+    path.write_text("Reachable(x,z):-Road(x,y),Reachable(y,z);\nReachable(x,y):-Road(x,y);\n", encoding='utf-8')
+    os.utime(path, (rule_base.mtime + 10, rule_base.mtime + 10))
+    assert rule_base.refresh()
+    assert rule_base.version == version + 1
+    assert [rule.head_predicate for rule in rule_base] == ["Reachable", "Reachable"]
+    assert len(rule_base.warnings) == 1 and "Reachable" in rule_base.warnings[0]
+    assert rule_base.recursive == {"Reachable"}
+    # 重新编译得到新的知识库，已有的会话仍在旧知识库上推理
+    assert rule_base.kb is not old_kb
+    assert vehicle.ask_one("LetStopBeforeJunction(x)") == {'x': '0'}
+    assert TSRLSession(base=rule_base.kb).ask_one("LetStopBeforeJunction(x)") is None
+
+
+def test_candidate_rules(tmp_path):
+    rule_base = compile_rules(tmp_path)
+    candidates = rule_base.candidate_rules(["VehicleInLane", "GreaterSpeed", "StopAt"])
+    assert [rule.head_text for rule in candidates] == ["KeepLane(x)"]
+
+
+def test_trigger_counts_follow_the_window(tmp_path):
+    rule_base = compile_rules(tmp_path)
+    trigger = RuleTrigger(rule_base, window=2)
+    trigger.take()
+    assert trigger._satisfied == [1, 0, 0]  # Congestion可由规则推出，总是计为出现
+    trigger.add("HasNextJunction(0,7);")
+    trigger.add("HasNextJunction(0,9);")
+    assert trigger._counts == {"HasNextJunction": 2}
+    assert trigger._satisfied == [2, 0, 0]  # 同一谓词只计一次
+    trigger.add("VehicleInLane(1,0,Front);")
+    assert trigger._counts == {"HasNextJunction": 1, "VehicleInLane": 1}
+    assert trigger._satisfied == [2, 0, 1]
+    trigger.add("GreaterSpeed(1,0);")
+    assert trigger._counts == {"VehicleInLane": 1, "GreaterSpeed": 1}
+    assert trigger._satisfied == [1, 0, 2]
+    trigger.add("")  # 空消息不进入窗口
+    assert len(trigger._predicates) == 2
+    rule_base._compile("KeepLane(x):-GreaterSpeed(y,x);\n")
+    assert trigger.take()
+    assert trigger._satisfied == [1]  # 按新规则库和当前窗口重新计数
+
+
+def test_trigger_ignores_unrelated_messages(tmp_path):
+    trigger = RuleTrigger(compile_rules(tmp_path))
+    assert trigger.take()  # 首次决策前总是需要
+    trigger.add("Other(1);")
+    assert not trigger.take()
+    trigger.add("HasNextJunction(0,7);")
+    assert trigger.take()  # Congestion可由规则推出，LetStopBeforeJunction的规则体已满足
+
+
+def test_trigger_marks_eviction_while_predicate_still_in_window(tmp_path):
+    rule_base = compile_rules(tmp_path, "LetStopBeforeJunction(x):-HasNextJunction(x,y),Congestion(y);\n")
+    trigger = RuleTrigger(rule_base, window=3)
+    trigger.take()
+    window = []
+    for message in ["HasNextJunction(0,7);", "Congestion(7);", "HasNextJunction(0,9);"]:
+        window.append(message)
+        trigger.add(message)
+    assert trigger.take()
+    assert decide(rule_base, window) == "LetStopBeforeJunction(0)"
+
+    # HasNextJunction(0,7)移出窗口，窗口内仍有HasNextJunction(0,9)，但决策已经改变
+    window = window[1:] + ["Other(1);"]
+    trigger.add("Other(1);")
+    assert decide(rule_base, window) is None
+    assert trigger.take()
+
+
+def test_trigger_follows_derived_predicates(tmp_path):
+    trigger = RuleTrigger(compile_rules(tmp_path), window=10)
+    trigger.take()
+    trigger.add("StopAt(1,7);")
+    trigger.take()
+    trigger.add("IsJunction(7);")
+    assert trigger.take()  # Congestion的规则变为满足
+
+
+def test_trigger_marks_message_matching_rule_head(tmp_path):
+    trigger = RuleTrigger(compile_rules(tmp_path))
+    trigger.take()
+    trigger.add("KeepLane(3);")
+    assert trigger.take()
+
+
+def test_trigger_rebuilds_after_recompile(tmp_path):
+    rule_base = compile_rules(tmp_path)
+    trigger = RuleTrigger(rule_base)
+    trigger.take()
+    rule_base._compile(RULES + "Brake(x):-Other(x);\n")
+    assert trigger.take()
+    trigger.add("Other(1);")
+    assert trigger.take()
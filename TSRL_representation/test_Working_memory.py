@@ -0,0 +1,45 @@
+"""
+测试交通主体的工作记忆（事实有效期与规则库重新编译）
+运行：python -m pytest -q TSRL_representation
+"""
+import os
+import sys
+
+# 添加当前目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from Rule_base import RuleBase
+from Working_memory import WorkingMemory
+
+RULES = "LetStopBeforeJunction(x):-HasNextJunction(x,y),EmergencyStation(y);\n"
+HEADS = ["LetStopBeforeJunction(x)"]
+
+
+def compile_rules(tmp_path, source=RULES) -> RuleBase:
+    path = tmp_path / "rules.txt"
+    path.write_text(source, encoding='utf-8')
+    rule_base = RuleBase(str(path))
+    rule_base.refresh()
+    return rule_base
+
+
+def test_expired_facts_no_longer_support_decisions(tmp_path):
+    memory = WorkingMemory(compile_rules(tmp_path), ttl={"EmergencyStation": 5.0})
+    memory.add("HasNextJunction(0,7);", timestamp=0.0)
+    memory.add("EmergencyStation(7);", timestamp=1.0)
+    assert memory.infer(HEADS) == (0, {'x': '0'}, "LetStopBeforeJunction(0)")
+    assert memory.expire(5.5) == 0
+    assert memory.expire(6.0) == 1
+    assert memory.facts() == ["HasNextJunction(0, 7);"]
+    assert memory.infer(HEADS) is None
+
+
+def test_facts_survive_rule_recompilation(tmp_path):
+    rule_base = compile_rules(tmp_path)
+    memory = WorkingMemory(rule_base, ttl={"*": 30.0})
+    memory.add("HasNextJunction(0,7); EmergencyStation(7);", timestamp=0.0)
+    rule_base._compile("KeepLane(x):-HasNextJunction(x,y);\n")
+    assert memory.infer(["KeepLane(x)"]) == (0, {'x': '0'}, "KeepLane(0)")
+    assert memory.predicates() == {"HasNextJunction", "EmergencyStation"}
+    assert memory.expire(30.0) == 2
+    assert len(memory) == 0
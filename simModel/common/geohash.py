@@ -0,0 +1,9 @@
+# geohash grid shared by the road network (NetworkBuild) and V2X broadcast
+# 路网、场景和通信广播使用同一套网格划分，网格ID相同的区域一致
+
+GEOHASH_SIZE = 100  # geohash网格边长 [米]
+
+
+def geohashID(x: float, y: float) -> tuple[int]:
+    """坐标(x, y)所在的geohash网格ID"""
+    return (int(x // GEOHASH_SIZE), int(y // GEOHASH_SIZE))
@@ -9,6 +9,7 @@ from utils.simBase import CoordTF, deduceEdge, MapCoordTF
 from utils.cubic_spline import Spline2D
 from utils.roadgraph import Junction, Edge, NormalLane, OVERLAP_DISTANCE, JunctionLane, TlLogic
 from simModel.common.facilitiesFactory import RSU,RSU_detector # 在networkBuild.py文件的导入部分添加RSU导入
+from simModel.common.geohash import geohashID
 from queue import Queue
 import sqlite3
 from threading import Thread
@@ -87,9 +88,7 @@ class NetworkBuild:
     def affGridIDs(self, centerLine: list[tuple[float]]) -> set[tuple[int]]:
         affGridIDs = set()
         for poi in centerLine:
-            poixhash = int(poi[0] // 100)
-            poiyhash = int(poi[1] // 100)
-            affGridIDs.add((poixhash, poiyhash))
+            affGridIDs.add(geohashID(poi[0], poi[1]))
 
         return affGridIDs
 
@@ -543,11 +542,8 @@ class NetworkBuild:
         """9.6新增：添加RSU到网络，并更新geohash"""
         self.rsus[rsu.id] = rsu
         # 计算RSU所在的geohash网格
-        rsu_x, rsu_y = rsu.x, rsu.y
-        geox = int(rsu_x // 100)
-        geoy = int(rsu_y // 100)
         # 添加到对应的geohash
-        gridID = (geox, geoy)
+        gridID = geohashID(rsu.x, rsu.y)
         try:
             geohash = self.geoHashes[gridID]
         except KeyError:
@@ -568,10 +564,8 @@ class NetworkBuild:
         rsu_ids = set()
         
         # 计算影响范围内的geohash网格
-        min_geox = int((center_x - radius) // 100)
-        max_geox = int((center_x + radius) // 100)
-        min_geoy = int((center_y - radius) // 100)
-        max_geoy = int((center_y + radius) // 100)
+        min_geox, min_geoy = geohashID(center_x - radius, center_y - radius)
+        max_geox, max_geoy = geohashID(center_x + radius, center_y + radius)
     
         # 遍历所有可能的geohash网格
         for gx in range(min_geox, max_geox + 1):
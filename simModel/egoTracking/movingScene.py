@@ -7,6 +7,7 @@ import sqlite3
 
 
 from simModel.common.networkBuild import NetworkBuild, Rebuild
+from simModel.common.geohash import geohashID
 from simModel.common.carFactory import Vehicle, egoCar, DummyVehicle
 from simModel.common.facilitiesFactory import RSU
 from utils.roadgraph import RoadGraph
@@ -34,8 +35,7 @@ class MovingScene:
     def updateScene(self, dataQue: Queue, timeStep: int):
         # 9.7 添加更新RSUs的部分
         ex, ey = traci.vehicle.getPosition(self.ego.id) # 获取ego主车的位置
-        currGeox = int(ex // 100)
-        currGeoy = int(ey // 100)
+        currGeox, currGeoy = geohashID(ex, ey)
         # 获取当前场景中的geohash
         sceGeohashIDs = (
             (currGeox-1, currGeoy-1),
@@ -249,8 +249,7 @@ class SceneReplay:
 
     def updateScene(self, dataBase: str, timeStep: int):
         ex, ey = self.ego.x, self.ego.y
-        currGeox = int(ex // 100)
-        currGeoy = int(ey // 100)
+        currGeox, currGeoy = geohashID(ex, ey)
 
         sceGeohashIDs = (
             (currGeox-1, currGeoy-1),
@@ -7,6 +7,7 @@ import sqlite3
 
 
 from simModel.common.networkBuild import NetworkBuild, Rebuild
+from simModel.common.geohash import geohashID
 from simModel.common.carFactory import Vehicle, egoCar, DummyVehicle
 from utils.roadgraph import RoadGraph
 from utils.simBase import CoordTF
@@ -23,8 +24,7 @@ class LocalScene:
 
     def getRoadGraph(self) -> tuple[set[str]]:
         ex, ey = self.localPos.x, self.localPos.y
-        currGeox = int(ex // 100)
-        currGeoy = int(ey // 100)
+        currGeox, currGeoy = geohashID(ex, ey)
 
         sceGeohashIDs = (
             (currGeox-1, currGeoy-1),
@@ -182,8 +182,7 @@ class LocalSceneReplay:
 
     def getRoadGraph(self) -> tuple[set[str]]:
         ex, ey = self.localPos.x, self.localPos.y
-        currGeox = int(ex // 100)
-        currGeoy = int(ey // 100)
+        currGeox, currGeoy = geohashID(ex, ey)
 
         sceGeohashIDs = (
             (currGeox-1, currGeoy-1),
@@ -7,13 +7,17 @@ Copyright (c) 2023 by PJLab, All Rights Reserved.
 """
 from __future__ import annotations
 
+import hashlib
+import json
+import logging as std_logging
 import os
-import subprocess
+from dataclasses import replace
 import re
 import sys
 import tkinter as tk
+from collections import Counter, OrderedDict
 from tkinter import scrolledtext, messagebox
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from abc import ABC, abstractmethod
 
 from decision_maker.abstract_decision_maker import (
@@ -29,13 +33,24 @@ from predictor.abstract_predictor import Prediction
 from utils.roadgraph import RoadGraph
 from utils.trajectory import State
 from add.display import NonBlockingInferenceWindow
-from TSRL_representation.TSRL import TSRL
+from TSRL_representation.Columnar_store import ColumnarFactStore, FleetInference
+from TSRL_representation.Inference_pool import AskLimits, completed_future, get_shared_pool, infer_rules, is_unknown
+from TSRL_representation.Rule_base import CompiledRule, RuleBase, message_predicate
+from TSRL_interaction.vehicle_communication import flush_message_history
 
 
 import logger
 
 logging = logger.get_logger(__name__)
 
+
+def inference_limits(config: dict) -> Optional[AskLimits]:
+    """由INFERENCE_BUDGET配置得到每次询问的资源上限（展开次数、证明深度、墙钟时间），未配置时不限制"""
+    budget = config.get("INFERENCE_BUDGET") if config else None
+    if not budget:
+        return None
+    return AskLimits(budget.get("STEPS"), budget.get("DEPTH"), budget.get("DEADLINE"))
+
 # 新增的映射类，将动作名称映射到Behaviour枚举值
 class action_name_to_behaviour_mapper:
     """
@@ -96,6 +111,65 @@ class action_name_to_behaviour_mapper:
         # 如果都没找到，返回OTHER
         return Behaviour.OTHER
 
+class DecisionCache:
+    """
+    决策缓存：(车辆ID, 最近NUM_READMESSAGES条消息的指纹, 规则库版本) -> 上一次推理得到的决策
+    消息历史和规则库都没有变化时直接返回之前的决策，不再匹配规则和推理；按最近最少使用(LRU)淘汰
+    max_size=0时不缓存
+    """
+    LOG_INTERVAL = 1000  # 每隔多少次决策以INFO级别输出一次统计信息，其余决策以DEBUG级别输出
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0  # 命中次数
+        self.misses = 0  # 未命中次数
+        self._logged = 0  # log_stats的调用次数
+
+    @staticmethod
+    def key(vehicle_id: str, message_history: List[str], rule_version: int) -> Tuple[str, str, int]:
+        """由车辆ID、消息历史和规则库版本生成缓存键"""
+        fingerprint = hashlib.blake2b("\n".join(message_history).encode('utf-8'), digest_size=16).hexdigest()
+        return vehicle_id, fingerprint, rule_version
+
+    def resize(self, max_size: int):
+        """修改缓存容量，超出部分按LRU淘汰"""
+        self.max_size = max_size
+        while len(self._entries) > max(self.max_size, 0):
+            self._entries.popitem(last=False)
+
+    def get(self, key: Tuple[str, str, int], T: float) -> Optional[List[SingleStepDecision]]:
+        """返回缓存的决策（期望时间更新为T）；未命中时返回None"""
+        if self.max_size <= 0:
+            return None
+        decisions = self._entries.get(key)
+        if decisions is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return [replace(decision, expected_time=T) for decision in decisions]
+
+    def put(self, key: Tuple[str, str, int], decisions: List[SingleStepDecision]):
+        """缓存一次推理得到的决策（可以为空列表，表示没有决策）"""
+        if self.max_size <= 0:
+            return
+        self._entries[key] = list(decisions)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def log_stats(self, name: str):
+        """输出命中率等统计信息（每次决策调用一次，每LOG_INTERVAL次以INFO级别输出）"""
+        self._logged += 1
+        level = std_logging.INFO if self._logged % self.LOG_INTERVAL == 0 else std_logging.DEBUG
+        if not logging.isEnabledFor(level):
+            return
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total else 0.0
+        logging.log(level, f"{name} decision cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate), "
+                           f"{len(self._entries)}/{self.max_size} entries")
+
 class EgoDecisionMaker(AbstractEgoDecisionMaker):
     def __init__(self, Scenario_Name: str = None):
         # 获取项目根目录
@@ -103,16 +177,35 @@ class EgoDecisionMaker(AbstractEgoDecisionMaker):
         self.Scenario_Name = Scenario_Name
         self.message_history_dir = os.path.join(self.project_root, f'message_history\\{self.Scenario_Name}') # 消息历史文件目录
         self.rules_file = os.path.join(self.project_root, 'TSRL_inference', 'Rules', 'Roadsys_rule.txt') # 规则文件路径
+        self.rule_base = RuleBase.shared(self.rules_file) # 编译后的规则库，各决策器共享
         self.inference_input_dir = os.path.join(self.project_root, 'TSRL_inference', 'Inference_Input') # 推理输入文件目录
         self.inference_output_dir = os.path.join(self.project_root, 'TSRL_inference', 'Inference_Output') # 推理输出文件目录
         self.tsrl_script = os.path.join(self.project_root, 'TSRL_representation', 'TSRL.py') # TSRL脚本路径
+        self.decision_cache = DecisionCache() # 决策缓存，容量由DECISION_CACHE_SIZE配置
+        self.working_memories = None # 启用事实有效期(FACT_TTL)时提供各车辆工作记忆的通信管理器
+        self.budget_hits = Counter() # 推理资源耗尽（INFERENCE_BUDGET）的次数：'steps'/'depth'/'deadline' -> 次数
+        self.message_source = None # 提供各车辆内存消息历史的通信管理器，None时读取消息历史文件
         
         # 确保目录存在
         os.makedirs(self.inference_input_dir, exist_ok=True)
         os.makedirs(self.inference_output_dir, exist_ok=True)
 
+    def use_working_memory(self, communication_manager):
+        """使用通信管理器维护的各车辆工作记忆（有效期内的事实）代替读取消息历史文件中最新的消息"""
+        self.working_memories = communication_manager
+
+    def use_message_history(self, communication_manager):
+        """从通信管理器的内存消息历史（环形缓冲区）读取最新的消息，不读取消息历史文件"""
+        self.message_source = communication_manager
+
     def _read_message_history(self, vehicle_id: str, max_messages: Optional[int] = None) -> List[str]:
         """读取指定车辆的消息历史"""
+        if self.message_source is not None:
+            messages = self.message_source.recent_contents(vehicle_id, max_messages)
+            if messages is not None:
+                return messages
+        # 内存中没有所需的消息时读取消息历史文件，先写出后台写入器中尚未写入文件的消息
+        flush_message_history()
         message_file = os.path.join(self.message_history_dir, f'message_{vehicle_id}_history.txt')
         if not os.path.exists(message_file):
             logging.warning(f"Message history file for vehicle {vehicle_id} not found")
@@ -131,140 +224,44 @@ class EgoDecisionMaker(AbstractEgoDecisionMaker):
             logging.error(f"Error reading message history for vehicle {vehicle_id}: {e}")
             return []
 
-    def _read_rules(self) -> List[str]:
-        """读取所有规则"""
-        if not os.path.exists(self.rules_file):
-            logging.error(f"Rules file not found: {self.rules_file}")
-            return []
-        
+    def _read_rules(self) -> List[CompiledRule]:
+        """读取所有规则（规则文件只在修改后重新编译）"""
         try:
-            with open(self.rules_file, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-                # 过滤空行和注释行
-                return [line.strip() for line in lines if line.strip() and not line.startswith('#')]
+            if self.rule_base.refresh():
+                logging.info(f"Rules compiled (version {self.rule_base.version}): {len(self.rule_base)} rules")
+                for error in self.rule_base.errors:
+                    logging.error(error)
+                for warning in self.rule_base.warnings:
+                    logging.warning(warning)
         except Exception as e:
             logging.error(f"Error reading rules file: {e}")
-            return []
+        return self.rule_base.rules
 
-    def _parse_rule(self, rule: str) -> tuple:
-        """解析规则，返回左侧和右侧部分"""
-        if ":-" not in rule:
-            return None, None
-        head, body = rule.split(":-", 1)
-        head = head.strip()
-        body = body.strip().rstrip(';')  # 移除结尾的分号
-        conditions = [cond.strip() for cond in body.split('),')] # 进行条件切割
-        return head, conditions
-
-    def _check_conditions(self, conditions: List[str], message_history: List[str]) -> bool:
-        """检查所有条件是否都在消息历史中"""
-        for condition in conditions:
-            # 检查条件是否在消息历史中
-            found = False
-            for msg in message_history:
-                # 去除消息末尾的分号
-                clean_msg = msg.rstrip(';')
-                # 检查如果condition和msg都包含"("，则比较括号前的部分
-                if "(" in condition and "(" in clean_msg:
-                    condition_prefix = condition.split("(")[0]
-                    msg_prefix = clean_msg.split("(")[0]
-                    if condition_prefix == msg_prefix:
-                        found = True
-                        break
-                else:
-                    # 如果没有括号，则直接比较
-                    if condition == clean_msg:
-                        found = True
-                        break
-            
-            if not found:
-                return False
-        return True
-
-    def _generate_inference_input(self, vehicle_id: str, message_history: List[str], rule: str, head: str) -> str:
-        """生成推理输入文件"""
-        input_filename = f'Inference_{vehicle_id}_input.txt'
-        input_filepath = os.path.join(self.inference_input_dir, input_filename)
-        
-        try:
-            with open(input_filepath, 'w', encoding='utf-8') as f:
-                # 写入消息历史
-                for msg in message_history:
-                    f.write(f"{msg}\n")
-                f.write("\n")
-                # 写入规则
-                f.write(f"{rule}\n")
-                f.write("\n")
-                # 写入ASK语句
-                f.write(f"ASK {head};\n")
-            
-            return input_filepath
-        except Exception as e:
-            logging.error(f"Error generating inference input for vehicle {vehicle_id}: {e}")
-            return ""
+    def _candidate_rules(self, message_history: List[str]) -> List[CompiledRule]:
+        """
+        一次遍历消息历史得到其中出现的谓词，再通过规则库的判别索引（谓词 -> 规则）
+        得到规则体中谓词全部出现在消息历史中的候选规则（按规则顺序）
+        """
+        predicates = {message_predicate(msg) for msg in message_history}
+        return self.rule_base.candidate_rules(predicates)
 
-    def _run_tsrl_inference(self, input_filepath: str, vehicle_id: str) -> str:
-        """运行TSRL推理引擎"""
-        output_filename = f'Inference_{vehicle_id}_output.txt'
-        output_filepath = os.path.join(self.inference_output_dir, output_filename)
-        try:
-            TSRL.main(input_filepath, output_filepath)
-            return output_filepath
-        except Exception as e:
-            logging.error(f"Error running TSRL inference for vehicle {vehicle_id}: {e}")
-            return ""
+    def _generate_inference_source(self, message_history: List[str], rule: str) -> str:
+        """生成推理输入的TSRL源代码（消息历史+规则），不写入文件"""
+        return "\n".join(message_history) + "\n\n" + rule + "\n"
 
-    def _parse_inference_output(self, output_filepath: str, head: str) -> Optional[str]:
-        """解析推理输出，提取变量替换后的决策"""
-        if not os.path.exists(output_filepath):
-            return None
+    def _run_tsrl_inference(self, message_history: List[str], candidates: List[CompiledRule], vehicle_id: str,
+                            memory=None, limits: Optional[AskLimits] = None):
+        """
+        在进程内运行TSRL推理引擎：消息历史只加载一次，告知到共享规则知识库之上的独立会话中，
+        再按优先级依次询问各候选规则的头部，推理完即丢弃会话；使用工作记忆时直接在其会话中询问；
+        返回(候选规则序号, 置换, 决策)；推理失败或都不成立时返回None，资源耗尽时返回Unknown
+        """
         try:
-            with open(output_filepath, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            
-            # 查找包含head的行
-            for line in lines:
-                line = line.strip()
-                # 检查line是否包含冒号格式的映射关系
-                if ':' in line and line.startswith('{') and line.endswith('}'):
-                    # 解析line中的映射关系，例如 "{'y': '1'}"
-                    try:
-                        # 移除大括号
-                        content = line[1:-1]  # 移除开头和结尾的大括号
-                        # 解析键值对，注意处理逗号在引号内的情况
-                        mapping = {}
-                        # 简单处理，按逗号分割（假设格式简单）
-                        pairs = content.split(',')
-                        # 解析每个键值对
-                        for pair in pairs:
-                            # 分割键和值
-                            if ':' in pair:
-                                kv = pair.split(':', 1)  # 只分割第一个冒号
-                                if len(kv) == 2:
-                                    # 移除键值两端的空格和引号
-                                    key = kv[0].strip().strip("'\"")
-                                    value = kv[1].strip().strip("'\"")
-                                    mapping[key] = value
-                        
-                        # 获取head中的变量名（括号内的内容）
-                        if '(' in head and ')' in head:
-                            head_prefix = head.split('(')[0]
-                            head_var = head[head.find('(')+1:head.find(')')]
-                            
-                            # 检查head_var是否在映射中
-                            if head_var in mapping:
-                                # 替换head中的变量为映射值
-                                replaced_head = f"{head_prefix}({mapping[head_var]})"
-                                return replaced_head
-                    except Exception as e:
-                        logging.warning(f"Failed to parse mapping line: {line}, error: {e}")
-                        continue
-                elif line.startswith(head.split('(')[0]):  # 匹配谓词名称
-                    return line
-            
-            return None
+            if memory is not None:
+                return memory.infer([rule.head_text for rule in candidates], limits)
+            return infer_rules("\n".join(message_history), self.rule_base.kb, [rule.head_text for rule in candidates], limits)
         except Exception as e:
-            logging.error(f"Error parsing inference output: {e}")
+            logging.error(f"Error running TSRL inference for vehicle {vehicle_id}: {e}")
             return None
 
     def _extract_action_from_head(self, head: str) -> str:
@@ -298,7 +295,7 @@ class EgoDecisionMaker(AbstractEgoDecisionMaker):
         return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     def _generate_detailed_inference_display_file(self, vehicle_id: str, message_history: List[str], rule: str,
-                                                 input_filepath: str, output_filepath: str, decision_result: str):
+                                                 inference_input: str, inference_output: str, decision_result: str):
         """生成详细的推理展示文件，包含输入、输出和决策结果，并在弹窗中展示"""
         try:
             # 创建推理展示目录
@@ -321,22 +318,14 @@ class EgoDecisionMaker(AbstractEgoDecisionMaker):
                 content += f"{i}. {msg}\n"
             content += "\n"
             
-            # 读取推理输入文件内容
-            content += f"=== 推理输入文件内容 ({os.path.basename(input_filepath)}) ===\n"
-            if os.path.exists(input_filepath):
-                with open(input_filepath, 'r', encoding='utf-8') as f:
-                    content += f.read()
-            else:
-                content += "输入文件不存在\n"
+            # 推理输入内容
+            content += f"=== 推理输入内容 ===\n"
+            content += inference_input
             content += "\n"
             
-            # 读取TSRL推理输出文件内容
-            content += f"=== TSRL推理输出内容 ({os.path.basename(output_filepath)}) ===\n"
-            if os.path.exists(output_filepath):
-                with open(output_filepath, 'r', encoding='utf-8') as f:
-                    content += f.read()
-            else:
-                content += "输出文件不存在\n"
+            # TSRL推理输出内容
+            content += f"=== TSRL推理输出内容 ===\n"
+            content += inference_output
             content += "\n"
             
             # 添加解析后的决策结果
@@ -372,9 +361,9 @@ class EgoDecisionMaker(AbstractEgoDecisionMaker):
         1. 读取自车消息历史文件
         2. 遍历规则文件中的每条规则
         3. 检查规则条件是否满足
-        4. 生成推理输入文件
-        5. 运行TSRL推理引擎
-        6. 解析输出并生成决策
+        4. 生成推理输入（消息历史+规则）
+        5. 在进程内运行TSRL推理引擎
+        6. 将置换应用到规则头部，生成决策
         """
         # 获取自车信息
         ego_vehicle = None
@@ -389,8 +378,13 @@ class EgoDecisionMaker(AbstractEgoDecisionMaker):
         decision_result = []
         # 获取自车ID
         vehicle_id = str(ego_vehicle.id)
-        # 读取该车辆的消息历史
-        message_history = self._read_message_history(vehicle_id, max_messages=config["NUM_READMESSAGES"])
+        memory = self.working_memories.get_working_memory(vehicle_id) if self.working_memories is not None else None
+        if memory is not None:
+            # 工作记忆中有效期内的事实代替最新的NUM_READMESSAGES条消息
+            message_history = memory.facts()
+        else:
+            # 读取该车辆的消息历史
+            message_history = self._read_message_history(vehicle_id, max_messages=config["NUM_READMESSAGES"])
         if not message_history:
             logging.warning(f"No message history for ego vehicle {vehicle_id}")
             return EgoDecision(ego_veh=ego_vehicle, result=decision_result)
@@ -399,46 +393,49 @@ class EgoDecisionMaker(AbstractEgoDecisionMaker):
         if not rules:
             logging.warning("No rules found, skipping TSRL decision making")
             return EgoDecision(ego_veh=ego_vehicle, result=decision_result)
-        # 遍历所有规则
-        for rule in rules:
-            if ":-" not in rule:
-                continue
-            head, conditions = self._parse_rule(rule)
-            if not head or not conditions:
-                continue
-            # 检查规则条件是否满足
-            if self._check_conditions(conditions, message_history):
-                logging.debug(f"Rule conditions satisfied for ego vehicle {vehicle_id}: {rule}")
-                # 生成推理输入文件
-                input_filepath = self._generate_inference_input(vehicle_id, message_history, rule, head)
-                if not input_filepath:
-                    continue
-                # 运行TSRL推理
-                output_filepath = self._run_tsrl_inference(input_filepath, vehicle_id)
-                if not output_filepath:
-                    continue
-                
-                # 解析推理输出
-                decision_output = self._parse_inference_output(output_filepath, head)
-                if decision_output:
-                    # 生成详细的推理展示文件并弹窗展示
-                    self._generate_detailed_inference_display_file(vehicle_id, message_history, rule, input_filepath, output_filepath, decision_output)
-                    # 创建决策
-                    decision_at_t = SingleStepDecision()
-                    decision_at_t.action = decision_output
-                    decision_at_t.expected_time = T
-                    # 根据规则头部确定行为类型
-                    action_name = self._extract_action_from_head(head)
-                    # 使用action_name_to_behaviour_mapper映射action_name到Behaviour
-                    decision_at_t.behaviour = action_name_to_behaviour_mapper.get_behaviour(action_name)
-                    if decision_at_t.behaviour is Behaviour.OTHER:
-                        logging.info(f"Unknown behaviour for action {action_name}")
-                    decision_result.append(decision_at_t)
-                    logging.info(f"Decision made for ego vehicle {vehicle_id}: {decision_output}")
-                    break  # 找到一个适用规则就停止
-            else: 
-                # 消息列表和当前这条推理规则不对应，所以进入下一个循环
-                continue
+        # 消息历史和规则库都没有变化时直接使用缓存的决策
+        self.decision_cache.resize(config.get("DECISION_CACHE_SIZE", 1024))
+        cache_key = DecisionCache.key(vehicle_id, message_history, self.rule_base.version)
+        cached = self.decision_cache.get(cache_key, T)
+        if cached is not None:
+            self.decision_cache.log_stats("Ego")
+            return EgoDecision(ego_veh=ego_vehicle, result=cached)
+        # 通过判别索引得到条件满足的候选规则
+        candidates = self._candidate_rules(message_history)
+        if not candidates:
+            self.decision_cache.put(cache_key, decision_result)
+            self.decision_cache.log_stats("Ego")
+            return EgoDecision(ego_veh=ego_vehicle, result=decision_result)
+        # 单次推理：消息历史只加载一次，按优先级询问全部候选规则的头部
+        result = self._run_tsrl_inference(message_history, candidates, vehicle_id, memory, inference_limits(config))
+        if is_unknown(result):
+            # 资源耗尽：不产生TSRL决策（采用默认行为），结果不缓存，下次决策时重新推理
+            self.budget_hits[result.reason] += 1
+            logging.warning(f"TSRL inference budget exhausted ({result.reason}) for ego vehicle {vehicle_id}, "
+                            f"using default behaviour; budget hits: {dict(self.budget_hits)}")
+            return EgoDecision(ego_veh=ego_vehicle, result=decision_result)
+        if result is not None:
+            index, bindings, decision_output = result
+            rule = candidates[index]
+            head = rule.head_text
+            # 生成详细的推理展示文件并弹窗展示
+            source = self._generate_inference_source(message_history, rule.source)
+            self._generate_detailed_inference_display_file(vehicle_id, message_history, rule.source, f"{source}\nASK {head};\n",
+                                                           json.dumps(bindings, ensure_ascii=False), decision_output)
+            # 创建决策
+            decision_at_t = SingleStepDecision()
+            decision_at_t.action = decision_output
+            decision_at_t.expected_time = T
+            # 根据规则头部确定行为类型
+            action_name = self._extract_action_from_head(head)
+            # 使用action_name_to_behaviour_mapper映射action_name到Behaviour
+            decision_at_t.behaviour = action_name_to_behaviour_mapper.get_behaviour(action_name)
+            if decision_at_t.behaviour is Behaviour.OTHER:
+                logging.info(f"Unknown behaviour for action {action_name}")
+            decision_result.append(decision_at_t)
+            logging.info(f"Decision made for ego vehicle {vehicle_id}: {decision_output}")
+        self.decision_cache.put(cache_key, decision_result)
+        self.decision_cache.log_stats("Ego")
         
         return EgoDecision(ego_veh=ego_vehicle, result=decision_result)
 
@@ -450,13 +447,31 @@ class MultiDecisionMaker(AbstractMultiDecisionMaker):
         self.Scenario_Name = Scenario_Name
         self.message_history_dir = os.path.join(self.project_root, f'message_history\\{self.Scenario_Name}') # 消息历史文件目录
         self.rules_file = os.path.join(self.project_root, 'TSRL_inference', 'Rules', 'Roadsys_rule.txt') # 规则文件路径
+        self.rule_base = RuleBase.shared(self.rules_file) # 编译后的规则库，各决策器共享
         self.inference_input_dir = os.path.join(self.project_root, 'TSRL_inference', 'Inference_Input') # 推理输入文件目录
         self.inference_output_dir = os.path.join(self.project_root, 'TSRL_inference', 'Inference_Output') # 推理输出文件目录
-        self.tsrl_script = os.path.join(self.project_root, 'TSRL_representation', 'TSRL.py') # TSRL脚本路径
+        self.communication_manager = None # 启用增量决策时的通信管理器（提供各车辆的增量规则触发器）
+        self._last_results: Dict[str, List[SingleStepDecision]] = {} # 车辆ID -> 上一次TSRL推理得到的决策
+        self.decision_cache = DecisionCache() # 决策缓存，容量由DECISION_CACHE_SIZE配置
+        self.working_memories = None # 启用事实有效期(FACT_TTL)时提供各车辆工作记忆的通信管理器
+        self.fleet = FleetInference(self.rule_base) # 车队级向量化推理（COLUMNAR_INFERENCE启用时使用）
+        self.budget_hits = Counter() # 推理资源耗尽（INFERENCE_BUDGET）的次数：'steps'/'depth'/'deadline' -> 次数
+        self.message_source = None # 提供各车辆内存消息历史的通信管理器，None时读取消息历史文件
         
         # 确保目录存在
         os.makedirs(self.inference_input_dir, exist_ok=True)
         os.makedirs(self.inference_output_dir, exist_ok=True)
+
+    def enable_incremental(self, communication_manager, window: Optional[int] = None):
+        """
+        启用事件驱动的增量决策：消息到达时只重新检查含有该谓词的规则，
+        只有规则变为满足的车辆才在决策时重新推理，其余车辆沿用上一次的决策
+        :param communication_manager: 通信管理器，车辆的消息进入消息历史时通知对应的触发器
+        :param window: 参与推理的消息数量（NUM_READMESSAGES）
+        """
+        self.communication_manager = communication_manager
+        self._last_results = {}
+        communication_manager.enable_rule_triggers(self.rule_base, window)
     
     def stop_vehicle(self, vehicle: control_Vehicle, complete_decisions: MultiDecision, T: float, config: dict):
         """为rou文件中有停车需要的车辆生成主动停车决策"""
@@ -470,8 +485,22 @@ class MultiDecisionMaker(AbstractMultiDecisionMaker):
         return vehicle,complete_decisions
         
         
+    def use_working_memory(self, communication_manager):
+        """使用通信管理器维护的各车辆工作记忆（有效期内的事实）代替读取消息历史文件中最新的消息"""
+        self.working_memories = communication_manager
+
+    def use_message_history(self, communication_manager):
+        """从通信管理器的内存消息历史（环形缓冲区）读取最新的消息，不读取消息历史文件"""
+        self.message_source = communication_manager
+
     def _read_message_history(self, vehicle_id: str, max_messages: Optional[int] = None) -> List[str]:
         """读取指定车辆的消息历史"""
+        if self.message_source is not None:
+            messages = self.message_source.recent_contents(vehicle_id, max_messages)
+            if messages is not None:
+                return messages
+        # 内存中没有所需的消息时读取消息历史文件，先写出后台写入器中尚未写入文件的消息
+        flush_message_history()
         message_file = os.path.join(self.message_history_dir, f'message_{vehicle_id}_history.txt')
         if not os.path.exists(message_file):
             logging.warning(f"Message history file for vehicle {vehicle_id} not found")
@@ -490,156 +519,30 @@ class MultiDecisionMaker(AbstractMultiDecisionMaker):
             logging.error(f"Error reading message history for vehicle {vehicle_id}: {e}")
             return []
 
-    def _read_rules(self) -> List[str]:
-        """读取所有规则"""
-        if not os.path.exists(self.rules_file):
-            logging.error(f"Rules file not found: {self.rules_file}")
-            return []
-        
+    def _read_rules(self) -> List[CompiledRule]:
+        """读取所有规则（规则文件只在修改后重新编译）"""
         try:
-            with open(self.rules_file, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-                # 过滤空行和注释行
-                return [line.strip() for line in lines if line.strip() and not line.startswith('#')]
+            if self.rule_base.refresh():
+                logging.info(f"Rules compiled (version {self.rule_base.version}): {len(self.rule_base)} rules")
+                for error in self.rule_base.errors:
+                    logging.error(error)
+                for warning in self.rule_base.warnings:
+                    logging.warning(warning)
         except Exception as e:
             logging.error(f"Error reading rules file: {e}")
-            return []
+        return self.rule_base.rules
 
-    def _parse_rule(self, rule: str) -> tuple:
-        """解析规则，返回左侧和右侧部分"""
-        if ":-" not in rule:
-            return None, None
-        head, body = rule.split(":-", 1)
-        head = head.strip()
-        body = body.strip().rstrip(';')  # 移除结尾的分号
-        conditions = [cond.strip() for cond in body.split(',')]
-        return head, conditions
-
-    def _check_conditions(self, conditions: List[str], message_history: List[str]) -> bool:
-        """检查所有条件是否都在消息历史中"""
-        for condition in conditions:
-            # 简单检查条件是否在消息历史中
-            found = False  # 初始化found变量
-            for msg in message_history:
-                # 去除消息末尾的分号
-                clean_msg = msg.rstrip(';')
-                # 检查如果condition和msg都包含"("，则比较括号前的部分
-                if "(" in condition and "(" in clean_msg:
-                    condition_prefix = condition.split("(")[0]
-                    msg_prefix = clean_msg.split("(")[0]
-                    if condition_prefix == msg_prefix:
-                        found = True
-                        break
-                else:
-                    # 如果没有括号，则直接比较
-                    if condition == clean_msg:
-                        found = True
-                        break
-            
-            if not found:
-                return False
-        return True
-
-    def _generate_inference_input(self, vehicle_id: str, message_history: List[str], rule: str, head: str) -> str:
-        """生成推理输入文件"""
-        input_filename = f'Inference_{vehicle_id}_input.txt'
-        input_filepath = os.path.join(self.inference_input_dir, input_filename)
-        
-        try:
-            with open(input_filepath, 'w', encoding='utf-8') as f:
-                # 写入消息历史
-                for msg in message_history:
-                    f.write(f"{msg}\n")
-                f.write("\n")
-                # 写入规则
-                f.write(f"{rule}\n")
-                f.write("\n")
-                # 写入ASK语句
-                f.write(f"ASK {head}\n")
-            
-            return input_filepath
-        except Exception as e:
-            logging.error(f"Error generating inference input for vehicle {vehicle_id}: {e}")
-            return ""
+    def _candidate_rules(self, message_history: List[str]) -> List[CompiledRule]:
+        """
+        一次遍历消息历史得到其中出现的谓词，再通过规则库的判别索引（谓词 -> 规则）
+        得到规则体中谓词全部出现在消息历史中的候选规则（按规则顺序）
+        """
+        predicates = {message_predicate(msg) for msg in message_history}
+        return self.rule_base.candidate_rules(predicates)
 
-    def _run_tsrl_inference(self, input_filepath: str, vehicle_id: str) -> str:
-        """运行TSRL推理引擎"""
-        output_filename = f'Inference_{vehicle_id}_output.txt'
-        output_filepath = os.path.join(self.inference_output_dir, output_filename)
-        
-        try:
-            # 构建命令
-            cmd = f'python "{self.tsrl_script}" "{input_filepath}"'
-            
-            # 运行推理
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True, cwd=os.path.dirname(self.tsrl_script))
-            
-            if result.returncode != 0:
-                logging.error(f"TSRL inference failed for vehicle {vehicle_id}: {result.stderr}")
-                return ""
-            
-            # 将输出保存到文件
-            with open(output_filepath, 'w', encoding='utf-8') as f:
-                f.write(result.stdout)
-            
-            return output_filepath
-        except Exception as e:
-            logging.error(f"Error running TSRL inference for vehicle {vehicle_id}: {e}")
-            return ""
-
-    def _parse_inference_output(self, output_filepath: str, head: str) -> Optional[str]:
-        """解析推理输出，提取变量替换后的决策"""
-        if not os.path.exists(output_filepath):
-            return None
-            
-        try:
-            with open(output_filepath, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            
-            # 查找包含head的行
-            for line in lines:
-                line = line.strip()
-                # 检查line是否包含冒号格式的映射关系
-                if ':' in line and line.startswith('{') and line.endswith('}'):
-                    # 解析line中的映射关系，例如 "{'y': '1'}"
-                    try:
-                        # 移除大括号
-                        content = line[1:-1]  # 移除开头和结尾的大括号
-                        # 解析键值对，注意处理逗号在引号内的情况
-                        mapping = {}
-                        # 简单处理，按逗号分割（假设格式简单）
-                        pairs = content.split(',')
-                        # 解析每个键值对
-                        for pair in pairs:
-                            # 分割键和值
-                            if ':' in pair:
-                                kv = pair.split(':', 1)  # 只分割第一个冒号
-                                if len(kv) == 2:
-                                    # 移除键值两端的空格和引号
-                                    key = kv[0].strip().strip("'\"")
-                                    value = kv[1].strip().strip("'\"")
-                                    mapping[key] = value
-                        
-                        # 获取head中的变量名（括号内的内容）
-                        if '(' in head and ')' in head:
-                            head_prefix = head.split('(')[0]
-                            head_var = head[head.find('(')+1:head.find(')')]
-                            
-                            # 检查head_var是否在映射中
-                            if head_var in mapping:
-                                # 替换head中的变量为映射值
-                                replaced_head = f"{head_prefix}({mapping[head_var]})"
-                                return replaced_head
-                    except Exception as e:
-                        logging.warning(f"Failed to parse mapping line: {line}, error: {e}")
-                        continue
-                elif line.startswith(head.split('(')[0]):  # 匹配谓词名称
-                    return line
-            
-            return None
-        except Exception as e:
-            logging.error(f"Error parsing inference output: {e}")
-            return None
+    def _generate_inference_source(self, message_history: List[str]) -> str:
+        """生成推理输入的事实部分（消息历史），规则和ASK语句由推理进程逐条加入"""
+        return "\n".join(message_history)
 
     def _extract_action_from_head(self, head: str) -> str:
         """从规则头部提取行为名称"""
@@ -653,7 +556,7 @@ class MultiDecisionMaker(AbstractMultiDecisionMaker):
         return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     def _generate_detailed_inference_display_file(self, vehicle_id: str, message_history: List[str], rule: str,
-                                                 input_filepath: str, output_filepath: str, decision_result: str):
+                                                 inference_input: str, inference_output: str, decision_result: str):
         """生成详细的推理展示文件，包含输入、输出和决策结果，并在弹窗中展示"""
         try:
             # 创建推理展示目录
@@ -676,22 +579,14 @@ class MultiDecisionMaker(AbstractMultiDecisionMaker):
                 content += f"{i}. {msg}\n"
             content += "\n"
             
-            # 读取推理输入文件内容
-            content += f"=== 推理输入文件内容 ({os.path.basename(input_filepath)}) ===\n"
-            if os.path.exists(input_filepath):
-                with open(input_filepath, 'r', encoding='utf-8') as f:
-                    content += f.read()
-            else:
-                content += "输入文件不存在\n"
+            # 推理输入内容
+            content += f"=== 推理输入内容 ===\n"
+            content += inference_input
             content += "\n"
             
-            # 读取TSRL推理输出文件内容
-            content += f"=== TSRL推理输出内容 ({os.path.basename(output_filepath)}) ===\n"
-            if os.path.exists(output_filepath):
-                with open(output_filepath, 'r', encoding='utf-8') as f:
-                    content += f.read()
-            else:
-                content += "输出文件不存在\n"
+            # TSRL推理输出内容
+            content += f"=== TSRL推理输出内容 ===\n"
+            content += inference_output
             content += "\n"
             
             # 添加解析后的决策结果
@@ -732,6 +627,28 @@ class MultiDecisionMaker(AbstractMultiDecisionMaker):
         except Exception as e:
             logging.error(f"Error creating inference display window: {e}")
 
+    def _infer_fleet(self, jobs: list) -> Dict[str, Optional[tuple]]:
+        """
+        车队级向量化推理：把全部车辆的事实加载到列式事实存储中，一次连接求解各车辆的规则头部
+        返回车辆ID -> (头部序号, 置换, 决策)或None；无法向量化的车辆不在结果中，仍由推理进程池推理
+        """
+        store = ColumnarFactStore()
+        heads = {}
+        for vehicle, message_history, facts, queries, memory in jobs:
+            vehicle_id = str(vehicle.id)
+            if memory is not None:
+                store.add(vehicle_id, memory.clauses)
+            else:
+                store.add_source(vehicle_id, facts)
+            heads[vehicle_id] = [rule.head_text for rule in queries]
+        try:
+            results = self.fleet.infer(store, heads)
+        except Exception as e:
+            logging.error(f"Error running columnar TSRL inference: {e}")
+            return {}
+        logging.info(f"Columnar inference: {len(results)} vehicles vectorized, {len(jobs) - len(results)} left to the inference pool")
+        return results
+
     def make_decision(
         self,
         T: float,
@@ -746,9 +663,9 @@ class MultiDecisionMaker(AbstractMultiDecisionMaker):
         1. 读取消息历史文件
         2. 遍历规则文件中的每条规则
         3. 检查规则条件是否满足
-        4. 生成推理输入文件
-        5. 运行TSRL推理引擎
-        6. 解析输出并生成决策
+        4. 将每辆车满足条件的规则作为一个推理任务，同时提交给常驻推理进程池
+        5. 收集所有车辆的推理结果（在多车规划之前全部完成）
+        6. 将置换应用到规则头部，生成决策
         """
         complete_decisions = MultiDecision()
         # 获取所有需要决策的车辆,跳过AOI区域外的车和Ego车
@@ -758,8 +675,14 @@ class MultiDecisionMaker(AbstractMultiDecisionMaker):
         if not rules:
             logging.warning("No rules found, skipping TSRL decision making")
             return complete_decisions
+        # 常驻推理进程池，工作进程数量由INFERENCE_WORKERS配置
+        pool = get_shared_pool(config.get("INFERENCE_WORKERS", 0))
+        jobs = [] # 需要推理的车辆：(车辆, 消息历史, 事实, 候选规则, 工作记忆)
+        pending = []
+        self.decision_cache.resize(config.get("DECISION_CACHE_SIZE", 1024))
+        cache_keys = {} # 本次推理的车辆 -> 缓存键，推理完成后写入决策缓存
         
-        # 为每辆车做决策
+        # 为每辆车提交推理任务
         for vehicle in decision_vehicles:
             # 11.4 对stop_lane!=None的Vehicle进行主动停车
             if vehicle.stop_lane is not None and vehicle.lane_id in vehicle.stop_lane:
@@ -767,60 +690,116 @@ class MultiDecisionMaker(AbstractMultiDecisionMaker):
                 continue # 主动停车决策优先级大于TSRL决策
             # TSRL决策
             vehicle_id = str(vehicle.id)
-            # 读取该车辆的消息历史，默认读取最新的num_readmessages条消息
-            message_history = self._read_message_history(vehicle_id, max_messages=config["NUM_READMESSAGES"])
+            # 增量决策：上次决策后没有规则变为满足的车辆沿用上一次的决策，不读取消息历史也不推理
+            if self.communication_manager is not None:
+                trigger = self.communication_manager.get_rule_trigger(vehicle_id)
+                if not trigger.take() and vehicle_id in self._last_results:
+                    previous = self._last_results[vehicle_id]
+                    if previous:
+                        complete_decisions.results[vehicle] = [replace(decision, expected_time=T) for decision in previous]
+                    continue
+                self._last_results[vehicle_id] = []
+            memory = self.working_memories.get_working_memory(vehicle_id) if self.working_memories is not None else None
+            if memory is not None:
+                # 工作记忆中有效期内的事实代替最新的num_readmessages条消息
+                message_history = memory.facts()
+            else:
+                # 读取该车辆的消息历史，默认读取最新的num_readmessages条消息
+                message_history = self._read_message_history(vehicle_id, max_messages=config["NUM_READMESSAGES"])
             if not message_history:
                 logging.warning(f"No message history for vehicle {vehicle_id}")
                 continue
-            
-            # 遍历所有规则
-            for rule in rules:
-                if ":-" not in rule:
-                    continue
-                    
-                head, conditions = self._parse_rule(rule)
-                if not head or not conditions:
+            # 消息历史和规则库都没有变化时直接使用缓存的决策
+            cache_key = DecisionCache.key(vehicle_id, message_history, self.rule_base.version)
+            cached = self.decision_cache.get(cache_key, T)
+            if cached is not None:
+                if cached:
+                    complete_decisions.results[vehicle] = cached
+                if self.communication_manager is not None:
+                    self._last_results[vehicle_id] = cached
+                continue
+            cache_keys[vehicle] = cache_key
+            
+            # 通过判别索引得到条件满足的候选规则，按规则顺序推理
+            candidates = self._candidate_rules(message_history)
+            if len(candidates) < len(rules):
+                # 消息列表和推理规则没有对应，所以返回空决策
+                decision_at_t = SingleStepDecision()
+                decision_at_t.action = None
+                decision_at_t.expected_time = T 
+                complete_decisions.results[vehicle] = [decision_at_t]
+                if self.communication_manager is not None:
+                    self._last_results[vehicle_id] = [decision_at_t]
+            queries = []
+            for rule in candidates:
+                logging.debug(f"Rule conditions satisfied for vehicle {vehicle_id}: {rule}")
+                action_name = self._extract_action_from_head(rule.head_text)
+                if action_name_to_behaviour_mapper.get_behaviour(action_name) is None:
+                    logging.warning(f"Unknown behaviour for action {action_name}")
                     continue
-                
-                decision_result = None
-                # 检查规则条件是否满足
-                if self._check_conditions(conditions, message_history):
-                    logging.debug(f"Rule conditions satisfied for vehicle {vehicle_id}: {rule}")
-                    # 生成推理输入文件
-                    input_filepath = self._generate_inference_input(vehicle_id, message_history, rule, head)
-                    if not input_filepath:
-                        continue
-                    
-                    # 运行TSRL推理
-                    output_filepath = self._run_tsrl_inference(input_filepath, vehicle_id)  
-                    if not output_filepath:
-                        continue
-                    # 解析推理输出
-                    decision_result = self._parse_inference_output(output_filepath, head)
-                    # 如果规则条件满足，生成推理展示文件并弹窗展示
-                    if decision_result:
-                        # 生成详细的推理展示文件并弹窗展示
-                        self._generate_detailed_inference_display_file(vehicle_id, message_history, rule, input_filepath, output_filepath, decision_result)
-                    if decision_result:
-                        # 创建决策
-                        decision_at_t = SingleStepDecision()
-                        decision_at_t.action = decision_result
-                        decision_at_t.expected_time = T  
-                        # 根据规则头部确定行为类型
-                        action_name = self._extract_action_from_head(head)
-                        # 使用action_name_to_behaviour_mapper映射action_name到Behaviour
-                        decision_at_t.behaviour = action_name_to_behaviour_mapper.get_behaviour(action_name)
-                        if decision_at_t.behaviour is None:
-                            logging.warning(f"Unknown behaviour for action {action_name}")
-                            continue
-                        complete_decisions.results[vehicle] = [decision_at_t]
-                        logging.info(f"Decision made for vehicle {vehicle_id}: {decision_result}")
-                        break  # 找到一个适用规则就停止
-                else:
-                    # 消息列表和推理规则没有对应，所以返回空决策
-                    decision_at_t = SingleStepDecision()
-                    decision_at_t.action = decision_result
-                    decision_at_t.expected_time = T 
-                    complete_decisions.results[vehicle] = [decision_at_t]
-
+                queries.append(rule)
+            
+            if queries:
+                jobs.append((vehicle, message_history, self._generate_inference_source(message_history), queries, memory))
+
+        # 每个规则头部询问的资源上限（INFERENCE_BUDGET）
+        limits = inference_limits(config)
+        # 车队级向量化推理：全部车辆的规则头部一次求解（COLUMNAR_INFERENCE启用时）
+        columnar = config.get("COLUMNAR_INFERENCE", False)
+        fleet_results = self._infer_fleet(jobs) if columnar and jobs else {}
+        # 列式推理按规则体的书写顺序连接，其余车辆也按书写顺序求解，使第一个解与列式推理一致
+        join_planning = False if columnar else None
+        for vehicle, message_history, facts, queries, memory in jobs:
+            vehicle_id = str(vehicle.id)
+            heads = [rule.head_text for rule in queries]
+            if vehicle_id in fleet_results:
+                future = completed_future(fleet_results.get, vehicle_id)
+            elif memory is not None:
+                # 工作记忆中的事实已经解析、告知，直接在其会话中推理
+                future = completed_future(memory.infer, heads, limits, join_planning)
+            else:
+                # 单次推理：事实只加载一次，按优先级询问全部候选规则的头部
+                future = pool.submit(facts, self.rule_base.source, heads, limits, join_planning)
+            pending.append((vehicle, message_history, facts, queries, future))
+        
+        # 收集所有车辆的推理结果
+        for vehicle, message_history, facts, queries, future in pending:
+            vehicle_id = str(vehicle.id)
+            try:
+                result = future.result()
+            except Exception as e:
+                logging.error(f"Error running TSRL inference for vehicle {vehicle_id}: {e}")
+                cache_keys.pop(vehicle, None) # 推理失败的结果不缓存
+                continue
+            if is_unknown(result):
+                # 资源耗尽：该车辆不产生TSRL决策（采用默认行为），结果不缓存，下次决策时重新推理
+                self.budget_hits[result.reason] += 1
+                logging.warning(f"TSRL inference budget exhausted ({result.reason}) for vehicle {vehicle_id}, "
+                                f"using default behaviour; budget hits: {dict(self.budget_hits)}")
+                cache_keys.pop(vehicle, None)
+                if self.communication_manager is not None:
+                    self.communication_manager.get_rule_trigger(vehicle_id).dirty = True
+                continue
+            if result is None:
+                continue
+            index, bindings, decision_result = result
+            rule = queries[index].source
+            head = queries[index].head_text
+            # 生成详细的推理展示文件并弹窗展示
+            self._generate_detailed_inference_display_file(vehicle_id, message_history, rule, f"{facts}\n\n{rule}\n\nASK {head};\n",
+                                                           json.dumps(bindings, ensure_ascii=False), decision_result)
+            # 创建决策
+            decision_at_t = SingleStepDecision()
+            decision_at_t.action = decision_result
+            decision_at_t.expected_time = T  
+            # 使用action_name_to_behaviour_mapper映射action_name到Behaviour
+            decision_at_t.behaviour = action_name_to_behaviour_mapper.get_behaviour(self._extract_action_from_head(head))
+            complete_decisions.results[vehicle] = [decision_at_t]
+            if self.communication_manager is not None:
+                self._last_results[vehicle_id] = [decision_at_t]
+            logging.info(f"Decision made for vehicle {vehicle_id}: {decision_result}")
+
+        for vehicle, cache_key in cache_keys.items():
+            self.decision_cache.put(cache_key, complete_decisions.results.get(vehicle, []))
+        self.decision_cache.log_stats("Multi")
         return complete_decisions
\ No newline at end of file
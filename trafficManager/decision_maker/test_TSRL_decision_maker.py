@@ -0,0 +1,64 @@
+"""
+测试TSRL决策器的决策缓存（命中、LRU淘汰、统计信息输出）
+运行：python -m pytest -q trafficManager/decision_maker/test_TSRL_decision_maker.py
+"""
+import logging
+import os
+import sys
+
+# 添加项目根目录到Python路径（trafficManager包会把自身目录加入路径），导入顺序与traffic_manager.py相同
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from trafficManager.decision_maker.TSRL_decision_maker import DecisionCache
+from common.vehicle import Behaviour
+from decision_maker.abstract_decision_maker import SingleStepDecision
+
+HISTORY = ["HasNextJunction(0,7);", "EmergencyStation(7);"]
+
+
+def decide(cache: DecisionCache, vehicle_id: str, message_history, T: float):
+    """与决策器相同的缓存流程：先查缓存，未命中时“推理”并写入缓存，最后输出统计信息"""
+    key = DecisionCache.key(vehicle_id, message_history, 1)
+    decisions = cache.get(key, T)
+    if decisions is None:
+        decisions = [SingleStepDecision(behaviour=Behaviour.KL, expected_time=T, action="KeepLane")]
+        cache.put(key, decisions)
+    cache.log_stats("Ego")
+    return decisions
+
+
+def test_cached_decision_is_returned_with_the_new_expected_time():
+    cache = DecisionCache()
+    first = decide(cache, "0", HISTORY, 1.0)
+    second = decide(cache, "0", HISTORY, 2.0)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert second[0].behaviour == first[0].behaviour and second[0].expected_time == 2.0
+    assert first[0].expected_time == 1.0  # 缓存中的决策不被修改
+    decide(cache, "0", HISTORY + ["Congestion(7);"], 3.0)
+    assert cache.misses == 2
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = DecisionCache(max_size=2)
+    for vehicle_id in ("0", "1"):
+        decide(cache, vehicle_id, HISTORY, 0.0)
+    decide(cache, "0", HISTORY, 1.0)  # 车辆0最近使用过，淘汰车辆1
+    decide(cache, "2", HISTORY, 1.0)
+    assert cache.get(DecisionCache.key("1", HISTORY, 1), 2.0) is None
+    assert cache.get(DecisionCache.key("0", HISTORY, 1), 2.0) is not None
+    cache.resize(0)
+    assert cache.get(DecisionCache.key("0", HISTORY, 1), 2.0) is None
+
+
+def test_stats_are_logged_at_info_every_interval(caplog):
+    cache = DecisionCache()
+    cache.LOG_INTERVAL = 3
+    caplog.set_level(logging.DEBUG, logger="APP")
+    for T in range(3):
+        decide(cache, "0", HISTORY, float(T))
+    assert [record.levelno for record in caplog.records] == [logging.DEBUG, logging.DEBUG, logging.INFO]
+    assert "Ego decision cache: 2 hits, 1 misses (66.7% hit rate), 1/1024 entries" in caplog.records[-1].getMessage()
+    caplog.clear()
+    caplog.set_level(logging.INFO, logger="APP")
+    decide(cache, "0", HISTORY, 3.0)  # DEBUG级别未启用时不格式化也不输出
+    assert not caplog.records
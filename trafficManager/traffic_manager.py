@@ -94,7 +94,12 @@ class TrafficManager:
         # 8.18 承接使用模型的通信管理器控制参数,并控制是否开启通信功能
         self.if_traffic_communication = model.communication
         if self.if_traffic_communication:
-            self.communication_manager = CommunicationManager(self.sumo_model.Scenario_Name)
+            self.communication_manager = CommunicationManager(self.sumo_model.Scenario_Name,
+                                                              self.config.get("MESSAGE_BUFFER_SIZE", 256),
+                                                              self.config.get("COMMUNICATION_RADIUS"))
+            # 消息总线：发送的消息先排队，每个仿真步在感知之后统一投递
+            if self.config.get("MESSAGE_BUS", False):
+                self.communication_manager.enable_bus(self.config.get("MESSAGE_BUS_LATENCY", 0))
             # 初始化环境通信器，用于发送交叉口信息
             self.env_adapter = EnvironmentAdapter(self.sumo_model)
             self.env_communicator = EnvCommunicator(
@@ -109,6 +114,22 @@ class TrafficManager:
         self.ego_planner = ego_planner if ego_planner is not None else EgoPlanner()
         self.multi_decision = multi_decision if multi_decision is not None else MultiDecisionMaker(self.sumo_model.Scenario_Name)
         self.multi_veh_planner = multi_veh_planner if multi_veh_planner is not None else MultiVehiclePlanner()
+        # 事件驱动的增量决策：消息到达时增量检查规则，只有规则变为满足的车辆才重新推理
+        if (self.if_traffic_communication and self.config.get("INCREMENTAL_DECISION", False)
+                and hasattr(self.multi_decision, 'enable_incremental')):
+            self.multi_decision.enable_incremental(self.communication_manager, self.config["NUM_READMESSAGES"])
+        # 工作记忆：事实带仿真时间戳，按谓词有效期(FACT_TTL)批量淘汰，代替读取最新的NUM_READMESSAGES条消息
+        if (self.if_traffic_communication and self.config.get("FACT_TTL")
+                and hasattr(self.multi_decision, 'use_working_memory')):
+            self.communication_manager.enable_working_memory(self.multi_decision.rule_base, self.config["FACT_TTL"])
+            for decision_maker in (self.ego_decision, self.multi_decision):
+                if hasattr(decision_maker, 'use_working_memory'):
+                    decision_maker.use_working_memory(self.communication_manager)
+        # 决策器从通信管理器的内存消息历史读取最新的消息，不读取消息历史文件
+        if self.if_traffic_communication:
+            for decision_maker in (self.ego_decision, self.multi_decision):
+                if hasattr(decision_maker, 'use_message_history'):
+                    decision_maker.use_message_history(self.communication_manager)
         
         # 9.9 注册GUI输入回调
         if hasattr(self.sumo_model, 'gui') and self.sumo_model.gui:
@@ -179,6 +200,9 @@ class TrafficManager:
         # 1. 感知模块：感知周围环境
         # 提取当前场景中的车辆信息
         """
+        # 通信管理器推进到当前仿真时间：之后的消息以T为时间戳，工作记忆中的过期事实批量淘汰
+        if self.if_traffic_communication:
+            self.communication_manager.advance(T)
         # 提取车辆信息
         # 8.3 修改提取车辆信息方法，添加停车信息添加方法
         # 8.19 新增提取车辆信息方法，添加通信信息提取方法，并将vehicle类更改为control_Vehicle
@@ -186,12 +210,20 @@ class TrafficManager:
                                          through_timestep, self.sumo_model.sim_mode)
         # 9.12 提取道路设备信息
         facilities = self.extract_facilities(facilities, roadgraph)
+        # 限定通信半径时更新车辆和RSU在geohash网格中的位置，广播只投递给半径内的交通主体
+        if self.if_traffic_communication and self.communication_manager.comm_radius is not None:
+            self.communication_manager.update_positions(
+                {agent.id: (agent.current_state.x, agent.current_state.y)
+                 for agent in list(vehicles.values()) + list(facilities.values())})
         # 9.16 处理RSU与Ego车辆的交互
         self._handle_rsu_ego_interaction(vehicles, facilities, roadgraph, current_time_step)
         # 发送交叉口信息（只在开始时发送一次）
         if self.if_traffic_communication and hasattr(self, 'env_communicator') and not self.junction_info_sent:
             self._send_junction_info()
             self.junction_info_sent = True
+        # 启用消息总线时在此统一投递本仿真步到期的消息，之后的决策读取到的是投递后的消息历史
+        if self.if_traffic_communication and self.communication_manager.bus_enabled:
+            self.communication_manager.deliver()
         # 提取历史轨迹信息
         history_tracks = self.extract_history_tracks(current_time_step,
                                                      vehicles)